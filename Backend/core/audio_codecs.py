@@ -0,0 +1,265 @@
+import struct
+
+import numpy as np
+
+from audio_utils import StreamResampler, float32_to_pcm16, pcm16_to_float32
+
+try:
+    import opuslib
+except Exception:
+    # Not installed, or installed without the native libopus it wraps
+    opuslib = None
+
+CODEC_PCM = "pcm_s16le"
+CODEC_IMA_ADPCM = "ima_adpcm"
+CODEC_OPUS = "opus"
+
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+# Opus also allows 2.5 ms frames, but TTS_STREAM_FRAME_MS is a whole number of milliseconds
+OPUS_FRAME_MS = (5, 10, 20, 40, 60)
+# Opus packets in one message are each prefixed with their uint16 little-endian length
+OPUS_PACKET_LENGTH = struct.Struct("<H")
+
+# IMA-ADPCM block: predictor (int16), step index (uint8), flags (uint8), then 4-bit codes, low nibble first
+ADPCM_BLOCK_HEADER = struct.Struct("<hBB")
+ADPCM_FLAG_PADDED = 0x01  # the last nibble is padding, not a sample
+ADPCM_INDEX_TABLE = (-1, -1, -1, -1, 2, 4, 6, 8)
+ADPCM_STEP_TABLE = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+    12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767,
+)
+
+
+def available_codecs():
+    """Codecs this server can encode, most compact first."""
+    codecs = [CODEC_IMA_ADPCM, CODEC_PCM]
+    if opuslib is not None:
+        codecs.insert(0, CODEC_OPUS)
+    return codecs
+
+
+def choose_codec(requested_codecs):
+    """The first codec in the client's preference list that the server supports; PCM otherwise."""
+    supported = available_codecs()
+    for codec in requested_codecs or []:
+        if codec in supported:
+            return codec
+    return CODEC_PCM
+
+
+def validate_opus_frame_ms(frame_ms):
+    """Raise ValueError unless `frame_ms` is a frame duration Opus can encode."""
+    if frame_ms not in OPUS_FRAME_MS:
+        raise ValueError(f"Opus frames must be one of {OPUS_FRAME_MS} ms, not {frame_ms} (TTS_STREAM_FRAME_MS)")
+
+
+def _adpcm_encode_samples(samples, predictor, index):
+    codes = []
+    for sample in samples:
+        step = ADPCM_STEP_TABLE[index]
+        diff = sample - predictor
+        code = 0
+        if diff < 0:
+            code = 8
+            diff = -diff
+        delta = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            delta += step
+        predictor = predictor - delta if code & 8 else predictor + delta
+        predictor = -32768 if predictor < -32768 else 32767 if predictor > 32767 else predictor
+        index = min(88, max(0, index + ADPCM_INDEX_TABLE[code & 7]))
+        codes.append(code)
+    return codes, predictor, index
+
+
+def _adpcm_decode_codes(codes, predictor, index):
+    samples = []
+    for code in codes:
+        step = ADPCM_STEP_TABLE[index]
+        delta = step >> 3
+        if code & 4:
+            delta += step
+        if code & 2:
+            delta += step >> 1
+        if code & 1:
+            delta += step >> 2
+        predictor = predictor - delta if code & 8 else predictor + delta
+        predictor = -32768 if predictor < -32768 else 32767 if predictor > 32767 else predictor
+        index = min(88, max(0, index + ADPCM_INDEX_TABLE[code & 7]))
+        samples.append(predictor)
+    return samples
+
+
+def ima_adpcm_decode(block):
+    """Decode one IMA-ADPCM block (see ADPCM_BLOCK_HEADER) to int16 PCM bytes."""
+    if len(block) < ADPCM_BLOCK_HEADER.size:
+        return b""
+    predictor, index, flags = ADPCM_BLOCK_HEADER.unpack_from(block)
+    packed = np.frombuffer(bytes(block[ADPCM_BLOCK_HEADER.size:]), dtype=np.uint8)
+    codes = np.empty(len(packed) * 2, dtype=np.uint8)
+    codes[0::2] = packed & 0x0F
+    codes[1::2] = packed >> 4
+    if flags & ADPCM_FLAG_PADDED and len(codes):
+        codes = codes[:-1]
+    samples = _adpcm_decode_codes(codes.tolist(), predictor, min(88, index))
+    return np.asarray(samples, dtype="<i2").tobytes()
+
+
+class PCMEncoder:
+    codec = CODEC_PCM
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def describe(self):
+        return {"audio_format": CODEC_PCM, "sample_rate": self.sample_rate}
+
+    def encode(self, pcm):
+        return [pcm] if pcm else []
+
+    def flush(self):
+        return []
+
+
+class IMAADPCMEncoder:
+    """
+    4:1 IMA-ADPCM. Each message is one self-contained block whose header carries the
+    encoder state, so a client can decode any message without the ones before it.
+    """
+
+    codec = CODEC_IMA_ADPCM
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.predictor = 0
+        self.index = 0
+
+    def describe(self):
+        return {
+            "audio_format": CODEC_IMA_ADPCM,
+            "sample_rate": self.sample_rate,
+            "adpcm_block_header": "<hBB",
+        }
+
+    def encode(self, pcm):
+        samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype="<i2")
+        if not len(samples):
+            return []
+        header = ADPCM_BLOCK_HEADER.pack(self.predictor, self.index, ADPCM_FLAG_PADDED if len(samples) % 2 else 0)
+        codes, self.predictor, self.index = _adpcm_encode_samples(samples.tolist(), self.predictor, self.index)
+        if len(codes) % 2:
+            codes.append(0)
+        codes = np.asarray(codes, dtype=np.uint8)
+        return [header + (codes[0::2] | (codes[1::2] << 4)).astype(np.uint8).tobytes()]
+
+    def flush(self):
+        return []
+
+
+class OpusEncoder:
+    """
+    Opus through the optional `opuslib` package. TTS rates Opus cannot take (32 kHz from
+    most GPT-SoVITS models) are resampled to 48 kHz. Every `frame_ms` of audio becomes
+    one packet; the packets of a message are length-prefixed (OPUS_PACKET_LENGTH).
+    """
+
+    codec = CODEC_OPUS
+
+    def __init__(self, sample_rate, frame_ms=40, bitrate=32000):
+        validate_opus_frame_ms(frame_ms)
+        self.source_rate = sample_rate
+        self.sample_rate = sample_rate if sample_rate in OPUS_SAMPLE_RATES else 48000
+        self.frame_ms = frame_ms
+        self.frame_samples = int(self.sample_rate * frame_ms // 1000)
+        self.resampler = StreamResampler(sample_rate, self.sample_rate)
+        self.encoder = opuslib.Encoder(self.sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.pending = np.zeros(0, dtype=np.float32)
+
+    def describe(self):
+        return {
+            "audio_format": CODEC_OPUS,
+            "sample_rate": self.sample_rate,
+            "opus_frame_ms": self.frame_ms,
+            "opus_packet_length": "<H",
+        }
+
+    def _packets(self, frame_count):
+        packets = []
+        for _ in range(frame_count):
+            frame = self.pending[:self.frame_samples]
+            self.pending = self.pending[self.frame_samples:]
+            packet = self.encoder.encode(float32_to_pcm16(frame), self.frame_samples)
+            packets.append(OPUS_PACKET_LENGTH.pack(len(packet)) + packet)
+        return [b"".join(packets)] if packets else []
+
+    def encode(self, pcm):
+        self.pending = np.concatenate((self.pending, self.resampler.process(pcm16_to_float32(pcm))))
+        return self._packets(len(self.pending) // self.frame_samples)
+
+    def flush(self):
+        if not len(self.pending):
+            return []
+        # Opus only takes whole frames; the tail is padded with silence
+        padding = self.frame_samples - len(self.pending) % self.frame_samples
+        if padding < self.frame_samples:
+            self.pending = np.concatenate((self.pending, np.zeros(padding, dtype=np.float32)))
+        return self._packets(len(self.pending) // self.frame_samples)
+
+
+def make_encoder(codec, sample_rate, frame_ms=40, opus_bitrate=32000):
+    if codec == CODEC_OPUS and opuslib is not None:
+        return OpusEncoder(sample_rate, frame_ms=frame_ms, bitrate=opus_bitrate)
+    if codec == CODEC_IMA_ADPCM:
+        return IMAADPCMEncoder(sample_rate)
+    return PCMEncoder(sample_rate)
+
+
+class UploadDecoder:
+    """
+    Turns microphone uploads in the negotiated codec back into int16 PCM.
+
+    Opus uploads are decoded straight to 16 kHz (what Whisper wants); `output_rate()`
+    returns the rate of the decoded PCM for a given declared upload rate.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.opus_decoder = opuslib.Decoder(16000, 1) if codec == CODEC_OPUS and opuslib is not None else None
+
+    def output_rate(self, declared_rate):
+        return 16000 if self.codec == CODEC_OPUS else declared_rate
+
+    def decode(self, payload):
+        if self.codec == CODEC_IMA_ADPCM:
+            return ima_adpcm_decode(payload)
+        if self.codec == CODEC_OPUS:
+            if self.opus_decoder is None:
+                return b""
+            payload = bytes(payload)
+            pcm_parts = []
+            offset = 0
+            while offset + OPUS_PACKET_LENGTH.size <= len(payload):
+                (packet_length,) = OPUS_PACKET_LENGTH.unpack_from(payload, offset)
+                offset += OPUS_PACKET_LENGTH.size
+                packet = payload[offset:offset + packet_length]
+                offset += packet_length
+                # 120 ms is the longest frame an Opus packet can hold
+                pcm_parts.append(self.opus_decoder.decode(packet, 16000 * 120 // 1000))
+            return b"".join(pcm_parts)
+        return bytes(payload)
@@ -0,0 +1,78 @@
+import struct
+
+# Binary WebSocket frame: fixed 8-byte little-endian header followed by the raw payload.
+#   frame_type (uint8) | flags (uint8) | turn_id (uint16) | seq (uint32) | payload...
+FRAME_HEADER = struct.Struct("<BBHI")
+FRAME_HEADER_FORMAT = "<BBHI"
+
+# Client -> server
+FRAME_AUDIO_UPLOAD = 0x01  # one complete utterance, pcm_s16le mono at the Unity mic rate
+FRAME_AUDIO_CHUNK = 0x02  # part of an utterance that is still being recorded
+FRAME_AUDIO_END = 0x03  # end of the chunked utterance (empty payload)
+
+# Server -> client
+FRAME_TTS_CHUNK = 0x10  # streamed TTS audio in the format announced by tts_stream_start
+FRAME_TTS_AUDIO = 0x11  # complete WAV reply of the non-streaming path
+
+FLAG_STREAM_TTS = 0x01
+
+FRAME_TYPE_NAMES = {
+    FRAME_AUDIO_UPLOAD: "audio_upload",
+    FRAME_AUDIO_CHUNK: "audio_chunk",
+    FRAME_AUDIO_END: "audio_end",
+    FRAME_TTS_CHUNK: "tts_chunk",
+    FRAME_TTS_AUDIO: "tts_audio",
+}
+
+
+def pack_frame(frame_type, payload, seq=0, turn_id=0, flags=0):
+    return FRAME_HEADER.pack(frame_type, flags, turn_id & 0xFFFF, seq & 0xFFFFFFFF) + bytes(payload)
+
+
+def unpack_frame(message):
+    """Split a binary frame into (frame_type, flags, turn_id, seq, payload)."""
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError(f"Binary frame too short ({len(message)} bytes)")
+    frame_type, flags, turn_id, seq = FRAME_HEADER.unpack_from(message)
+    return frame_type, flags, turn_id, seq, memoryview(message)[FRAME_HEADER.size:]
+
+
+def describe_protocol():
+    """Protocol details sent to clients that negotiate binary audio."""
+    return {
+        "frame_header": FRAME_HEADER_FORMAT,
+        "frame_header_size": FRAME_HEADER.size,
+        "frame_types": {name: frame_type for frame_type, name in FRAME_TYPE_NAMES.items()},
+        "flags": {"stream_tts": FLAG_STREAM_TTS},
+    }
+
+
+class PCMFramer:
+    """
+    Re-frames a PCM byte stream into whole frames of `frame_ms` milliseconds.
+
+    Input chunks of any size go in; what comes out is always a multiple of the frame size
+    (so a sample is never split across messages), with up to `max_frames_per_message`
+    frames coalesced into one payload. `flush()` returns the tail, trimmed to whole samples.
+    """
+
+    def __init__(self, sample_rate, frame_ms=40, sample_width=2, channels=1, max_frames_per_message=5):
+        self.sample_bytes = sample_width * channels
+        self.frame_bytes = max(1, int(sample_rate * frame_ms / 1000)) * self.sample_bytes
+        self.max_payload_bytes = self.frame_bytes * max(1, int(max_frames_per_message))
+        self.buffer = bytearray()
+
+    def push(self, data):
+        self.buffer += data
+        payloads = []
+        while len(self.buffer) >= self.frame_bytes:
+            payload_bytes = min(self.max_payload_bytes, len(self.buffer) - len(self.buffer) % self.frame_bytes)
+            payloads.append(bytes(self.buffer[:payload_bytes]))
+            del self.buffer[:payload_bytes]
+        return payloads
+
+    def flush(self):
+        tail_bytes = len(self.buffer) - len(self.buffer) % self.sample_bytes
+        tail = bytes(self.buffer[:tail_bytes])
+        self.buffer.clear()
+        return [tail] if tail else []
@@ -0,0 +1,105 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+MAX_INT16 = 32768.0
+WHISPER_SAMPLE_RATE = 16000
+
+
+def pcm16_to_float32(pcm_bytes):
+    """Convert little-endian int16 PCM bytes to float32 samples in [-1, 1)."""
+    usable_length = len(pcm_bytes) - (len(pcm_bytes) % 2)
+    samples = np.frombuffer(pcm_bytes[:usable_length], dtype="<i2")
+    return samples.astype(np.float32) / MAX_INT16
+
+
+def float32_to_pcm16(samples):
+    clipped = np.clip(samples, -1.0, 32767.0 / MAX_INT16)
+    return (clipped * MAX_INT16).astype("<i2").tobytes()
+
+
+@lru_cache(maxsize=16)
+def _lowpass_kernel(cutoff, num_taps):
+    # Hann-windowed sinc; cutoff is a fraction of the source Nyquist frequency
+    positions = np.arange(num_taps) - (num_taps - 1) / 2.0
+    kernel = cutoff * np.sinc(cutoff * positions) * np.hanning(num_taps)
+    kernel = (kernel / np.sum(kernel)).astype(np.float32)
+    kernel.setflags(write=False)
+    return kernel
+
+
+def resample(samples, source_rate, target_rate, num_taps=63):
+    """
+    Resample float32 mono audio with a vectorized anti-aliasing FIR + linear interpolation.
+
+    Good enough for speech recognition and for moving TTS audio between codec rates;
+    it avoids pulling in scipy/librosa for a single polyphase step.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+
+    if target_rate < source_rate:
+        kernel = _lowpass_kernel(0.9 * target_rate / source_rate, num_taps)
+        samples = np.convolve(samples, kernel, mode="same").astype(np.float32)
+
+    divisor = gcd(int(source_rate), int(target_rate))
+    output_length = (len(samples) * (target_rate // divisor)) // (source_rate // divisor)
+    positions = np.arange(output_length, dtype=np.float64) * (source_rate / float(target_rate))
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def pcm16_to_whisper_input(pcm_bytes, sample_rate):
+    """Raw int16 PCM at any rate -> float32 16 kHz array accepted by WhisperModel.transcribe."""
+    return resample(pcm16_to_float32(pcm_bytes), sample_rate, WHISPER_SAMPLE_RATE)
+
+
+def speech_end_seconds(samples, sample_rate, threshold, frame_seconds=0.03):
+    """
+    End of the last frame whose RMS reaches `threshold`, in seconds; 0.0 if nothing is
+    voiced. A simple energy VAD, used to ignore the trailing silence of an upload.
+    """
+    frame_size = max(1, int(sample_rate * frame_seconds))
+    frame_count = len(samples) // frame_size
+    if frame_count == 0:
+        return 0.0
+    frames = np.asarray(samples[: frame_count * frame_size], dtype=np.float32).reshape(frame_count, frame_size)
+    voiced = np.nonzero(np.sqrt(np.mean(np.square(frames), axis=1)) >= threshold)[0]
+    if len(voiced) == 0:
+        return 0.0
+    return (int(voiced[-1]) + 1) * frame_size / float(sample_rate)
+
+
+class StreamResampler:
+    """
+    Linear-interpolation resampler for audio that arrives in pieces.
+
+    The last input sample and the fractional read position are carried between calls,
+    so consecutive pieces join without clicks. Meant for upsampling (e.g. 32 kHz TTS
+    output to 48 kHz for Opus); downsampling should go through `resample` instead.
+    """
+
+    def __init__(self, source_rate, target_rate):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.step = source_rate / float(target_rate)
+        self.position = 0.0
+        self.previous = None
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.source_rate == self.target_rate or len(samples) == 0:
+            return samples
+        if self.previous is not None:
+            samples = np.concatenate(([self.previous], samples))
+
+        last_index = len(samples) - 1
+        output_length = int(np.floor((last_index - self.position) / self.step)) + 1 if last_index >= self.position else 0
+        positions = self.position + self.step * np.arange(output_length, dtype=np.float64)
+        output = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+        # The next call's input starts with this call's last sample
+        self.position = self.position + self.step * output_length - last_index
+        self.previous = samples[-1]
+        return output
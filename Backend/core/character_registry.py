@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class CharacterPrompt:
+    """A loaded character card and the system prompt rendered from it (never mutated after creation)."""
+
+    __slots__ = ("card_path", "card", "name", "system_prompt", "fingerprint")
+
+    def __init__(self, card_path, card, name, system_prompt, fingerprint):
+        self.card_path = card_path
+        self.card = card
+        self.name = name
+        self.system_prompt = system_prompt
+        self.fingerprint = fingerprint
+
+
+class CharacterRegistry:
+    """
+    Character cards loaded once and pre-rendered into an immutable system prompt.
+
+    Every request for the same character starts with the byte-identical system message,
+    which is what provider-side prompt prefix caching keys on. A card is re-read and
+    re-rendered only when its file's mtime/size changes, checked at most once per
+    `poll_interval` seconds (`None` disables reloading).
+    """
+
+    def __init__(self, card_dir, renderer, poll_interval=1.0):
+        self.card_dir = Path(card_dir)
+        self.renderer = renderer
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._last_checks = {}
+
+    def _resolve_path(self, card_file):
+        card_path = Path(card_file)
+        if not card_path.is_absolute():
+            card_path = self.card_dir / card_path
+        return card_path.resolve()
+
+    def _fingerprint(self, card_path):
+        stat_result = os.stat(card_path)
+        return stat_result.st_mtime_ns, stat_result.st_size
+
+    def _load(self, card_path, fingerprint):
+        with open(card_path, "r", encoding="utf-8") as f:
+            card = json.load(f)
+        name = card.get("姓名") or card.get("name") or card_path.stem
+        return CharacterPrompt(card_path, card, name, self.renderer(card), fingerprint)
+
+    def get(self, card_file):
+        card_path = self._resolve_path(card_file)
+        with self._lock:
+            prompt = self._prompts.get(card_path)
+            now = time.monotonic()
+            if prompt is not None:
+                if self.poll_interval is None or now - self._last_checks.get(card_path, 0.0) < self.poll_interval:
+                    return prompt
+            self._last_checks[card_path] = now
+
+            try:
+                fingerprint = self._fingerprint(card_path)
+            except OSError:
+                if prompt is not None:
+                    # Keep serving the last good card while the file is being replaced
+                    return prompt
+                raise
+            if prompt is not None and prompt.fingerprint == fingerprint:
+                return prompt
+
+            try:
+                new_prompt = self._load(card_path, fingerprint)
+            except (OSError, ValueError) as e:
+                if prompt is None:
+                    raise
+                print(f"Keeping the previous character card; could not reload {card_path.name}: {e}")
+                return prompt
+
+            self._prompts[card_path] = new_prompt
+            if prompt is not None:
+                print(f"Character card reloaded: {card_path.name}")
+            return new_prompt
@@ -2,15 +2,18 @@ import os
 import wave
 from pathlib import Path
 
+from reference_catalog import open_catalog
+
 CORE_DIR = Path(__file__).resolve().parent
 BACKEND_DIR = CORE_DIR.parent
 PROJECT_ROOT = BACKEND_DIR.parent
 GPT_SOVITS_DIR = Path(os.getenv("GPT_SOVITS_DIR", BACKEND_DIR / "GPT-sovits")).resolve()
 
 def _load_dotenv(dotenv_path):
+    applied = {}
     path = Path(dotenv_path)
     if not path.exists():
-        return
+        return applied
 
     for raw_line in path.read_text(encoding="utf-8").splitlines():
         line = raw_line.strip()
@@ -24,17 +27,42 @@ def _load_dotenv(dotenv_path):
         if value and len(value) >= 2 and value[0] == value[-1] and value[0] in {"'", '"'}:
             value = value[1:-1]
 
-        os.environ.setdefault(key, value)
+        if key not in os.environ:
+            os.environ[key] = value
+            applied[key] = value
+
+    return applied
 
 
-_load_dotenv(PROJECT_ROOT / ".env")
+# Keys this module took from .env (not from the real environment); lets a hot reload re-read them
+DOTENV_APPLIED = _load_dotenv(PROJECT_ROOT / ".env")
 
 OPENAI_COMPAT_API_KEY = os.getenv("OPENAI_COMPAT_API_KEY", "")
 OPENAI_COMPAT_BASE_URL = os.getenv("OPENAI_COMPAT_BASE_URL", "http://127.0.0.1:7861/")
 OPENAI_COMPAT_MODEL = os.getenv("OPENAI_COMPAT_MODEL", "gemini-3-flash-preview")
 # OPENAI_COMPAT_MODEL = os.getenv("OPENAI_COMPAT_MODEL", "gemini-3.1-pro-preview")
+# Stream the LLM reply and start TTS per sentence (only used for stream_tts turns)
+LLM_STREAM_RESPONSES = os.getenv("LLM_STREAM_RESPONSES", "true").lower() == "true"
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "90"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_CHARACTER_CARD = os.getenv("LLM_CHARACTER_CARD", "cyrene_character_card.json")
+LLM_CHARACTER_POLL_SECONDS = float(os.getenv("LLM_CHARACTER_POLL_SECONDS", "1.0"))
+# Endpoint features (JSON mode, streaming, context size) are probed once per base URL/model and remembered here
+LLM_CAPABILITY_PROBE = os.getenv("LLM_CAPABILITY_PROBE", "true").lower() == "true"
+# A request rejected with 400/422 re-probes an unprobed endpoint at most once per this many seconds
+LLM_CAPABILITY_PROBE_RETRY_SECONDS = float(os.getenv("LLM_CAPABILITY_PROBE_RETRY_SECONDS", "300"))
+LLM_CAPABILITY_CACHE_PATH = os.getenv("LLM_CAPABILITY_CACHE_PATH", str(CORE_DIR / "temp" / "llm_capabilities.json"))
+# Per-connection memory: recent turns verbatim plus a rolling summary, within this many (estimated) tokens; 0 disables
+LLM_HISTORY_TOKEN_BUDGET = int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "1500"))
+LLM_SUMMARY_TOKEN_BUDGET = int(os.getenv("LLM_SUMMARY_TOKEN_BUDGET", "300"))
 
 TTS_API_URL = os.getenv("TTS_API_URL", "http://127.0.0.1:9880")
+# Several GPT-SoVITS servers (comma separated); requests are routed to one that already holds the needed weights
+TTS_API_URLS = [url.strip() for url in os.getenv("TTS_API_URLS", "").split(",") if url.strip()]
 TTS_ACTIVE_VOICE = os.getenv("TTS_ACTIVE_VOICE", "cyrene_intro")
 TTS_SAMPLE_STEPS = int(os.getenv("TTS_SAMPLE_STEPS", "16"))
 TTS_PARALLEL_INFER = os.getenv("TTS_PARALLEL_INFER", "true").lower() == "true"
@@ -44,6 +72,65 @@ DEFAULT_TTS_TEXT_LANG = os.getenv("TTS_TEXT_LANG", "zh")
 DEFAULT_TTS_PROMPT_LANG = os.getenv("TTS_PROMPT_LANG", "zh")
 MIN_REF_AUDIO_SECONDS = float(os.getenv("TTS_MIN_REF_AUDIO_SECONDS", "3"))
 MAX_REF_AUDIO_SECONDS = float(os.getenv("TTS_MAX_REF_AUDIO_SECONDS", "10"))
+# How often TTS checks config.py/.env/weight and reference folders for changes (hot reload)
+TTS_CONFIG_POLL_SECONDS = float(os.getenv("TTS_CONFIG_POLL_SECONDS", "1.0"))
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_MEMORY_MB = float(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DISK_MB = float(os.getenv("TTS_CACHE_DISK_MB", "512"))
+# Recent TTS outputs kept under temp/tts_archive/ (WAV + JSON metadata), written off the request path
+TTS_ARCHIVE_ENABLED = os.getenv("TTS_ARCHIVE_ENABLED", "true").lower() == "true"
+TTS_ARCHIVE_MAX_FILES = int(os.getenv("TTS_ARCHIVE_MAX_FILES", "50"))
+TTS_ARCHIVE_MAX_MB = float(os.getenv("TTS_ARCHIVE_MAX_MB", "100"))
+# Model version and sample rate per SoVITS weight file (path + size + mtime), so turns never open the weights
+TTS_WEIGHTS_INDEX_PATH = os.getenv("TTS_WEIGHTS_INDEX_PATH", str(CORE_DIR / "temp" / "weights_metadata.json"))
+# Check the predicted rate against the WAV header of the first stream per weight file
+TTS_CONFIRM_SAMPLE_RATE = os.getenv("TTS_CONFIRM_SAMPLE_RATE", "true").lower() == "true"
+# Duration, transcript and audit score of every reference clip, so presets resolve without opening WAVs
+TTS_REF_CATALOG_ENABLED = os.getenv("TTS_REF_CATALOG_ENABLED", "true").lower() == "true"
+TTS_REF_CATALOG_PATH = os.getenv("TTS_REF_CATALOG_PATH", str(CORE_DIR / "temp" / "reference_audio.sqlite3"))
+# Fallback replies and the filler lines below are pre-rendered at startup for these voices ("all", "active", or a comma list)
+TTS_WARMUP_ENABLED = os.getenv("TTS_WARMUP_ENABLED", "true").lower() == "true"
+TTS_WARMUP_VOICES = os.getenv("TTS_WARMUP_VOICES", "all")
+# Short lines spoken while the LLM has not produced its first sentence yet ("|" separated)
+TTS_FILLER_LINES = [
+    line.strip()
+    for line in os.getenv("TTS_FILLER_LINES", "嗯……|讓我想想……|唔，等我一下喔……").split("|")
+    if line.strip()
+]
+TTS_FILLER_DELAY_SECONDS = float(os.getenv("TTS_FILLER_DELAY_SECONDS", "1.5"))
+# Sentences of one reply synthesized at the same time (each holds an ELYSIA_TTS_WORKERS thread); 1 = one after another
+TTS_PARALLEL_SEGMENTS = int(os.getenv("TTS_PARALLEL_SEGMENTS", "2"))
+# Replies start with a short clause sized from each voice's measured speed to reach first audio within the target
+TTS_ADAPTIVE_CHUNKING = os.getenv("TTS_ADAPTIVE_CHUNKING", "true").lower() == "true"
+TTS_FIRST_AUDIO_TARGET_SECONDS = float(os.getenv("TTS_FIRST_AUDIO_TARGET_SECONDS", "0.8"))
+TTS_FIRST_SEGMENT_MIN_CHARS = int(os.getenv("TTS_FIRST_SEGMENT_MIN_CHARS", "4"))
+TTS_SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "120"))
+# Streamed PCM goes out in whole frames of this many ms, up to N frames per websocket message
+TTS_STREAM_FRAME_MS = int(os.getenv("TTS_STREAM_FRAME_MS", "40"))
+TTS_STREAM_MAX_FRAMES_PER_MESSAGE = int(os.getenv("TTS_STREAM_MAX_FRAMES_PER_MESSAGE", "5"))
+# Sending pauses while the client is this far ahead of real time or the socket buffer is this full
+TTS_STREAM_MAX_LEAD_SECONDS = float(os.getenv("TTS_STREAM_MAX_LEAD_SECONDS", "1.5"))
+TTS_STREAM_WRITE_BUFFER_KB = float(os.getenv("TTS_STREAM_WRITE_BUFFER_KB", "64"))
+# Used when a client negotiates "opus" (needs the optional opuslib package and libopus)
+TTS_OPUS_BITRATE = int(os.getenv("TTS_OPUS_BITRATE", "32000"))
+
+ELYSIA_SERVER_HOST = os.getenv("ELYSIA_SERVER_HOST", "0.0.0.0")
+ELYSIA_SERVER_PORT = int(os.getenv("ELYSIA_SERVER_PORT", "8765"))
+ELYSIA_ASR_WORKERS = int(os.getenv("ELYSIA_ASR_WORKERS", "1"))
+ELYSIA_TTS_WORKERS = int(os.getenv("ELYSIA_TTS_WORKERS", "2"))
+# Threads that encode ADPCM/Opus streams and decode compressed uploads off the event loop
+ELYSIA_CODEC_WORKERS = int(os.getenv("ELYSIA_CODEC_WORKERS", "2"))
+ELYSIA_CONNECTION_QUEUE_SIZE = int(os.getenv("ELYSIA_CONNECTION_QUEUE_SIZE", "4"))
+# New speech (audio_data, text_input, audio_chunk) cancels the reply still being generated; {"event": "interrupt"} always does
+ELYSIA_BARGE_IN = os.getenv("ELYSIA_BARGE_IN", "true").lower() == "true"
+# Prometheus text at http://<host>:<port>/metrics and p50/p95/p99 at /metrics.json (port 0 disables)
+ELYSIA_METRICS_HOST = os.getenv("ELYSIA_METRICS_HOST", "127.0.0.1")
+ELYSIA_METRICS_PORT = int(os.getenv("ELYSIA_METRICS_PORT", "9108"))
+# One JSON line of stage timings per turn is appended here when set
+ELYSIA_TRACE_FILE = os.getenv("ELYSIA_TRACE_FILE", "")
+# Start the LLM on a transcript that is probably final (last segment decoded / end of speech); re-issued if it changes
+ELYSIA_SPECULATIVE_LLM = os.getenv("ELYSIA_SPECULATIVE_LLM", "false").lower() == "true"
+ELYSIA_SPECULATIVE_TAIL_SECONDS = float(os.getenv("ELYSIA_SPECULATIVE_TAIL_SECONDS", "1.0"))
 
 
 def resolve_project_path(path_value, base_dir=BACKEND_DIR):
@@ -72,13 +159,39 @@ def _get_wav_duration_seconds(file_path):
         return None
 
 
+def get_reference_catalog():
+    return open_catalog(TTS_REF_CATALOG_PATH) if TTS_REF_CATALOG_ENABLED else None
+
+
+def get_reference_audio_duration(file_path):
+    catalog = get_reference_catalog()
+    if catalog is None:
+        return _get_wav_duration_seconds(file_path)
+    clip = catalog.get_clip(file_path)
+    return clip["duration_seconds"] if clip else None
+
+
 def is_reference_audio_duration_valid(file_path, min_seconds=MIN_REF_AUDIO_SECONDS, max_seconds=MAX_REF_AUDIO_SECONDS):
-    duration = _get_wav_duration_seconds(file_path)
+    duration = get_reference_audio_duration(file_path)
     if duration is None:
         return False
     return min_seconds <= duration <= max_seconds
 
 
+def _find_reference_audio(pattern):
+    catalog = get_reference_catalog()
+    pattern_path = BACKEND_DIR / pattern
+    if catalog is not None and not any(character in str(pattern_path.parent) for character in "*?["):
+        clip = catalog.find_clip(str(pattern_path), MIN_REF_AUDIO_SECONDS, MAX_REF_AUDIO_SECONDS)
+        return clip["path"] if clip else None
+
+    for match in sorted(BACKEND_DIR.glob(pattern)):
+        resolved_match = str(match.resolve())
+        if is_reference_audio_duration_valid(resolved_match):
+            return resolved_match
+    return None
+
+
 def resolve_reference_audio_path(voice_config):
     preferred_paths = []
 
@@ -94,10 +207,9 @@ def resolve_reference_audio_path(voice_config):
             return resolved_candidate
 
     for pattern in voice_config.get("ref_audio_glob", []):
-        for match in sorted(BACKEND_DIR.glob(pattern)):
-            resolved_match = str(match.resolve())
-            if is_reference_audio_duration_valid(resolved_match):
-                return resolved_match
+        match = _find_reference_audio(pattern)
+        if match:
+            return match
 
     for candidate in preferred_paths:
         resolved_candidate = resolve_project_path(candidate)
@@ -119,11 +231,15 @@ def infer_prompt_text_from_reference_audio(ref_audio_path, fallback_text=""):
         return fallback_text
 
     audio_path = Path(ref_audio_path)
-    lab_path = audio_path.with_suffix(".lab")
-    if lab_path.exists():
-        prompt_text = _read_prompt_text_file(lab_path)
-        if prompt_text:
-            return prompt_text
+    catalog = get_reference_catalog()
+    if catalog is not None:
+        clip = catalog.get_clip(ref_audio_path)
+        prompt_text = clip["transcript"] if clip else ""
+    else:
+        lab_path = audio_path.with_suffix(".lab")
+        prompt_text = _read_prompt_text_file(lab_path) if lab_path.exists() else ""
+    if prompt_text:
+        return prompt_text
 
     stem = audio_path.stem.strip()
     if "-" in stem:
@@ -0,0 +1,113 @@
+import re
+
+_CJK_CHARACTERS = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# Speaker label, newline and separators around every verbatim turn
+TURN_OVERHEAD_TOKENS = 8
+# Turns that could not be summarized yet (LLM down) are kept up to this many, oldest dropped first
+MAX_PENDING_SUMMARY_TURNS = 40
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer: ~1 token per CJK character, ~4 characters per token otherwise."""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_CHARACTERS.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+class ConversationHistory:
+    """
+    Memory of one client connection, kept inside a fixed token budget.
+
+    The newest turns are kept verbatim. When they no longer fit next to the summary,
+    the oldest are moved to a pending list; the server folds those into the rolling
+    summary with a background LLM call (`apply_summary`), so the prompt stays the
+    same size however long the session runs.
+    """
+
+    def __init__(self, token_budget=1500, summary_token_budget=300, min_recent_turns=1):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.min_recent_turns = min_recent_turns
+        self.summary = ""
+        self.turns = []
+        self.pending_turns = []
+        # Turns ever removed from the front of pending_turns; pending_turns[0] is turn number pending_offset
+        self.pending_offset = 0
+        self.turn_count = 0
+
+    @property
+    def enabled(self):
+        return self.token_budget > 0
+
+    def add_turn(self, user_text, reply_text):
+        if not self.enabled or not (user_text or reply_text):
+            return
+        tokens = estimate_tokens(user_text) + estimate_tokens(reply_text) + TURN_OVERHEAD_TOKENS
+        self.turns.append((user_text, reply_text, tokens))
+        self.turn_count += 1
+        self._trim()
+
+    def _trim(self):
+        budget = self.token_budget - min(estimate_tokens(self.summary), self.summary_token_budget)
+        used = sum(tokens for _, _, tokens in self.turns)
+        while len(self.turns) > self.min_recent_turns and used > budget:
+            evicted = self.turns.pop(0)
+            used -= evicted[2]
+            self.pending_turns.append(evicted)
+        dropped = len(self.pending_turns) - MAX_PENDING_SUMMARY_TURNS
+        if dropped > 0:
+            del self.pending_turns[:dropped]
+            self.pending_offset += dropped
+
+    def needs_summary(self):
+        return bool(self.pending_turns)
+
+    def snapshot_pending(self):
+        """(pending_offset, turns) to summarize; pass the offset back to `apply_summary`."""
+        return self.pending_offset, list(self.pending_turns)
+
+    def apply_summary(self, summary, pending_offset, folded_count):
+        """
+        Install a new rolling summary covering `folded_count` pending turns starting at turn
+        number `pending_offset`. Returns False, keeping the old summary, if turns were dropped
+        from the pending list while the summary was being written, since its base is gone.
+        """
+        if pending_offset != self.pending_offset:
+            return False
+        summary = (summary or "").strip()
+        # Models overshoot length limits; cut rather than let the summary grow the prompt
+        while estimate_tokens(summary) > self.summary_token_budget:
+            summary = summary[:len(summary) * self.summary_token_budget // estimate_tokens(summary)]
+        self.summary = summary
+        del self.pending_turns[:folded_count]
+        self.pending_offset += folded_count
+        self._trim()
+        return True
+
+    def format_turns(self, turns, user_label, character_label):
+        lines = []
+        for user_text, reply_text, _ in turns:
+            if user_text:
+                lines.append(f"{user_label}: {user_text}")
+            if reply_text:
+                lines.append(f"{character_label}: {reply_text}")
+        return "\n".join(lines)
+
+    def render(self, user_label, character_label):
+        """Prompt section with the summary and recent turns, or "" when there is no history yet."""
+        sections = []
+        if self.summary:
+            sections.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.turns:
+            sections.append("Most recent turns:\n" + self.format_turns(self.turns, user_label, character_label))
+        return "\n\n".join(sections)
+
+    def stats(self):
+        return {
+            "turns": self.turn_count,
+            "verbatim_turns": len(self.turns),
+            "pending_summary_turns": len(self.pending_turns),
+            "summary_tokens": estimate_tokens(self.summary),
+            "history_tokens": estimate_tokens(self.summary) + sum(tokens for _, _, tokens in self.turns),
+        }
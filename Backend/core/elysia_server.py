@@ -2,133 +2,660 @@ import asyncio
 import websockets
 import json
 import base64 #We will use this for sending audio to unity
+import random
 import time
 
 # Import all tools that I build
+import config
+from audio_codecs import CODEC_OPUS, available_codecs, validate_opus_frame_ms
+from audio_framing import FLAG_STREAM_TTS, FRAME_AUDIO_CHUNK, FRAME_AUDIO_END, FRAME_AUDIO_UPLOAD, unpack_frame
+from conversation import ConversationHistory
 from llm_handler import LLMHandler
-from speech_recognition import SpeechRecognizer
+from metrics import MetricsRegistry, TraceWriter, TurnTrace, serve_metrics
+from pipeline import CancelScope, TurnPipeline
+from session import AudioStreamWriter, ClientSession
+from speculation import SpeculativeReply
+from speech_recognition import UNITY_SAMPLE_RATE, IncrementalRecognizer, SpeechRecognizer
+from text_segmentation import split_sentences
 from tts_handler import TTSHandler
+from tts_segments import OrderedSegmentAudio
 
 # Initialize our components ONCE when the server starts
 print("Initializing AI components...")
-llm_handler = LLMHandler()
+metrics = MetricsRegistry()
+metrics.describe("elysia_turn_stage_seconds", "Per-turn stage timings (marks are measured from when the turn was received).")
+metrics.describe("elysia_llm_first_token_seconds", "Time from sending the LLM request to the first streamed token.")
+metrics.describe("elysia_llm_request_seconds", "Complete LLM request duration.")
+metrics.describe("elysia_tts_first_chunk_seconds", "Time from sending a streaming TTS request to its first audio chunk.")
+metrics.describe("elysia_tts_synthesis_seconds", "Complete TTS request duration.")
+metrics.describe("elysia_tts_backend_wait_seconds", "Time spent waiting for a GPT-SoVITS server, including weight switches.")
+metrics.describe("elysia_tts_weight_switch_seconds", "Time spent loading GPT/SoVITS weights on a server.")
+metrics.describe("elysia_tts_weight_switches_total", "Weight switches per GPT-SoVITS server.")
+metrics.describe("elysia_turns_cancelled_total", "Turns abandoned because the user spoke again or sent an interrupt.")
+trace_writer = TraceWriter(config.ELYSIA_TRACE_FILE) if config.ELYSIA_TRACE_FILE else None
+llm_handler = LLMHandler(metrics=metrics)
 speech_recognizer = SpeechRecognizer()
-tts_handler = TTSHandler()
-print("AI components ready!")
+tts_handler = TTSHandler(metrics=metrics)
+# Blocking ASR/TTS calls run on bounded worker pools so the event loop stays free
+pipeline = TurnPipeline(
+    asr_workers=config.ELYSIA_ASR_WORKERS,
+    tts_workers=config.ELYSIA_TTS_WORKERS,
+    codec_workers=config.ELYSIA_CODEC_WORKERS,
+)
+if CODEC_OPUS in available_codecs():
+    # A bad TTS_STREAM_FRAME_MS should stop the server here, not fail inside libopus mid-stream
+    validate_opus_frame_ms(config.TTS_STREAM_FRAME_MS)
+print(f"AI components ready! ({pipeline.describe()})")
 
 async def send_streaming_tts(
-    websocket,
+    session,
     dialogue,
     expression,
     gesture,
     internal_thought_in_character
 ):
-    sample_rate = tts_handler.get_expected_output_sample_rate()
-    await websocket.send(json.dumps({
-        "event": "tts_stream_start",
-        "dialogue": dialogue,
-        "expression": expression,
-        "gesture": gesture,
-        "internal_thought_in_character": internal_thought_in_character,
-        "sample_rate": sample_rate,
-        "channels": 1,
-        "sample_width": 2,
-        "audio_format": "pcm_s16le",
-    }))
-
-    chunk_count = 0
-    for chunk in tts_handler.text_to_speech_stream(
-        dialogue,
+    sample_rate = await pipeline.codec.run(tts_handler.get_expected_output_sample_rate)
+    audio_writer = open_audio_writer(session, sample_rate)
+    await session.send_stream_start(
+        dialogue, expression, gesture, internal_thought_in_character, sample_rate, audio_writer.describe()
+    )
+
+    segment_audio = OrderedSegmentAudio(synthesize_segment, config.TTS_PARALLEL_SEGMENTS)
+    for segment in await split_for_tts(dialogue):
+        segment_audio.add(segment)
+    segment_audio.close()
+
+    try:
+        async for event in segment_audio.events():
+            if event[0] == "audio":
+                mark_turn(session, "tts_first_chunk")
+                await audio_writer.write(event[1])
+    finally:
+        await segment_audio.aclose()
+    chunk_count = await audio_writer.finish()
+
+    await session.send_stream_end(dialogue, expression, gesture, internal_thought_in_character, chunk_count)
+
+def mark_turn(session, stage):
+    if session.trace is not None:
+        session.trace.mark(stage)
+
+def open_audio_writer(session, sample_rate):
+    session.audio_writer = AudioStreamWriter(
+        session,
+        sample_rate,
+        frame_ms=config.TTS_STREAM_FRAME_MS,
+        max_frames_per_message=config.TTS_STREAM_MAX_FRAMES_PER_MESSAGE,
+        max_lead_seconds=config.TTS_STREAM_MAX_LEAD_SECONDS,
+        write_buffer_limit=int(config.TTS_STREAM_WRITE_BUFFER_KB * 1024),
+        opus_bitrate=config.TTS_OPUS_BITRATE,
+        encode_executor=pipeline.codec,
+    )
+    return session.audio_writer
+
+def synthesize_segment(text):
+    # Closing the stream early (barge-in) also closes the GPT-SoVITS request it is waiting on
+    return pipeline.tts.iterate(
+        tts_handler.text_to_speech_stream,
+        text,
         clean_commands=False,
-        media_type="raw"
-    ):
-        await websocket.send(json.dumps({
-            "event": "tts_stream_chunk",
-            "seq": chunk_count,
-            "audio_chunk_base64": base64.b64encode(chunk).decode('utf-8'),
-        }))
-        chunk_count += 1
-
-    await websocket.send(json.dumps({
-        "event": "tts_stream_end",
-        "dialogue": dialogue,
-        "expression": expression,
-        "gesture": gesture,
-        "internal_thought_in_character": internal_thought_in_character,
-        "chunk_count": chunk_count,
-    }))
+        media_type="raw",
+        cancel_scope=CancelScope(),
+    )
 
-async def handler(websocket):
-    print("A client connected! (Unity)")
+async def split_for_tts(text):
+    """Segments of `text` to synthesize side by side; a line that is already cached whole stays whole."""
+    if await pipeline.codec.run(tts_handler.has_cached_audio, text):
+        return [text]
+    if config.TTS_ADAPTIVE_CHUNKING:
+        return tts_handler.plan_segments(text) or [text]
+    if config.TTS_PARALLEL_SEGMENTS > 1:
+        return split_sentences(text) or [text]
+    return [text]
+
+def warm_up_tts():
+    """Pre-render the fallback replies and filler lines so degraded turns need no TTS round trip."""
+    active_voice = tts_handler.voice_registry.active_voice_name()
+    if config.TTS_WARMUP_VOICES == "all":
+        voice_names = list(config.TTS_VOICE_PRESETS)
+    elif config.TTS_WARMUP_VOICES == "active":
+        voice_names = [active_voice]
+    else:
+        voice_names = [name.strip() for name in config.TTS_WARMUP_VOICES.split(",") if name.strip()]
+    # The active voice goes last so its weights are still loaded for the first real turn
+    if active_voice in voice_names:
+        voice_names = [name for name in voice_names if name != active_voice] + [active_voice]
+
+    lines = llm_handler.fallback_dialogues() + config.TTS_FILLER_LINES
+    warmup_started_at = time.perf_counter()
+    ready_count = tts_handler.prerender_lines(lines, voice_names)
+    print(
+        f"TTS warm-up: {ready_count}/{len(lines) * len(voice_names)} lines ready "
+        f"for {len(voice_names)} voice(s) in {time.perf_counter() - warmup_started_at:.1f}s"
+    )
+
+async def send_filler_after_delay(session, stream_state):
+    """Open the reply stream with a pre-rendered filler if the LLM is slow to produce its first sentence."""
+    await asyncio.sleep(config.TTS_FILLER_DELAY_SECONDS)
+    filler_text = random.choice(config.TTS_FILLER_LINES)
+    # Probe first: only a filler that is actually played counts as a cache hit
+    if not await pipeline.codec.run(tts_handler.has_cached_audio, filler_text) or stream_state["opened"]:
+        return
+    cached_audio = await pipeline.codec.run(tts_handler.get_cached_audio, filler_text)
+    if cached_audio is None or stream_state["opened"]:
+        return
+
+    # From here on the stream belongs to the filler until it has been sent completely
+    stream_state["opened"] = True
+    stream_state["sample_rate"] = cached_audio.sample_rate
+    stream_state["writer"] = open_audio_writer(session, cached_audio.sample_rate)
+    await session.send_stream_start(
+        filler_text, "neutral", "thinking", "", cached_audio.sample_rate, stream_state["writer"].describe()
+    )
+    await stream_state["writer"].write(cached_audio.pcm)
+    print(f"Sent filler while waiting for the LLM: {filler_text}")
+
+async def stop_filler(filler_task, stream_state):
+    if filler_task is None:
+        return
+    if not stream_state["opened"]:
+        filler_task.cancel()
+    await asyncio.gather(filler_task, return_exceptions=True)
+
+async def send_streaming_llm_turn(session, transcribed_text, reply_events=None):
+    """
+    Stream the LLM reply and synthesize each dialogue sentence as soon as it is complete,
+    so the first audio plays while the model is still generating the rest. Sentences are
+    synthesized side by side and sent in order by a forwarding task.
+    `reply_events` replaces the LLM request with an already running (speculative) one.
+    Returns the reply dialogue, or None when the LLM gave no answer.
+    """
+    fields = {}
+    spoken_sentences = []
+    response_content = None
+    stream_state = {"sample_rate": None, "opened": False, "writer": None}
+    filler_task = None
+    if config.TTS_FILLER_DELAY_SECONDS > 0 and config.TTS_FILLER_LINES:
+        filler_task = asyncio.create_task(send_filler_after_delay(session, stream_state))
+
+    segment_audio = OrderedSegmentAudio(synthesize_segment, config.TTS_PARALLEL_SEGMENTS)
+    forwarder = asyncio.create_task(
+        forward_segment_audio(session, stream_state, fields, spoken_sentences, segment_audio, filler_task)
+    )
+    queued_sentences = 0
+    llm_started_at = time.perf_counter()
     try:
-        # The server will not loop forever, waiting for messages from Unity
-        async for message in websocket:
-            # The message from Unity will now be a JSON string.
-            data = json.loads(message)
-            event_type = data.get("event")
-            if event_type == "audio_data":
-                request_started_at = time.perf_counter()
-                stream_tts = data.get("stream_tts", False)
+        try:
+            if reply_events is None:
+                reply_events = llm_handler.stream_prompt_dialogue_async(transcribed_text, session.conversation)
+            async for event in reply_events:
+                if event[0] == "field":
+                    _, key, value = event
+                    fields[key] = value
+                elif event[0] == "sentence":
+                    mark_turn(session, "llm_first_sentence")
+                    if filler_task is not None and not stream_state["opened"]:
+                        # Synthesis starts now; a filler that is already playing is finished by the forwarder
+                        filler_task.cancel()
+                    if stream_state["sample_rate"] is None:
+                        # Looked up before synthesis starts so the stream start never waits behind it
+                        stream_state["sample_rate"] = await pipeline.codec.run(tts_handler.get_expected_output_sample_rate)
+                    if config.TTS_ADAPTIVE_CHUNKING and not queued_sentences:
+                        # A short leading clause gets the first audio out sooner
+                        for segment in tts_handler.split_first_segment(event[1]):
+                            segment_audio.add(segment)
+                    else:
+                        segment_audio.add(event[1])
+                    queued_sentences += 1
+                elif event[0] == "done":
+                    response_content = event[1]
+        except asyncio.CancelledError:
+            # Barge-in: the filler must not finish playing either
+            if filler_task is not None:
+                filler_task.cancel()
+            raise
+        finally:
+            if reply_events is not None:
+                # Closes the LLM request (or the speculative reply) if the turn ended early
+                await reply_events.aclose()
+            await stop_filler(filler_task, stream_state)
+        if session.trace is not None:
+            session.trace.record("llm_total", time.perf_counter() - llm_started_at)
+
+        dialogue, expression, gesture, internal_thought_in_character = llm_handler.process_command_from_responses(response_content)
+        if not queued_sentences and stream_state["opened"]:
+            # A filler already opened the stream; the fallback reply continues it
+            segment_audio.add(dialogue)
+            queued_sentences += 1
+        segment_audio.close()
+        await forwarder
+    finally:
+        forwarder.cancel()
+        await segment_audio.aclose()
+        await asyncio.gather(forwarder, return_exceptions=True)
+
+    if not queued_sentences:
+        # Nothing was voiced yet (API failure or empty dialogue); speak the parsed/fallback reply
+        await send_streaming_tts(session, dialogue, expression, gesture, internal_thought_in_character)
+        return dialogue if response_content is not None else None
+
+    reply_dialogue = fields.get("dialogue") or "".join(spoken_sentences)
+    await session.send_stream_end(
+        reply_dialogue,
+        fields.get("expression", expression),
+        fields.get("gesture", gesture),
+        fields.get("internal_thought_in_character", internal_thought_in_character),
+        await stream_state["writer"].finish(),
+    )
+    return reply_dialogue if response_content is not None else None
+
+async def forward_segment_audio(session, stream_state, fields, spoken_sentences, segment_audio, filler_task=None):
+    async for event in segment_audio.events():
+        if event[0] == "segment":
+            await stop_filler(filler_task, stream_state)
+            await announce_stream_sentence(session, stream_state, fields, spoken_sentences, event[1])
+        else:
+            mark_turn(session, "tts_first_chunk")
+            await stream_state["writer"].write(event[1])
+
+async def announce_stream_sentence(session, stream_state, fields, spoken_sentences, sentence):
+    if not stream_state["opened"]:
+        stream_state["opened"] = True
+        if stream_state["sample_rate"] is None:
+            stream_state["sample_rate"] = await pipeline.codec.run(tts_handler.get_expected_output_sample_rate)
+        stream_state["writer"] = open_audio_writer(session, stream_state["sample_rate"])
+        await session.send_stream_start(
+            sentence,
+            fields.get("expression", "neutral"),
+            fields.get("gesture", "idle"),
+            fields.get("internal_thought_in_character", ""),
+            stream_state["sample_rate"],
+            stream_state["writer"].describe(),
+        )
+    else:
+        await session.send_json({
+            "event": "tts_stream_text",
+            "dialogue_delta": sentence,
+            "dialogue": "".join(spoken_sentences + [sentence]),
+        })
+    spoken_sentences.append(sentence)
+    print(f"Streaming sentence {len(spoken_sentences)}: {sentence}")
+
+async def process_audio_turn(session, data, request_started_at):
+    stream_tts = data.get("stream_tts", False)
+    session.next_turn()
+    session.trace = trace = TurnTrace(
+        metrics,
+        trace_writer,
+        started_at=request_started_at,
+        context={"turn_id": session.turn_id, "client": str(getattr(session.websocket, "remote_address", ""))},
+        voice=tts_handler.voice_name,
+        model=llm_handler.model,
+        stream_tts=stream_tts,
+    )
+
+    # 1. Speech-to_Text (using our new recipe)
+    if data.get("event") == "text_input":
+        # Typed text (or a load test) skips ASR entirely
+        transcribed_text = str(data.get("text", ""))
+    elif "recognizer" in data:
+        # Chunked upload: most of the audio was already decoded while it arrived
+        if data["partial_decode"] is not None:
+            await asyncio.gather(data["partial_decode"], return_exceptions=True)
+        with trace.span("asr"):
+            transcribed_text = await pipeline.asr.run(data["recognizer"].finish)
+    else:
+        with trace.span("decode"):
+            if "pcm" in data:
+                audio_bytes = data["pcm"]
+                print(f"Received binary audio upload from Unity ({len(audio_bytes)} bytes).")
+            else:
                 full_audio_data = data.get("data", "")
                 truncated_audio_data = full_audio_data[:80]
 
                 print(f"Received audio_data event from Unity. Data begins with: {truncated_audio_data}...")
                 audio_bytes = base64.b64decode(full_audio_data)
 
-                # 1. Speech-to_Text (using our new recipe)
-                transcribed_text = speech_recognizer.transcribe_audio_data(audio_bytes)
-                print(f"Transcription: {transcribed_text}")
-                # 2. LLM processing
-                print("Sending text to LLM...")
-                responses_json_string = llm_handler.send_prompt_and_wait_for_response(transcribed_text)
-                dialogue, expression, gesture, internal_thought_in_character = llm_handler.process_command_from_responses(responses_json_string)
-
-                if stream_tts:
-                    print("Generating streaming audio...")
-                    await send_streaming_tts(
-                        websocket,
-                        dialogue,
-                        expression,
-                        gesture,
-                        internal_thought_in_character
-                    )
-                else:
-                    print("Generating audio...")
-                    audio_data = tts_handler.text_to_speech(
-                        dialogue,
-                        play_audio=False,
-                        clean_commands=False,
-                        return_audio_data=True
-                    )
-
-                    if audio_data is None:
-                        print("TTS failed. Sending response to Unity without audio.")
-                        audio_data_base64 = ""
-                    else:
-                        audio_data_base64 = base64.b64encode(audio_data).decode('utf-8')
-
-                    response_for_unity = {
-                        "dialogue": dialogue,
-                        "expression": expression,
-                        "gesture": gesture,
-                        "internal_thought_in_character": internal_thought_in_character,
-                        "audio_base64": audio_data_base64
-                    }
-                    await websocket.send(json.dumps(response_for_unity))
-
-                total_latency = time.perf_counter() - request_started_at
-                print(f"Sent complete response to Unity. End-to-end latency: {total_latency:.2f}s")
+            audio_bytes, sample_rate = await pipeline.codec.run(
+                session.decode_upload, audio_bytes, int(data.get("sample_rate", UNITY_SAMPLE_RATE))
+            )
+        with trace.span("asr"):
+            if config.ELYSIA_SPECULATIVE_LLM:
+                transcribed_text = await transcribe_with_speculation(session, audio_bytes, sample_rate)
+            else:
+                transcribed_text = await pipeline.asr.run(speech_recognizer.transcribe_audio_data, audio_bytes, sample_rate)
+    print(f"Transcription: {transcribed_text}")
+    # 2. LLM processing
+    speculation = claim_speculation(session, transcribed_text)
+    print("Sending text to LLM..." if speculation is None else "Using the speculative LLM reply...")
+    if stream_tts and config.LLM_STREAM_RESPONSES:
+        reply_dialogue = await send_streaming_llm_turn(
+            session,
+            transcribed_text,
+            reply_events=speculation.events() if speculation is not None else None,
+        )
+    else:
+        with trace.span("llm_total"):
+            if speculation is not None:
+                responses_json_string = await collect_reply_content(speculation.events())
+            else:
+                responses_json_string = await llm_handler.send_prompt(transcribed_text, session.conversation)
+        dialogue, expression, gesture, internal_thought_in_character = llm_handler.process_command_from_responses(responses_json_string)
+        reply_dialogue = dialogue if responses_json_string is not None else None
+
+        if stream_tts:
+            print("Generating streaming audio...")
+            await send_streaming_tts(
+                session,
+                dialogue,
+                expression,
+                gesture,
+                internal_thought_in_character
+            )
+        else:
+            print("Generating audio...")
+            with trace.span("tts_total"):
+                audio_data = await pipeline.tts.run(
+                    tts_handler.text_to_speech,
+                    dialogue,
+                    play_audio=False,
+                    clean_commands=False,
+                    return_audio_data=True
+                )
+
+            if audio_data is None:
+                print("TTS failed. Sending response to Unity without audio.")
+
+            await session.send_full_response(
+                dialogue,
+                expression,
+                gesture,
+                internal_thought_in_character,
+                audio_data
+            )
+
+    spans = trace.finish()
+    session.trace = None
+    print(
+        f"Sent complete response to Unity. End-to-end latency: {spans['total']:.2f}s "
+        f"({', '.join(f'{stage}={seconds:.2f}s' for stage, seconds in spans.items() if stage != 'total')})"
+    )
+
+    if reply_dialogue is not None:
+        remember_turn(session, transcribed_text, reply_dialogue)
+
+async def transcribe_with_speculation(session, audio_bytes, sample_rate):
+    """
+    Transcribe segment by segment and start the LLM as soon as the decoded text reaches the
+    end of speech. The end is found with the energy VAD, so trailing silence in the upload
+    does not hold speculation back; later segments that change the text re-issue the request.
+    """
+    segment_texts = []
+    try:
+        # Nothing above the VAD threshold (a quiet microphone): fall back to the end of the audio
+        speech_end = await pipeline.asr.run(speech_recognizer.speech_end_seconds, audio_bytes, sample_rate)
+        speech_end = speech_end or len(audio_bytes) / 2.0 / sample_rate
+        async for _, segment_end, segment_text in pipeline.asr.iterate(
+            speech_recognizer.stream_audio_data,
+            audio_bytes,
+            sample_rate,
+        ):
+            segment_texts.append(segment_text)
+            if segment_end >= speech_end - config.ELYSIA_SPECULATIVE_TAIL_SECONDS:
+                speculate_reply(session, "".join(segment_texts).strip())
+    except Exception as e:
+        print(f"Error transcribing audio: {e}")
+        return f"Error during transcription: {str(e)}"
+
+    transcribed_text = "".join(segment_texts).strip()
+    speech_recognizer.persist_transcript(transcribed_text)
+    return transcribed_text
+
+def speculate_reply(session, text):
+    """Request the LLM reply for a transcript that is probably final; a different transcript replaces the request."""
+    history_turns = session.conversation.turn_count
+    if not text:
+        return
+    if session.speculation is not None:
+        if session.speculation.matches(text, history_turns):
+            return
+        session.speculation.cancel()
+    session.speculation = SpeculativeReply(
+        text,
+        history_turns,
+        llm_handler.stream_prompt_dialogue_async(text, session.conversation),
+    )
+    print(f"Speculative LLM request started for: {text}")
+
+def claim_speculation(session, transcribed_text):
+    speculation, session.speculation = session.speculation, None
+    if speculation is None:
+        return None
+    if speculation.matches(transcribed_text, session.conversation.turn_count):
+        return speculation
+    speculation.cancel()
+    print("Transcript changed after the speculative LLM request; re-issuing it.")
+    return None
+
+async def collect_reply_content(reply_events):
+    content = None
+    async for event in reply_events:
+        if event[0] == "done":
+            content = event[1]
+    return content
+
+def remember_turn(session, transcribed_text, reply_dialogue):
+    conversation = session.conversation
+    conversation.add_turn(transcribed_text, reply_dialogue)
+    # Summarizing old turns is an extra LLM call; it runs after the reply, never in front of it
+    if conversation.needs_summary() and (session.summary_task is None or session.summary_task.done()):
+        session.summary_task = asyncio.create_task(refresh_conversation_summary(conversation))
+
+async def refresh_conversation_summary(conversation):
+    result = await llm_handler.summarize_conversation(conversation)
+    if result is None:
+        return
+    if conversation.apply_summary(*result):
+        print(f"Conversation summary refreshed: {conversation.stats()}")
+    else:
+        print("Conversation summary discarded: turns it was based on were dropped while it was written.")
+
+def parse_binary_message(message):
+    """Turn a binary frame from the client into a job dict, or None if it is not a turn."""
+    try:
+        frame_type, flags, _, _, payload = unpack_frame(message)
+    except ValueError as e:
+        print(f"Ignoring malformed binary frame: {e}")
+        return None
+
+    if frame_type == FRAME_AUDIO_UPLOAD:
+        return {
+            "event": "audio_data",
+            "stream_tts": bool(flags & FLAG_STREAM_TTS),
+            "pcm": bytes(payload),
+        }
+    if frame_type == FRAME_AUDIO_CHUNK:
+        return {"event": "audio_chunk", "pcm": bytes(payload)}
+    if frame_type == FRAME_AUDIO_END:
+        return {"event": "audio_end", "stream_tts": bool(flags & FLAG_STREAM_TTS)}
+
+    print(f"Ignoring unexpected binary frame type {frame_type:#x}")
+    return None
+
+async def run_partial_decode(session, recognizer):
+    try:
+        partial_text = await pipeline.asr.run(recognizer.decode_partial)
+        if config.ELYSIA_SPECULATIVE_LLM and not session.turn_active and session.recognizer is recognizer:
+            # The user has gone quiet: start the LLM before the client even sends audio_end
+            end_of_speech_text = recognizer.end_of_speech_text()
+            if end_of_speech_text:
+                speculate_reply(session, end_of_speech_text)
+        if session.asr_partials and session.recognizer is recognizer and partial_text:
+            await session.send_json({"event": "asr_partial", "text": partial_text})
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def receive_audio_chunk(session, data):
+    if "pcm" in data:
+        pcm_bytes = data["pcm"]
+    else:
+        pcm_bytes = base64.b64decode(data.get("data", ""))
+    # Awaited before the next message is read, so the (stateful) decoder sees the chunks in order
+    pcm_bytes, sample_rate = await pipeline.codec.run(
+        session.decode_upload, pcm_bytes, int(data.get("sample_rate", UNITY_SAMPLE_RATE))
+    )
+
+    if session.recognizer is None:
+        session.recognizer = IncrementalRecognizer(speech_recognizer, sample_rate=sample_rate)
+        session.partial_decode = None
+
+    # One partial decode at a time per utterance; audio keeps buffering meanwhile
+    wants_decode = session.recognizer.add_audio(pcm_bytes)
+    if wants_decode and (session.partial_decode is None or session.partial_decode.done()):
+        session.partial_decode = asyncio.create_task(run_partial_decode(session, session.recognizer))
+
+def finish_audio_upload(session, data):
+    """Turn the buffered chunked upload into a job for the connection worker."""
+    if session.recognizer is None:
+        print("Ignoring audio_end without any audio_chunk.")
+        return None
+    job = {
+        "event": "audio_end",
+        "stream_tts": data.get("stream_tts", False),
+        "recognizer": session.recognizer,
+        "partial_decode": session.partial_decode,
+    }
+    session.recognizer = None
+    session.partial_decode = None
+    return job
+
+async def connection_worker(session, job_queue):
+    # Turns from one client are answered in order; other clients have their own worker
+    while True:
+        data, request_started_at = await job_queue.get()
+        session.turn_active = True
+        session.audio_writer = None
+        turn_task = session.turn_task = asyncio.create_task(process_audio_turn(session, data, request_started_at))
+        try:
+            # wait() leaves the turn running if only the worker is cancelled; the finally handles that case
+            await asyncio.wait({turn_task})
+            if turn_task.cancelled():
+                await finish_cancelled_turn(session)
+            elif isinstance(turn_task.exception(), websockets.exceptions.ConnectionClosed):
+                return
+            elif turn_task.exception() is not None:
+                print(f"Error while processing turn: {turn_task.exception()}")
+        except websockets.exceptions.ConnectionClosed:
+            return
+        finally:
+            if not turn_task.done():
+                turn_task.cancel()
+                await asyncio.gather(turn_task, return_exceptions=True)
+            session.turn_task = None
+            session.audio_writer = None
+            session.turn_active = not job_queue.empty()
+            job_queue.task_done()
+
+def interrupt_turn(session, job_queue, reason):
+    """Cancel the reply being generated and drop turns still waiting; the user has moved on."""
+    dropped = 0
+    while not job_queue.empty():
+        job_queue.get_nowait()
+        job_queue.task_done()
+        dropped += 1
+    if session.speculation is not None:
+        session.speculation.cancel()
+        session.speculation = None
+    if session.turn_task is not None and not session.turn_task.done():
+        session.cancel_reason = reason
+        session.turn_task.cancel()
+        print(f"Interrupting the current reply ({reason}); dropped {dropped} queued turn(s).")
+
+async def finish_cancelled_turn(session):
+    reason = session.cancel_reason or "interrupt"
+    metrics.increment("elysia_turns_cancelled_total", reason=reason)
+    if session.trace is not None:
+        print(f"Turn {session.turn_id} cancelled after {time.perf_counter() - session.trace.started_at:.2f}s ({reason}).")
+        session.trace = None
+    await session.send_stream_cancelled(reason)
+
+async def handler(websocket):
+    print("A client connected! (Unity)")
+    session = ClientSession(
+        websocket,
+        conversation=ConversationHistory(
+            token_budget=llm_handler.history_token_budget(config.LLM_HISTORY_TOKEN_BUDGET),
+            summary_token_budget=config.LLM_SUMMARY_TOKEN_BUDGET,
+        ),
+    )
+    job_queue = asyncio.Queue(maxsize=config.ELYSIA_CONNECTION_QUEUE_SIZE)
+    worker = asyncio.create_task(connection_worker(session, job_queue))
+    try:
+        # The server will not loop forever, waiting for messages from Unity
+        async for message in websocket:
+            if isinstance(message, bytes):
+                # Negotiated binary audio: header + raw PCM, no base64
+                data = parse_binary_message(message)
+                if data is None:
+                    continue
+            else:
+                # The message from Unity will now be a JSON string.
+                data = json.loads(message)
+            event_type = data.get("event")
+            if event_type == "hello":
+                await session.send_json(session.negotiate(data))
+                print(
+                    f"Client negotiated audio transport: {'binary' if session.binary_audio else 'json'} "
+                    f"(tts codec={session.audio_codec}, upload codec={session.upload_codec})"
+                )
+            elif event_type in ("audio_data", "text_input"):
+                if config.ELYSIA_BARGE_IN:
+                    interrupt_turn(session, job_queue, f"superseded by {event_type}")
+                # Waits only when this client already has a full backlog of turns
+                await job_queue.put((data, time.perf_counter()))
+            elif event_type == "audio_chunk":
+                if config.ELYSIA_BARGE_IN and session.recognizer is None:
+                    # The user started speaking again
+                    interrupt_turn(session, job_queue, "superseded by audio_chunk")
+                await receive_audio_chunk(session, data)
+            elif event_type == "interrupt":
+                interrupt_turn(session, job_queue, "interrupt")
+            elif event_type == "audio_end":
+                job = finish_audio_upload(session, data)
+                if job is not None:
+                    await job_queue.put((job, time.perf_counter()))
     
     except websockets.exceptions.ConnectionClosed as exc:
         print(
             "Client disconnected "
             f"(code={getattr(exc, 'code', 'unknown')}, reason={getattr(exc, 'reason', '')!r})"
         )
+    finally:
+        worker.cancel()
+        if session.summary_task is not None:
+            session.summary_task.cancel()
+        if session.speculation is not None:
+            session.speculation.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
 
 async def main():
-    async with websockets.serve(handler, "0.0.0.0", 8765):
-        print("Project Elysia WebSocket server started at ws://0.0.0.0:8765")
-        await asyncio.Future()
+    if config.LLM_CAPABILITY_PROBE and llm_handler.capabilities["probed_at"] is None:
+        await llm_handler.probe_capabilities_async()
+    if config.TTS_WARMUP_ENABLED:
+        await pipeline.tts.run(warm_up_tts)
+    if config.ELYSIA_METRICS_PORT:
+        await serve_metrics(metrics, config.ELYSIA_METRICS_HOST, config.ELYSIA_METRICS_PORT)
+        print(f"Metrics available at http://{config.ELYSIA_METRICS_HOST}:{config.ELYSIA_METRICS_PORT}/metrics")
+    async with websockets.serve(handler, config.ELYSIA_SERVER_HOST, config.ELYSIA_SERVER_PORT):
+        print(f"Project Elysia WebSocket server started at ws://{config.ELYSIA_SERVER_HOST}:{config.ELYSIA_SERVER_PORT}")
+        try:
+            await asyncio.Future()
+        finally:
+            await llm_handler.aclose()
+            pipeline.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
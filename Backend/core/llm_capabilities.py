@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+CAPABILITY_FIELDS = ("json_mode", "streaming", "stream_usage", "max_context")
+# Where OpenAI-compatible servers report a model's context window in /models responses
+CONTEXT_LENGTH_KEYS = ("context_length", "max_model_len", "context_window", "max_context_length", "inputTokenLimit")
+PROBE_PROMPT = 'Reply with the JSON object {"ok": true}.'
+
+
+def capability_from_status(status_code):
+    """True/False for a probe's HTTP status, or None when the status says nothing about the feature."""
+    if status_code < 400:
+        return True
+    if status_code in (400, 422):
+        return False
+    # Auth errors, rate limits and outages are not evidence either way
+    return None
+
+
+def extract_context_length(models_json, model):
+    """Find `model`'s context window in a /models or /models/{model} response, or None."""
+    if not isinstance(models_json, dict):
+        return None
+    entries = models_json.get("data")
+    if isinstance(entries, list):
+        entry = next((item for item in entries if isinstance(item, dict) and item.get("id") == model), None)
+    else:
+        entry = models_json
+    if not entry:
+        return None
+    for key in CONTEXT_LENGTH_KEYS:
+        value = entry.get(key)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+def probe_payloads(model):
+    """(capability, payload) chat requests used to probe an endpoint; "baseline" must succeed for results to count."""
+    base_payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": PROBE_PROMPT}],
+        "max_tokens": 16,
+    }
+    return [
+        ("baseline", dict(base_payload)),
+        ("json_mode", dict(base_payload, response_format={"type": "json_object"})),
+        ("streaming", dict(base_payload, stream=True)),
+        ("stream_usage", dict(base_payload, stream=True, stream_options={"include_usage": True})),
+    ]
+
+
+class LLMCapabilityCache:
+    """
+    What each (base_url, model) endpoint supports, persisted as a small JSON file.
+
+    Unknown capabilities are None and requests optimistically use the feature; once a
+    probe has run, requests send the payload the endpoint accepts on the first try.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def make_key(base_url, model):
+        return f"{base_url}|{model}"
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Error saving LLM capability cache: {e}")
+
+    def get(self, base_url, model):
+        with self._lock:
+            entry = self._entries.get(self.make_key(base_url, model), {})
+            capabilities = {field: entry.get(field) for field in CAPABILITY_FIELDS}
+            capabilities["probed_at"] = entry.get("probed_at")
+            return capabilities
+
+    def record_probe(self, base_url, model, results):
+        """Store probe results; fields that came back None keep their previous value."""
+        with self._lock:
+            entry = self._entries.setdefault(self.make_key(base_url, model), {})
+            for field in CAPABILITY_FIELDS:
+                if results.get(field) is not None:
+                    entry[field] = results[field]
+            entry["probed_at"] = time.time()
+            self._save()
+            return dict(entry)
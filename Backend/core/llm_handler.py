@@ -1,22 +1,33 @@
 import sys
 from pathlib import Path
 import colorsys
+import config
 from config import OPENAI_COMPAT_API_KEY, OPENAI_COMPAT_BASE_URL, OPENAI_COMPAT_MODEL
+from character_registry import CharacterRegistry
+from llm_capabilities import LLMCapabilityCache, capability_from_status, extract_context_length, probe_payloads
+from llm_stream import SSE_DONE, DialogueEventStream, extract_message_content, parse_stream_chunk, sse_line_data
 
 # Add the task directory to the path
 task_dir = Path(__file__).parent.parent / 'task'
 sys.path.append(str(task_dir))
 
+import asyncio
+import httpx
 import requests
 import json
+import threading
+import time
+from urllib.parse import quote
 from unity_control import UnityControl
 
 class LLMHandler:
-    def __init__(self, debug_mode=False):
+    def __init__(self, debug_mode=False, metrics=None):
         self.base_dir = Path(__file__).parent
         self.debug_mode = debug_mode
+        # Optional metrics.MetricsRegistry for request latencies
+        self.metrics = metrics
         self.system_instruction = """
-            You are a world-class AI actor. Your job is to fully embody the character defined in the user's prompt.
+            You are a world-class AI actor. Your job is to fully embody the character defined in the dossier below.
             - You must always stay in character.
             - Your entire response must be a single, valid JSON object that conforms to the schema provided by the API.
             - Do not add any text, markdown, or explanations before or after the JSON object.
@@ -24,10 +35,27 @@ class LLMHandler:
         self.base_url = self._normalize_base_url(OPENAI_COMPAT_BASE_URL)
         self.api_key = OPENAI_COMPAT_API_KEY
         self.model = OPENAI_COMPAT_MODEL
-
-        character_card_path = self.base_dir / 'cyrene_character_card.json'
-        with open(character_card_path, 'r', encoding='utf-8') as f:
-            self.character_card = json.load(f)
+        # Connections to the LLM endpoint are kept alive and reused across turns and clients
+        self.session = requests.Session()
+        self.request_timeout = (config.LLM_CONNECT_TIMEOUT_SECONDS, config.LLM_READ_TIMEOUT_SECONDS)
+        self._async_client = None
+        # What this endpoint accepts (JSON mode, streaming, ...), so requests are right the first time
+        self.capability_cache = LLMCapabilityCache(config.LLM_CAPABILITY_CACHE_PATH)
+        self._probe_lock = threading.Lock()
+        self._async_probe_lock = None
+        # time.monotonic() of the last probe attempt, whatever its outcome
+        self._probe_attempted_at = None
+
+        self.user_name = "開拓者"
+        # The card is rendered once into the system message so every request shares a cacheable prefix
+        self.character_card_file = config.LLM_CHARACTER_CARD
+        self.character_registry = CharacterRegistry(
+            self.base_dir,
+            self._render_system_prompt,
+            poll_interval=config.LLM_CHARACTER_POLL_SECONDS,
+        )
+        self.character_registry.get(self.character_card_file)
+        self.usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
 
 
         
@@ -44,67 +72,404 @@ class LLMHandler:
             return normalized
         return f"{normalized}/v1"
 
-    def send_prompt_and_wait_for_response(self, user_prompt): #Technically this is send prompt and return the response
-        try:
-            
-            character_card_string = json.dumps(self.character_card, ensure_ascii=False, indent=2)
+    def _chat_endpoint(self):
+        url = f"{self.base_url}/chat/completions"
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return url, headers
 
-            # Build the full prompt to send
-            full_prompt = f"""
-            # CHARACTER DOSSIER
-            {character_card_string}
+    @property
+    def character_prompt(self):
+        return self.character_registry.get(self.character_card_file)
 
-            
-            # INSTRUCTIONS
-            1.  Your `expression` should be a single, descriptive word for your facial expression. This is your immediate, non-verbal reaction.
-            2.  Your `dialogue` should be your spoken words.
-            3.  Your `gesture` should be a single, descriptive word for a subtle body action that matches your dialogue. Most of the time, this should be `Idle` or `None`. Only use a specific gesture if it feels natural and necessary, like `Waving`, `Thinking` or `SlightNod`.
-            4.  Your `internal_thought_in_character` should be your inner monologue as the character.
-
-            You must now respond, in character, to the following user message.
-            user == "開拓者"
-            開拓者 is a single person(male)
-            # USER MESSAGE
-            "{user_prompt}"
-            """
+    @property
+    def character_card(self):
+        return self.character_prompt.card
+
+    @property
+    def character_name(self):
+        return self.character_prompt.name
 
-            url = f"{self.base_url}/chat/completions"
-            headers = {"Content-Type": "application/json"}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": self.system_instruction},
-                    {"role": "user", "content": full_prompt}
-                ],
-                "response_format": {"type": "json_object"}
+    def _render_system_prompt(self, character_card):
+        character_card_string = json.dumps(character_card, ensure_ascii=False, indent=2)
+
+        # Everything here is identical for every request with this card; per-turn content goes in the user message
+        return f"""{self.system_instruction}
+        # CHARACTER DOSSIER
+        {character_card_string}
+
+        
+        # INSTRUCTIONS
+        1.  Your `expression` should be a single, descriptive word for your facial expression. This is your immediate, non-verbal reaction.
+        2.  Your `dialogue` should be your spoken words.
+        3.  Your `gesture` should be a single, descriptive word for a subtle body action that matches your dialogue. Most of the time, this should be `Idle` or `None`. Only use a specific gesture if it feels natural and necessary, like `Waving`, `Thinking` or `SlightNod`.
+        4.  Your `internal_thought_in_character` should be your inner monologue as the character.
+        5.  Write the JSON keys in this order: `expression`, `gesture`, `dialogue`, `internal_thought_in_character`.
+
+        user == "{self.user_name}"
+        {self.user_name} is a single person(male)
+        """
+
+    @property
+    def capabilities(self):
+        return self.capability_cache.get(self.base_url, self.model)
+
+    def history_token_budget(self, configured_budget):
+        """Cap the conversation budget to a quarter of the model's context window when it is known."""
+        max_context = self.capabilities["max_context"]
+        if max_context:
+            return min(configured_budget, max_context // 4)
+        return configured_budget
+
+    def _record_probe_results(self, results):
+        if results.pop("baseline", None) is not True:
+            # Without a working plain request the other answers say nothing about the features
+            print(
+                "LLM capability probe inconclusive; will retry on a rejected request "
+                f"after {config.LLM_CAPABILITY_PROBE_RETRY_SECONDS:g}s."
+            )
+            return
+        capabilities = self.capability_cache.record_probe(self.base_url, self.model, results)
+        print(f"LLM capabilities for {self.model}: {capabilities}")
+
+    def probe_capabilities(self):
+        """Probe the endpoint with tiny requests (blocking); results are persisted per (base_url, model)."""
+        self._probe_attempted_at = time.monotonic()
+        url, headers = self._chat_endpoint()
+        results = {}
+        try:
+            for capability, payload in probe_payloads(self.model):
+                response = self.session.post(url, headers=headers, json=payload, timeout=self.request_timeout, stream=True)
+                response.close()
+                results[capability] = capability_from_status(response.status_code)
+
+            for models_url in (f"{self.base_url}/models/{quote(self.model, safe='')}", f"{self.base_url}/models"):
+                response = self.session.get(models_url, headers=headers, timeout=self.request_timeout)
+                if response.status_code < 400:
+                    results["max_context"] = extract_context_length(response.json(), self.model)
+                    if results["max_context"]:
+                        break
+        except Exception as e:
+            print(f"Error probing LLM capabilities: {e}")
+            return
+        self._record_probe_results(results)
+
+    async def probe_capabilities_async(self):
+        """Awaitable `probe_capabilities` on the pooled async client."""
+        self._probe_attempted_at = time.monotonic()
+        client = self._get_async_client()
+        url, headers = self._chat_endpoint()
+        results = {}
+        try:
+            for capability, payload in probe_payloads(self.model):
+                async with client.stream("POST", url, headers=headers, json=payload) as response:
+                    results[capability] = capability_from_status(response.status_code)
+
+            for models_url in (f"{self.base_url}/models/{quote(self.model, safe='')}", f"{self.base_url}/models"):
+                response = await client.get(models_url, headers=headers)
+                if response.status_code < 400:
+                    results["max_context"] = extract_context_length(response.json(), self.model)
+                    if results["max_context"]:
+                        break
+        except Exception as e:
+            print(f"Error probing LLM capabilities: {e}")
+            return
+        self._record_probe_results(results)
+
+    def _should_probe(self, status_code):
+        """
+        Whether a request rejected with `status_code` warrants a probe: only 400/422 can mean
+        an unsupported feature, the endpoint has not been probed yet, and the last attempt
+        (successful or not) is at least LLM_CAPABILITY_PROBE_RETRY_SECONDS old. Rate limits
+        and outages therefore never multiply the traffic to a failing endpoint.
+        """
+        if capability_from_status(status_code) is not False:
+            return False
+        if self.capabilities["probed_at"] is not None:
+            return False
+        return (
+            self._probe_attempted_at is None
+            or time.monotonic() - self._probe_attempted_at >= config.LLM_CAPABILITY_PROBE_RETRY_SECONDS
+        )
+
+    def _probe_after_failure(self, status_code):
+        """Probe after a request was rejected with `status_code`; returns True if a retry may now succeed."""
+        if not self._should_probe(status_code):
+            return False
+        with self._probe_lock:
+            if not self._should_probe(status_code):
+                return False
+            self.probe_capabilities()
+            return self.capabilities["probed_at"] is not None
+
+    async def _probe_after_failure_async(self, status_code):
+        # Checked before the lock too, so turns do not queue behind a probe that will not run
+        if not self._should_probe(status_code):
+            return False
+        if self._async_probe_lock is None:
+            self._async_probe_lock = asyncio.Lock()
+        async with self._async_probe_lock:
+            if not self._should_probe(status_code):
+                return False
+            await self.probe_capabilities_async()
+            return self.capabilities["probed_at"] is not None
+
+    def _build_chat_request(self, user_prompt, conversation=None, stream=False):
+        character_prompt = self.character_prompt
+        history_section = ""
+        if conversation is not None:
+            history = conversation.render(self.user_name, character_prompt.name)
+            if history:
+                history_section = f"# CONVERSATION SO FAR\n{history}\n\n"
+
+        # Build the per-turn part of the prompt
+        turn_prompt = f"""{history_section}You must now respond, in character, to the following user message.
+        # USER MESSAGE
+        "{user_prompt}"
+        """
+
+        url, headers = self._chat_endpoint()
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": character_prompt.system_prompt},
+                {"role": "user", "content": turn_prompt}
+            ],
+        }
+        capabilities = self.capabilities
+        if capabilities["json_mode"] is not False:
+            payload["response_format"] = {"type": "json_object"}
+        if stream:
+            payload["stream"] = True
+            if capabilities["stream_usage"] is not False:
+                # Usage (with cached-token counts) arrives in a final chunk only when asked for
+                payload["stream_options"] = {"include_usage": True}
+        return url, headers, payload
+
+    def _record_usage(self, usage):
+        """Log token usage, including how much of the prompt the provider served from its prefix cache."""
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        # OpenAI-style `prompt_tokens_details.cached_tokens`; some compatible servers report it top-level
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens is None:
+            cached_tokens = usage.get("cached_tokens") or 0
+
+        totals = self.usage_totals
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_tokens"] += cached_tokens
+        totals["completion_tokens"] += completion_tokens
+        cached_share = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+        print(
+            f"LLM usage: prompt={prompt_tokens} cached={cached_tokens} completion={completion_tokens} "
+            f"(session cached share {cached_share:.0%} over {totals['requests']} requests)"
+        )
+
+    def _get_async_client(self):
+        """The shared asyncio client, created on first use inside the server's event loop."""
+        if self._async_client is None:
+            client_options = {
+                "timeout": httpx.Timeout(
+                    config.LLM_READ_TIMEOUT_SECONDS,
+                    connect=config.LLM_CONNECT_TIMEOUT_SECONDS,
+                ),
+                "limits": httpx.Limits(
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=config.LLM_KEEPALIVE_SECONDS,
+                ),
             }
+            try:
+                # HTTP/2 is negotiated via ALPN and silently stays HTTP/1.1 where the endpoint lacks it
+                self._async_client = httpx.AsyncClient(http2=config.LLM_HTTP2, **client_options)
+            except ImportError:
+                print("HTTP/2 support is not installed (pip install httpx[http2]); using HTTP/1.1 for the LLM.")
+                self._async_client = httpx.AsyncClient(**client_options)
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.session.close()
+
+    def _print_request_error(self, response):
+        try:
+            print(f"Error in send_prompt: {response.status_code} - {response.json()}")
+        except Exception:
+            print(f"Error in send_prompt: {response.status_code} - {response.text}")
 
-            response = requests.post(url, headers=headers, json=payload, timeout=90)
-            if response.status_code >= 400:
-                payload.pop("response_format", None)
-                response = requests.post(url, headers=headers, json=payload, timeout=90)
+    def send_prompt_and_wait_for_response(self, user_prompt, conversation=None): #Technically this is send prompt and return the response
+        try:
+            url, headers, payload = self._build_chat_request(user_prompt, conversation)
+
+            response = self.session.post(url, headers=headers, json=payload, timeout=self.request_timeout)
+            if response.status_code >= 400 and self._probe_after_failure(response.status_code):
+                url, headers, payload = self._build_chat_request(user_prompt, conversation)
+                response = self.session.post(url, headers=headers, json=payload, timeout=self.request_timeout)
 
             if response.status_code >= 400:
-                try:
-                    print(f"Error in send_prompt: {response.status_code} - {response.json()}")
-                except Exception:
-                    print(f"Error in send_prompt: {response.status_code} - {response.text}")
+                self._print_request_error(response)
                 return None
 
-            data = response.json()
-            choice = (data.get("choices") or [{}])[0]
-            message = choice.get("message") or {}
-            content = message.get("content") or choice.get("text")
-            return content
+            response_json = response.json()
+            self._record_usage(response_json.get("usage"))
+            return extract_message_content(response_json)
         
 
         except Exception as e:
             print(f"Error in send_prompt: {e}")
             return None
 
+    def _observe(self, name, seconds, **labels):
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds, model=self.model, **labels)
+
+    async def send_prompt(self, user_prompt, conversation=None):
+        """Awaitable `send_prompt_and_wait_for_response` on the pooled async client."""
+        request_started_at = time.perf_counter()
+        try:
+            client = self._get_async_client()
+            url, headers, payload = self._build_chat_request(user_prompt, conversation)
+
+            response = await client.post(url, headers=headers, json=payload)
+            if response.status_code >= 400 and await self._probe_after_failure_async(response.status_code):
+                url, headers, payload = self._build_chat_request(user_prompt, conversation)
+                response = await client.post(url, headers=headers, json=payload)
+
+            if response.status_code >= 400:
+                self._print_request_error(response)
+                return None
+
+            response_json = response.json()
+            self._record_usage(response_json.get("usage"))
+            self._observe("elysia_llm_request_seconds", time.perf_counter() - request_started_at, mode="request")
+            return extract_message_content(response_json)
+
+        except Exception as e:
+            print(f"Error in send_prompt: {e}")
+            return None
+
+    async def stream_prompt_dialogue_async(self, user_prompt, conversation=None):
+        """
+        Stream the reply with `stream: true` on the pooled async client and yield it as it is generated.
+
+        Yields tuples:
+            ("field", key, value)  - a top-level string field (expression, gesture, ...) is complete
+            ("sentence", text)     - a complete sentence of `dialogue`, ready for TTS
+            ("done", content)      - the full response text, for process_command_from_responses
+        If the endpoint refuses to stream, the reply is fetched in one piece and replayed
+        through the same events; on failure "done" carries None.
+        """
+        events = DialogueEventStream()
+        request_started_at = time.perf_counter()
+        first_token_seen = False
+
+        try:
+            client = self._get_async_client()
+            response = None
+            if self.capabilities["streaming"] is not False:
+                url, headers, payload = self._build_chat_request(user_prompt, conversation, stream=True)
+                response = await client.send(client.build_request("POST", url, headers=headers, json=payload), stream=True)
+                if response.status_code >= 400:
+                    await response.aclose()
+                    status_code, response = response.status_code, None
+                    if await self._probe_after_failure_async(status_code) and self.capabilities["streaming"] is not False:
+                        url, headers, payload = self._build_chat_request(user_prompt, conversation, stream=True)
+                        response = await client.send(client.build_request("POST", url, headers=headers, json=payload), stream=True)
+
+            if response is None or response.status_code >= 400:
+                if response is not None:
+                    print(f"Streaming request rejected ({response.status_code}); falling back to a normal request.")
+                    await response.aclose()
+                content = await self.send_prompt(user_prompt, conversation)
+                if content is not None:
+                    for event in events.feed(content):
+                        yield event
+            else:
+                try:
+                    content_type = response.headers.get("Content-Type", "")
+                    if "text/event-stream" in content_type:
+                        async for line in response.aiter_lines():
+                            data = sse_line_data(line)
+                            if data is None:
+                                continue
+                            if data == SSE_DONE:
+                                break
+                            delta, usage = parse_stream_chunk(data)
+                            self._record_usage(usage)
+                            if delta:
+                                if not first_token_seen:
+                                    first_token_seen = True
+                                    self._observe("elysia_llm_first_token_seconds", time.perf_counter() - request_started_at)
+                                for event in events.feed(delta):
+                                    yield event
+                    else:
+                        await response.aread()
+                        response_json = response.json()
+                        self._record_usage(response_json.get("usage"))
+                        for event in events.feed(extract_message_content(response_json) or ""):
+                            yield event
+                finally:
+                    await response.aclose()
+                self._observe("elysia_llm_request_seconds", time.perf_counter() - request_started_at, mode="stream")
+
+            for event in events.finish():
+                yield event
+
+        except Exception as e:
+            print(f"Error in stream_prompt: {e}")
+            yield ("done", events.content())
+
+    async def summarize_conversation(self, conversation):
+        """
+        Fold the turns that fell out of the verbatim window into the rolling summary.
+        Returns (summary, pending_offset, folded_count) for `ConversationHistory.apply_summary`,
+        or None on failure.
+        """
+        pending_offset, pending_turns = conversation.snapshot_pending()
+        if not pending_turns:
+            return None
+
+        summary_prompt = "\n".join([
+            f"Update the running summary of a conversation between {self.user_name} and {self.character_name}.",
+            "Keep facts, names, promises, preferences and the emotional state that later replies may rely on.",
+            f"Write it from {self.character_name}'s point of view, in the language of the conversation, "
+            f"in at most {conversation.summary_token_budget} tokens. Reply with the summary text only.",
+            "",
+            "# CURRENT SUMMARY",
+            conversation.summary or "(none)",
+            "",
+            "# TURNS TO ADD",
+            conversation.format_turns(pending_turns, self.user_name, self.character_name),
+        ])
+
+        url, headers = self._chat_endpoint()
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": summary_prompt}],
+            "max_tokens": conversation.summary_token_budget * 2,
+        }
+        try:
+            response = await self._get_async_client().post(url, headers=headers, json=payload)
+            if response.status_code >= 400:
+                self._print_request_error(response)
+                return None
+            response_json = response.json()
+            self._record_usage(response_json.get("usage"))
+            summary = extract_message_content(response_json)
+        except Exception as e:
+            print(f"Error in summarize_conversation: {e}")
+            return None
+
+        if not summary:
+            return None
+        return summary.strip(), pending_offset, len(pending_turns)
+
     def analyze_llm_response(self, responses_json):
         try:
             # item["response"] will select the dictionary which have the key name "response" 
@@ -293,6 +658,10 @@ class LLMHandler:
             f"LLM parse error: {detail}",
         )
 
+    def fallback_dialogues(self):
+        """Every line `_build_fallback_response` can speak, so the server can pre-render them."""
+        return [self._build_fallback_response(issue_type, "")[0] for issue_type in ("api", "parse")]
+
     def process_command_from_responses(self, responses_json_string):
         
         if responses_json_string is None:
@@ -0,0 +1,190 @@
+import json
+
+from text_segmentation import SentenceSegmenter
+
+JSON_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+_STRING_END = object()
+SSE_DONE = "[DONE]"
+
+
+class JsonFieldStreamParser:
+    """
+    Incrementally reads the top-level string fields of a JSON object as it is generated.
+
+    The LLM streams its JSON reply a few characters at a time. `feed` returns
+    `(key, text, is_complete)` events as soon as characters of a top-level string
+    value are known, so `dialogue` can be spoken before the object is closed.
+    Anything before the first "{" (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.unicode_digits = None
+        self.pending_high_surrogate = None
+        self.string_role = None
+        self.expecting_value = False
+        self.current_key = None
+        self.string_buffer = []
+        self.fields = {}
+
+    def feed(self, text):
+        events = []
+        delta = []
+
+        def flush_delta(is_complete=False):
+            if self.string_role == "value" and (delta or is_complete):
+                events.append((self.current_key, "".join(delta), is_complete))
+            delta.clear()
+
+        for char in text:
+            if self.in_string:
+                decoded = self._decode_string_char(char)
+                if decoded is _STRING_END:
+                    flush_delta(is_complete=True)
+                    self._finish_string()
+                elif decoded:
+                    self.string_buffer.append(decoded)
+                    if self.string_role == "value":
+                        delta.append(decoded)
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_buffer = []
+                if self.depth == 1:
+                    self.string_role = "value" if self.expecting_value else "key"
+                else:
+                    self.string_role = None
+            elif char in "{[":
+                self.depth += 1
+                if self.depth > 1:
+                    self.expecting_value = False
+            elif char in "}]":
+                self.depth = max(0, self.depth - 1)
+            elif char == ":" and self.depth == 1:
+                self.expecting_value = True
+            elif char == "," and self.depth == 1:
+                self.expecting_value = False
+                self.current_key = None
+
+        flush_delta()
+        return events
+
+    def _decode_string_char(self, char):
+        if self.unicode_digits is not None:
+            self.unicode_digits += char
+            if len(self.unicode_digits) < 4:
+                return ""
+            try:
+                code_point = int(self.unicode_digits, 16)
+            except ValueError:
+                code_point = 0xFFFD
+            self.unicode_digits = None
+            if 0xD800 <= code_point <= 0xDBFF:
+                self.pending_high_surrogate = code_point
+                return ""
+            if 0xDC00 <= code_point <= 0xDFFF and self.pending_high_surrogate is not None:
+                code_point = 0x10000 + ((self.pending_high_surrogate - 0xD800) << 10) + (code_point - 0xDC00)
+            self.pending_high_surrogate = None
+            return chr(code_point)
+
+        if self.escape:
+            self.escape = False
+            if char == "u":
+                self.unicode_digits = ""
+                return ""
+            return JSON_ESCAPES.get(char, char)
+
+        if char == "\\":
+            self.escape = True
+            return ""
+        if char == '"':
+            return _STRING_END
+        return char
+
+    def _finish_string(self):
+        value = "".join(self.string_buffer)
+        if self.string_role == "key":
+            self.current_key = value
+        elif self.string_role == "value":
+            self.fields[self.current_key] = value
+            self.expecting_value = False
+        self.in_string = False
+        self.string_role = None
+        self.string_buffer = []
+
+
+def sse_line_data(line):
+    """Return the payload of one `data:` line of a server-sent event stream, or None for any other line."""
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    return line[len("data:"):].strip()
+
+
+def parse_stream_chunk(chunk_json):
+    """Return (text delta, usage dict or None) of one streamed chat-completions chunk."""
+    try:
+        chunk = json.loads(chunk_json)
+    except json.JSONDecodeError:
+        return "", None
+    choice = (chunk.get("choices") or [{}])[0]
+    delta = choice.get("delta") or {}
+    return delta.get("content") or choice.get("text") or "", chunk.get("usage")
+
+
+def extract_message_content(response_json):
+    """Return the reply text of a non-streamed chat-completions response."""
+    choice = (response_json.get("choices") or [{}])[0]
+    message = choice.get("message") or {}
+    return message.get("content") or choice.get("text")
+
+
+class DialogueEventStream:
+    """
+    Turns the streamed reply text into the events `LLMHandler.stream_prompt_dialogue_async` yields:
+    ("field", key, value), ("sentence", text) and finally ("done", content).
+    """
+
+    def __init__(self):
+        self.parser = JsonFieldStreamParser()
+        self.segmenter = SentenceSegmenter()
+        self.content_parts = []
+
+    def feed(self, text):
+        self.content_parts.append(text)
+        events = []
+        for key, delta, is_complete in self.parser.feed(text):
+            if key == "dialogue":
+                events.extend(("sentence", sentence) for sentence in self.segmenter.push(delta))
+                if is_complete:
+                    events.extend(("sentence", sentence) for sentence in self.segmenter.flush())
+            if is_complete:
+                events.append(("field", key, self.parser.fields.get(key, "")))
+        return events
+
+    def content(self):
+        return "".join(self.content_parts) if self.content_parts else None
+
+    def finish(self):
+        events = []
+        if self.content_parts and "dialogue" not in self.parser.fields:
+            # Dialogue never closed (truncated reply); still speak what was received
+            events.extend(("sentence", sentence) for sentence in self.segmenter.flush())
+        events.append(("done", self.content()))
+        return events
@@ -0,0 +1,227 @@
+import asyncio
+import bisect
+import json
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the Prometheus histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts for Prometheus plus a window of recent samples for p50/p95/p99."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {}
+        return {f"p{int(q * 100)}": samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """
+    Latency histograms and counters shared by the server and its handlers (thread-safe).
+
+    Series are keyed by metric name plus labels such as stage, voice and model, and are
+    exported as Prometheus text (`render_prometheus`) or as JSON with p50/p95/p99 (`snapshot`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = LatencyHistogram()
+            histogram.observe(max(0.0, seconds))
+
+    def increment(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timed(self, name, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    bounds = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+                    for bound, bucket_count in zip(bounds, histogram.bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "histograms": {
+                    name: [
+                        dict(labels=dict(key), count=histogram.count, sum=round(histogram.total, 6), **histogram.quantiles())
+                        for key, histogram in sorted(series.items())
+                    ]
+                    for name, series in sorted(self._histograms.items())
+                },
+                "counters": {
+                    name: [dict(labels=dict(key), value=value) for key, value in sorted(series.items())]
+                    for name, series in sorted(self._counters.items())
+                },
+            }
+
+
+class TraceWriter:
+    """Appends one JSON line per finished turn to a file from a background thread; drops lines when it falls behind."""
+
+    def __init__(self, path, queue_size=256):
+        self.path = path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="elysia-trace", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Error writing turn trace: {e}")
+
+
+class TurnTrace:
+    """
+    The spans of one turn. Each span is observed into `elysia_turn_stage_seconds` with the
+    turn's labels (voice, model) and, if tracing is enabled, written as one JSON line on `finish()`.
+    """
+
+    def __init__(self, registry, trace_writer=None, started_at=None, context=None, **labels):
+        self.registry = registry
+        self.trace_writer = trace_writer
+        # Trace-only fields (turn id, client address) that would be too many series as labels
+        self.context = context or {}
+        self.labels = labels
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.wall_started_at = time.time()
+        self.spans = {}
+
+    def record(self, stage, seconds):
+        self.spans[stage] = round(seconds, 4)
+        self.registry.observe("elysia_turn_stage_seconds", seconds, stage=stage, **self.labels)
+
+    def mark(self, stage):
+        """Record the time since the turn started, the first time `stage` happens."""
+        if stage not in self.spans:
+            self.record(stage, time.perf_counter() - self.started_at)
+
+    @contextmanager
+    def span(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+
+    def finish(self):
+        self.record("total", time.perf_counter() - self.started_at)
+        if self.trace_writer is not None:
+            self.trace_writer.write(
+                dict(self.context, started_at=self.wall_started_at, labels=self.labels, spans=self.spans)
+            )
+        return self.spans
+
+
+async def serve_metrics(registry, host, port):
+    """Minimal HTTP endpoint: /metrics (Prometheus text) and /metrics.json (p50/p95/p99)."""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Headers are not needed; read them so the client sees a clean close
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", registry.render_prometheus()
+            elif path == "/metrics.json":
+                status, content_type, body = "200 OK", "application/json", json.dumps(registry.snapshot(), ensure_ascii=False)
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+_STREAM_DONE = object()
+
+
+class CancelScope:
+    """
+    Lets the event loop abort blocking I/O that a worker thread is stuck in.
+
+    The worker registers a callback that interrupts what it is waiting on (for example
+    shutting down a socket); `cancel()` runs the callbacks from any thread. A callback
+    added after cancellation runs immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def add_callback(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error while cancelling: {e}")
+
+
+class StageExecutor:
+    """
+    A bounded worker pool for one blocking stage of the turn pipeline (ASR, LLM or TTS).
+
+    Blocking calls are pushed onto the pool's threads so the asyncio event loop keeps
+    serving other clients, pings and close frames while a slow turn is in progress.
+    """
+
+    def __init__(self, name, max_workers, stream_buffer_size=32):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.stream_buffer_size = max(1, int(stream_buffer_size))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"elysia-{name}",
+        )
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, generator_func, *args, cancel_scope=None, **kwargs):
+        """
+        Drive a blocking generator on a worker thread and yield its items asynchronously.
+
+        Items are handed over through a bounded queue, so a slow consumer makes the worker
+        thread wait instead of buffering without limit. If the consumer stops early the
+        worker stops pulling from the generator and closes it. A `cancel_scope` is passed
+        on to the generator and cancelled when the consumer stops early, so a generator
+        blocked on I/O is woken up instead of holding its thread until the next item.
+        """
+        if cancel_scope is not None:
+            kwargs["cancel_scope"] = cancel_scope
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.stream_buffer_size)
+        stop_event = threading.Event()
+
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop_event.is_set():
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    continue
+                except Exception:
+                    return False
+            future.cancel()
+            return False
+
+        def produce():
+            generator = generator_func(*args, **kwargs)
+            try:
+                for item in generator:
+                    if stop_event.is_set() or not put(item):
+                        break
+            except Exception as e:
+                put(e)
+                return
+            finally:
+                generator.close()
+            put(_STREAM_DONE)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        finished = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_DONE:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The worker notices the flag before its next put and closes the generator.
+            stop_event.set()
+            if cancel_scope is not None and not finished:
+                cancel_scope.cancel()
+            producer.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TurnPipeline:
+    """Groups the per-stage worker pools shared by every client connection."""
+
+    def __init__(self, asr_workers=1, tts_workers=2, codec_workers=2):
+        self.asr = StageExecutor("asr", asr_workers)
+        self.tts = StageExecutor("tts", tts_workers)
+        # Audio encoding/decoding for compressed streams and the TTS cache/sample-rate lookups
+        # made before a stream starts; kept apart so none of them queue behind synthesis
+        self.codec = StageExecutor("codec", codec_workers)
+
+    def describe(self):
+        return (
+            f"asr_workers={self.asr.max_workers}, "
+            f"tts_workers={self.tts.max_workers}, "
+            f"codec_workers={self.codec.max_workers}"
+        )
+
+    def shutdown(self):
+        for stage in (self.asr, self.tts, self.codec):
+            stage.shutdown()
@@ -0,0 +1,265 @@
+import os
+import sqlite3
+import threading
+import time
+import wave
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clips (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    lab_mtime_ns INTEGER,
+    duration_seconds REAL,
+    sample_rate INTEGER,
+    transcript TEXT NOT NULL DEFAULT '',
+    audit_score REAL,
+    audit_flags TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clips_by_directory ON clips (directory, file_name);
+"""
+CLIP_COLUMNS = (
+    "path",
+    "directory",
+    "file_name",
+    "size",
+    "mtime_ns",
+    "lab_mtime_ns",
+    "duration_seconds",
+    "sample_rate",
+    "transcript",
+    "audit_score",
+    "audit_flags",
+    "indexed_at",
+)
+GLOB_CHARACTERS = "*?["
+
+
+def _stat_or_none(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _catalog_path(path):
+    """`path` with its directory resolved, the key a clip is stored under (the file itself may be a symlink)."""
+    directory, file_name = os.path.split(os.path.abspath(path))
+    return os.path.join(str(Path(directory).resolve()), file_name)
+
+
+def _read_wav_format(path):
+    """(duration_seconds, sample_rate) from a WAV header, or (None, None) if it cannot be read."""
+    try:
+        with wave.open(path, "rb") as wav_file:
+            sample_rate = wav_file.getframerate()
+            return wav_file.getnframes() / float(sample_rate), sample_rate
+    except (OSError, EOFError, wave.Error, ZeroDivisionError):
+        return None, None
+
+
+def _read_transcript(lab_path):
+    try:
+        with open(lab_path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class ReferenceAudioCatalog:
+    """
+    Duration, sample rate, `.lab` transcript and audit score of every reference clip, in SQLite.
+
+    A directory is listed again only when its mtime changes (a clip or sidecar was added,
+    removed or renamed), and only new or changed clips are re-read. Clips returned by a
+    lookup are re-stat'ed, so a WAV or `.lab` edited in place is still picked up. Audit
+    scores come from task/audit_reference_audio.py and are dropped when their clip changes.
+    Returned paths are fully resolved, like the glob matches config.py used before the catalog.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Voice configs are resolved from whichever worker thread reloads them; the lock serializes access
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _row_to_clip(self, row):
+        return {column: row[column] for column in CLIP_COLUMNS} if row is not None else None
+
+    def _resolved(self, clip):
+        return dict(clip, path=str(Path(clip["path"]).resolve())) if clip is not None else None
+
+    def _index_clip(self, path, wav_stat):
+        lab_path = os.path.splitext(path)[0] + ".lab"
+        lab_stat = _stat_or_none(lab_path)
+        duration_seconds, sample_rate = _read_wav_format(path)
+        clip = {
+            "path": path,
+            "directory": os.path.dirname(path),
+            "file_name": os.path.basename(path),
+            "size": wav_stat.st_size,
+            "mtime_ns": wav_stat.st_mtime_ns,
+            "lab_mtime_ns": lab_stat.st_mtime_ns if lab_stat is not None else None,
+            "duration_seconds": duration_seconds,
+            "sample_rate": sample_rate,
+            "transcript": _read_transcript(lab_path) if lab_stat is not None else "",
+            "audit_score": None,
+            "audit_flags": None,
+            "indexed_at": time.time(),
+        }
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO clips ({', '.join(CLIP_COLUMNS)}) VALUES ({', '.join('?' for _ in CLIP_COLUMNS)})",
+            tuple(clip[column] for column in CLIP_COLUMNS),
+        )
+        return clip
+
+    def _is_current(self, clip, wav_stat, lab_stat):
+        if clip["size"] != wav_stat.st_size or clip["mtime_ns"] != wav_stat.st_mtime_ns:
+            return False
+        return clip["lab_mtime_ns"] == (lab_stat.st_mtime_ns if lab_stat is not None else None)
+
+    def _sync_directory(self, directory):
+        """Bring `directory`'s clips up to date; a stat of the directory when nothing was added or removed."""
+        directory_stat = _stat_or_none(directory)
+        if directory_stat is None:
+            with self._connection:
+                self._connection.execute("DELETE FROM clips WHERE directory = ?", (directory,))
+                self._connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
+            return
+        row = self._connection.execute("SELECT mtime_ns FROM directories WHERE path = ?", (directory,)).fetchone()
+        if row is not None and row["mtime_ns"] == directory_stat.st_mtime_ns:
+            return
+
+        wav_stats = {}
+        lab_stats = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stem, extension = os.path.splitext(entry.name)
+                if extension.lower() == ".wav":
+                    wav_stats[entry.path] = entry.stat()
+                elif extension == ".lab":
+                    lab_stats[os.path.join(directory, stem)] = entry.stat()
+
+        known = {
+            row["path"]: self._row_to_clip(row)
+            for row in self._connection.execute("SELECT * FROM clips WHERE directory = ?", (directory,))
+        }
+        indexed = 0
+        with self._connection:
+            for path in known.keys() - wav_stats.keys():
+                self._connection.execute("DELETE FROM clips WHERE path = ?", (path,))
+            for path, wav_stat in wav_stats.items():
+                clip = known.get(path)
+                lab_stat = lab_stats.get(os.path.splitext(path)[0])
+                if clip is None or not self._is_current(clip, wav_stat, lab_stat):
+                    self._index_clip(path, wav_stat)
+                    indexed += 1
+            self._connection.execute(
+                "INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)",
+                (directory, directory_stat.st_mtime_ns),
+            )
+        if indexed:
+            print(f"Reference audio catalog: indexed {indexed} clip(s) in {directory}")
+
+    def _refresh_clip(self, clip):
+        """`clip` re-read if its WAV or `.lab` changed since it was indexed; None if the WAV is gone."""
+        wav_stat = _stat_or_none(clip["path"])
+        if wav_stat is None:
+            with self._connection:
+                self._connection.execute("DELETE FROM clips WHERE path = ?", (clip["path"],))
+            return None
+        lab_stat = _stat_or_none(os.path.splitext(clip["path"])[0] + ".lab")
+        if self._is_current(clip, wav_stat, lab_stat):
+            return clip
+        with self._connection:
+            return self._index_clip(clip["path"], wav_stat)
+
+    def sync_directory(self, directory):
+        with self._lock:
+            self._sync_directory(str(Path(directory).resolve()))
+
+    def get_clip(self, path):
+        """Catalog entry for one WAV (duration_seconds, sample_rate, transcript, audit_score, ...), or None."""
+        path = _catalog_path(path)
+        with self._lock:
+            self._sync_directory(os.path.dirname(path))
+            row = self._connection.execute("SELECT * FROM clips WHERE path = ?", (path,)).fetchone()
+            return self._resolved(self._refresh_clip(self._row_to_clip(row))) if row is not None else None
+
+    def find_clip(self, pattern, min_seconds=None, max_seconds=None):
+        """
+        First clip, by file name, matching a glob such as ".../Cyrene/*.wav" whose duration is
+        within range. Wildcards are only supported in the file name; returns None if none match.
+        Every candidate is re-stat'ed before its duration is checked, so the range applies to
+        the clips as they are now rather than to the durations stored when they were indexed.
+        """
+        directory, name_pattern = os.path.split(os.path.abspath(pattern))
+        if any(character in directory for character in GLOB_CHARACTERS):
+            raise ValueError(f"Only the file name of a catalog pattern may contain wildcards: {pattern}")
+        directory = str(Path(directory).resolve())
+
+        with self._lock:
+            self._sync_directory(directory)
+            rows = self._connection.execute(
+                "SELECT * FROM clips WHERE directory = ? AND file_name GLOB ? ORDER BY file_name",
+                (directory, name_pattern),
+            ).fetchall()
+            for row in rows:
+                clip = self._refresh_clip(self._row_to_clip(row))
+                if clip is None or clip["duration_seconds"] is None:
+                    continue
+                if min_seconds is not None and clip["duration_seconds"] < min_seconds:
+                    continue
+                if max_seconds is not None and clip["duration_seconds"] > max_seconds:
+                    continue
+                return self._resolved(clip)
+        return None
+
+    def record_audit(self, path, score, flags=""):
+        """Store an audit result for a clip as it is now; returns False if the clip is not catalogued."""
+        path = _catalog_path(path)
+        with self._lock:
+            self._sync_directory(os.path.dirname(path))
+            row = self._connection.execute("SELECT * FROM clips WHERE path = ?", (path,)).fetchone()
+            if row is None or self._refresh_clip(self._row_to_clip(row)) is None:
+                return False
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE clips SET audit_score = ?, audit_flags = ? WHERE path = ?",
+                    (score, flags, path),
+                )
+            return True
+
+
+_open_catalogs = {}
+_open_catalogs_lock = threading.Lock()
+
+
+def open_catalog(db_path):
+    """Shared catalog for `db_path`; config.py is hot-reloaded, so it must not own the connection."""
+    with _open_catalogs_lock:
+        catalog = _open_catalogs.get(db_path)
+        if catalog is None:
+            catalog = ReferenceAudioCatalog(db_path)
+            _open_catalogs[db_path] = catalog
+        return catalog
@@ -0,0 +1,239 @@
+import asyncio
+import base64
+import json
+
+from audio_codecs import CODEC_PCM, UploadDecoder, available_codecs, choose_codec, make_encoder
+from audio_framing import FRAME_TTS_AUDIO, FRAME_TTS_CHUNK, PCMFramer, describe_protocol, pack_frame
+
+
+class ClientSession:
+    """
+    Per-connection state for one Unity client.
+
+    Clients start on the JSON protocol (base64 audio). Sending
+    {"event": "hello", "binary_audio": true} switches audio in both directions to
+    binary frames (see audio_framing.py); control events stay JSON. Adding
+    "asr_partials": true makes the server report partial transcripts of chunked uploads.
+    "audio_codecs": ["opus", "ima_adpcm", "pcm_s16le"] picks the first codec the server
+    supports for TTS audio (announced again in every tts_stream_start), and
+    "upload_codec" says how microphone audio is encoded (see audio_codecs.py).
+    With "barge_in": true a reply that is cut off by new speech or an interrupt event
+    ends with tts_stream_cancelled; other clients get a plain tts_stream_end.
+    """
+
+    def __init__(self, websocket, conversation=None):
+        self.websocket = websocket
+        self.conversation = conversation
+        self.summary_task = None
+        # LLM reply started before the transcript was final (see speculation.py)
+        self.speculation = None
+        self.turn_active = False
+        # Task answering the current turn, cancelled on barge-in
+        self.turn_task = None
+        # AudioStreamWriter of the reply stream the client is receiving, once it has started
+        self.audio_writer = None
+        self.cancel_reason = None
+        self.binary_audio = False
+        self.asr_partials = False
+        self.barge_in = False
+        self.audio_codec = CODEC_PCM
+        self.upload_codec = CODEC_PCM
+        self.upload_decoder = None
+        self.turn_id = 0
+        # metrics.TurnTrace of the turn being answered, if any
+        self.trace = None
+        # Chunked upload in progress (audio_chunk ... audio_end)
+        self.recognizer = None
+        self.partial_decode = None
+
+    def negotiate(self, hello):
+        self.binary_audio = bool(hello.get("binary_audio", False))
+        self.asr_partials = bool(hello.get("asr_partials", False))
+        self.barge_in = bool(hello.get("barge_in", False))
+        self.audio_codec = choose_codec(hello.get("audio_codecs"))
+        self.upload_codec = choose_codec([hello.get("upload_codec", CODEC_PCM)])
+        self.upload_decoder = UploadDecoder(self.upload_codec) if self.upload_codec != CODEC_PCM else None
+        ack = {
+            "event": "hello_ack",
+            "binary_audio": self.binary_audio,
+            "asr_partials": self.asr_partials,
+            "barge_in": self.barge_in,
+            "audio_codec": self.audio_codec,
+            "upload_codec": self.upload_codec,
+            "available_codecs": available_codecs(),
+        }
+        if self.binary_audio:
+            ack.update(describe_protocol())
+        return ack
+
+    def decode_upload(self, payload, sample_rate):
+        """Return (pcm_bytes, sample_rate) for microphone audio in the negotiated upload codec."""
+        if self.upload_decoder is None:
+            return bytes(payload), sample_rate
+        return self.upload_decoder.decode(payload), self.upload_decoder.output_rate(sample_rate)
+
+    def next_turn(self):
+        self.turn_id = (self.turn_id + 1) & 0xFFFF
+        return self.turn_id
+
+    async def send_json(self, message):
+        await self.websocket.send(json.dumps(message))
+
+    async def send_stream_start(self, dialogue, expression, gesture, internal_thought_in_character, sample_rate, encoding=None):
+        message = {
+            "event": "tts_stream_start",
+            "dialogue": dialogue,
+            "expression": expression,
+            "gesture": gesture,
+            "internal_thought_in_character": internal_thought_in_character,
+            "sample_rate": sample_rate,
+            "channels": 1,
+            "sample_width": 2,
+            "audio_format": "pcm_s16le",
+            "audio_transport": "binary" if self.binary_audio else "json",
+            "turn_id": self.turn_id,
+        }
+        if encoding:
+            # The codec's own format and rate (Opus runs at 48 kHz when the TTS rate is 32 kHz)
+            message.update(encoding)
+        await self.send_json(message)
+
+    async def send_audio_chunk(self, seq, chunk):
+        if self.binary_audio:
+            await self.websocket.send(pack_frame(FRAME_TTS_CHUNK, chunk, seq=seq, turn_id=self.turn_id))
+            return
+        await self.send_json({
+            "event": "tts_stream_chunk",
+            "seq": seq,
+            "audio_chunk_base64": base64.b64encode(chunk).decode('utf-8'),
+        })
+
+    async def send_stream_end(self, dialogue, expression, gesture, internal_thought_in_character, chunk_count):
+        await self.send_json({
+            "event": "tts_stream_end",
+            "dialogue": dialogue,
+            "expression": expression,
+            "gesture": gesture,
+            "internal_thought_in_character": internal_thought_in_character,
+            "chunk_count": chunk_count,
+        })
+
+    async def send_stream_cancelled(self, reason):
+        """Tell the client the current reply was abandoned; the audio already sent is all it gets."""
+        writer = self.audio_writer
+        chunk_count = writer.chunk_count if writer is not None else 0
+        if self.barge_in:
+            await self.send_json({
+                "event": "tts_stream_cancelled",
+                "turn_id": self.turn_id,
+                "reason": reason,
+                "stream_started": writer is not None,
+                "chunk_count": chunk_count,
+            })
+        elif writer is not None:
+            # Older clients only know tts_stream_end; it still stops their playback cleanly
+            await self.send_stream_end("", "", "", "", chunk_count)
+
+    async def send_full_response(self, dialogue, expression, gesture, internal_thought_in_character, audio_data):
+        response_for_unity = {
+            "dialogue": dialogue,
+            "expression": expression,
+            "gesture": gesture,
+            "internal_thought_in_character": internal_thought_in_character,
+            "audio_base64": "",
+        }
+        if self.binary_audio:
+            # The WAV follows as a separate binary frame instead of being inlined
+            response_for_unity["audio_binary"] = audio_data is not None
+            response_for_unity["turn_id"] = self.turn_id
+            await self.send_json(response_for_unity)
+            if audio_data is not None:
+                await self.websocket.send(pack_frame(FRAME_TTS_AUDIO, audio_data, turn_id=self.turn_id))
+            return
+
+        if audio_data is not None:
+            response_for_unity["audio_base64"] = base64.b64encode(audio_data).decode('utf-8')
+        await self.send_json(response_for_unity)
+
+
+class AudioStreamWriter:
+    """
+    Sends one streamed TTS reply to the client as evenly paced, frame-aligned chunks.
+
+    PCM is re-framed by PCMFramer and encoded frame by frame in the session's codec
+    (`describe()` gives the tts_stream_start fields for it). Sending waits while the client already has more
+    than `max_lead_seconds` of audio it has not had time to play, or while the socket's
+    write buffer holds more than `write_buffer_limit` bytes. A slow client therefore
+    slows the stream down instead of piling audio up in server memory.
+    """
+
+    def __init__(
+        self,
+        session,
+        sample_rate,
+        frame_ms=40,
+        max_frames_per_message=5,
+        max_lead_seconds=1.5,
+        write_buffer_limit=64 * 1024,
+        opus_bitrate=32000,
+        encode_executor=None,
+    ):
+        self.session = session
+        self.framer = PCMFramer(sample_rate, frame_ms=frame_ms, max_frames_per_message=max_frames_per_message)
+        self.encoder = make_encoder(session.audio_codec, sample_rate, frame_ms=frame_ms, opus_bitrate=opus_bitrate)
+        # ADPCM and Opus encoding is CPU work; on the event loop it would stall every other stream's pacing
+        self.encode_executor = encode_executor if self.encoder.codec != CODEC_PCM else None
+        self.bytes_per_second = sample_rate * self.framer.sample_bytes
+        self.max_lead_seconds = max_lead_seconds
+        self.write_buffer_limit = write_buffer_limit
+        self.chunk_count = 0
+        self.sent_seconds = 0.0
+        self.started_at = None
+
+    def describe(self):
+        return self.encoder.describe()
+
+    async def write(self, data):
+        for payload in self.framer.push(data):
+            await self._send(payload)
+
+    async def finish(self):
+        """Send the buffered tail and return how many chunks the stream had."""
+        for payload in self.framer.flush():
+            await self._send(payload)
+        for encoded in await self._encode(self.encoder.flush):
+            await self._send_encoded(encoded)
+        return self.chunk_count
+
+    async def _encode(self, func, *args):
+        if self.encode_executor is None:
+            return func(*args)
+        return await self.encode_executor.run(func, *args)
+
+    async def _wait_for_client(self):
+        loop = asyncio.get_running_loop()
+        if self.started_at is None:
+            self.started_at = loop.time()
+        lead_seconds = self.sent_seconds - (loop.time() - self.started_at)
+        if lead_seconds > self.max_lead_seconds:
+            await asyncio.sleep(lead_seconds - self.max_lead_seconds)
+
+        transport = getattr(self.session.websocket, "transport", None)
+        while (
+            transport is not None
+            and not transport.is_closing()
+            and transport.get_write_buffer_size() > self.write_buffer_limit
+        ):
+            await asyncio.sleep(0.01)
+
+    async def _send(self, payload):
+        await self._wait_for_client()
+        self.sent_seconds += len(payload) / self.bytes_per_second
+        for encoded in await self._encode(self.encoder.encode, payload):
+            await self._send_encoded(encoded)
+
+    async def _send_encoded(self, encoded):
+        await self.session.send_audio_chunk(self.chunk_count, encoded)
+        if self.chunk_count == 0 and self.session.trace is not None:
+            self.session.trace.mark("first_chunk_sent")
+        self.chunk_count += 1
@@ -0,0 +1,49 @@
+import asyncio
+
+
+class SpeculativeReply:
+    """
+    An LLM reply requested before the transcript is final.
+
+    The reply events are buffered (nothing reaches the client) until the turn claims the
+    reply with `matches()` + `events()`; a transcript that changed in the meantime cancels
+    it instead. `history_turns` records how long the conversation was when the request was
+    built, so a reply is never reused after another turn has been added. An error from the
+    LLM is kept and raised from `events()`, so an unclaimed reply fails silently.
+    """
+
+    def __init__(self, text, history_turns, event_source):
+        self.text = text
+        self.history_turns = history_turns
+        self.queue = asyncio.Queue()
+        self.error = None
+        self.task = asyncio.create_task(self._collect(event_source))
+
+    async def _collect(self, event_source):
+        try:
+            async for event in event_source:
+                await self.queue.put(event)
+        except Exception as e:
+            self.error = e
+        finally:
+            await event_source.aclose()
+            self.queue.put_nowait(None)
+
+    def matches(self, text, history_turns):
+        return self.text == text and self.history_turns == history_turns and not self.task.cancelled()
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def events(self):
+        try:
+            while True:
+                event = await self.queue.get()
+                if event is None:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield event
+        finally:
+            # A turn that stops reading (barge-in) no longer needs the LLM request
+            self.task.cancel()
@@ -1,20 +1,81 @@
+import ctranslate2
 from faster_whisper import WhisperModel
 import pyaudio
 import wave
 import keyboard
 import pyperclip
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_utils import WHISPER_SAMPLE_RATE, pcm16_to_float32, pcm16_to_whisper_input, resample, speech_end_seconds
+
+# These parameters must match the audio from Unity
+UNITY_SAMPLE_RATE = 44100 # Must match the rate in Microphone.Start
+
+DEFAULT_COMPUTE_TYPES = {
+    "cuda": "float16",
+    "cpu": "int8",
+}
+
+
+def resolve_whisper_device(device="auto", compute_type="auto", allow_fallback=True):
+    """
+    Pick the device and compute type for faster-whisper.
+
+    "auto" uses CUDA when a GPU is visible to CTranslate2 and falls back to CPU otherwise,
+    so the backend also starts on CPU-only machines. A compute type the device cannot run
+    (e.g. float16 on most CPUs) is replaced by that device's default, or raises ValueError
+    when `allow_fallback` is False.
+    """
+    device = (device or "auto").lower()
+    if device == "auto":
+        device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+    compute_type = (compute_type or "auto").lower()
+    if compute_type in ("auto", "default"):
+        compute_type = DEFAULT_COMPUTE_TYPES.get(device, "default")
+
+    supported = ctranslate2.get_supported_compute_types(device)
+    if compute_type not in supported:
+        if not allow_fallback:
+            raise ValueError(f"Compute type '{compute_type}' is not supported on {device} (supported: {sorted(supported)})")
+        fallback = DEFAULT_COMPUTE_TYPES.get(device, "default")
+        print(f"Compute type '{compute_type}' is not supported on {device} (supported: {sorted(supported)}); using '{fallback}'.")
+        compute_type = fallback
+    return device, compute_type
+
 
 class SpeechRecognizer:
     def __init__(self):
         model_size = os.getenv("WHISPER_MODEL_SIZE", "large-v3")
+        self.device, self.compute_type = resolve_whisper_device(
+            os.getenv("WHISPER_DEVICE", "auto"),
+            os.getenv("WHISPER_COMPUTE_TYPE", "auto"),
+        )
+        cpu_threads = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+        # num_workers > 1 lets several ASR pool threads decode on the model at the same time
+        num_workers = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
         self.transcribe_language = os.getenv("WHISPER_LANGUAGE", "zh")
         self.transcribe_beam_size = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
         self.transcribe_best_of = int(os.getenv("WHISPER_BEST_OF", "1"))
         self.transcribe_temperature = float(os.getenv("WHISPER_TEMPERATURE", "0"))
         self.use_vad_filter = os.getenv("WHISPER_VAD_FILTER", "true").lower() == "true"
-        self.model = WhisperModel(model_size, device="cuda", compute_type="float16")
-        print("Faster-Whisper model loaded.")
+        self.vad_threshold = float(os.getenv("WHISPER_STREAM_VAD_THRESHOLD", "0.01"))
+        # Writing latest_transcription.txt is only useful for debugging; it never blocks a turn
+        self.save_transcripts = os.getenv("WHISPER_SAVE_TRANSCRIPT", "false").lower() == "true"
+        self.transcript_path = os.getenv("WHISPER_TRANSCRIPT_PATH", "latest_transcription.txt")
+        self._transcript_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="elysia-transcript")
+        self.model = WhisperModel(
+            model_size,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers,
+        )
+        print(f"Faster-Whisper model loaded ({model_size}, device={self.device}, compute_type={self.compute_type}).")
         
     def record_audio(self, filename="temp_recording.wav", sample_rate=16000):
         # Audio recording parameters
@@ -78,53 +139,210 @@ class SpeechRecognizer:
         Returns:
             str: The transcribed text
         """
+        print(f"Transcribing file with faster-whisper: {audio_file_path}")
+        return self._transcribe(audio_file_path)
+
+    def transcribe_audio_data(self, audio_data, sample_rate=UNITY_SAMPLE_RATE):
+        """
+        Transcribes audio data received as bytes.
+        This is the new recipe for handling audio from Unity.
+
+        The raw int16 mono PCM is converted to a float32 16 kHz array in memory and
+        handed straight to faster-whisper, so concurrent turns never share a temp file.
+        """
+        audio_array = pcm16_to_whisper_input(audio_data, sample_rate)
+        return self._transcribe(audio_array)
+
+    def stream_audio_data(self, audio_data, sample_rate=UNITY_SAMPLE_RATE):
+        """Like `transcribe_audio_data`, but yield (start, end, text) per segment as soon as it is decoded."""
+        yield from self.iter_segments(pcm16_to_whisper_input(audio_data, sample_rate))
+
+    def speech_end_seconds(self, audio_data, sample_rate=UNITY_SAMPLE_RATE):
+        """Where speech ends in raw int16 PCM (trailing silence excluded), by the same energy VAD as uploads in chunks."""
+        return speech_end_seconds(pcm16_to_float32(audio_data), sample_rate, self.vad_threshold)
+
+    def iter_segments(self, audio_input):
+        """Yield (start_seconds, end_seconds, text) from faster-whisper's lazy segment generator."""
+        segments, info = self._run_model(audio_input)
+        print(f"Detected language: '{info.language}' with probability {info.language_probability:.2f}")
+        for segment in segments:
+            yield segment.start, segment.end, segment.text
+
+    def _run_model(self, audio_input):
+        #result = self.model.transcribe(audio_file_path, language="en")
+        #transcribed_text = result['text']
+        return self.model.transcribe(
+            audio_input,
+            language=self.transcribe_language,
+            beam_size=self.transcribe_beam_size,
+            best_of=self.transcribe_best_of,
+            temperature=self.transcribe_temperature,
+            condition_on_previous_text=False,
+            vad_filter=self.use_vad_filter
+        )
+
+    def decode_segments(self, audio_array):
+        """Decode a 16 kHz float32 array and return [(start_seconds, end_seconds, text), ...]."""
+        segments, _ = self._run_model(audio_array)
+        return [(segment.start, segment.end, segment.text) for segment in segments]
+
+    def _transcribe(self, audio_input):
         try:
-            print(f"Transcribing file with faster-whisper: {audio_file_path}")
-            #result = self.model.transcribe(audio_file_path, language="en")
-            #transcribed_text = result['text']
-            segments, info = self.model.transcribe(
-                audio_file_path,
-                language=self.transcribe_language,
-                beam_size=self.transcribe_beam_size,
-                best_of=self.transcribe_best_of,
-                temperature=self.transcribe_temperature,
-                condition_on_previous_text=False,
-                vad_filter=self.use_vad_filter
-            )
-            print(f"Detected language: '{info.language}' with probability {info.language_probability:.2f}")
-            transcribed_text = "".join(segment.text for segment in segments).strip()
-            
-            # Save to file and clipboard for consistency
-            with open("latest_transcription.txt", "w", encoding='utf-8') as f:
-                f.write(transcribed_text)
+            transcribed_text = "".join(text for _, _, text in self.iter_segments(audio_input)).strip()
+
+            self.persist_transcript(transcribed_text)
             
             print(f"Transcription complete: {transcribed_text}")
             return transcribed_text
             
         except Exception as e:
-            print(f"Error transcribing file: {e}")
+            print(f"Error transcribing audio: {e}")
             return f"Error during transcription: {str(e)}"
-        
-    
-    def transcribe_audio_data(self, audio_data):
-        """
-        Transcribes audio data received as bytes.
-        This is the new recipe for handling audio from Unity.
-        """
-        temp_filename = "temp_recording.wav"
 
-        # These parameters must match the audio from Unity
-        CHANNELS = 1
-        SAMPLE_WIDTH = 2  # 2 bytes for 16-bit audio
-        FRAME_RATE = 44100 # Must match the rate in Microphone.Start
+    def persist_transcript(self, transcribed_text):
+        if self.save_transcripts:
+            self._transcript_writer.submit(self._save_transcript, transcribed_text)
+
+    def _save_transcript(self, transcribed_text):
+        try:
+            with open(self.transcript_path, "w", encoding='utf-8') as f:
+                f.write(transcribed_text)
+        except OSError as e:
+            print(f"Error saving transcript: {e}")
+
+
+class IncrementalRecognizer:
+    """
+    Transcribes one utterance while it is still being uploaded in chunks.
+
+    Audio is buffered at the client rate. Every `decode_interval` seconds of new speech the
+    uncommitted buffer is decoded; segments that come out identical in two consecutive
+    decodes (all but the newest one) are committed and their audio dropped from the buffer,
+    so later decodes only cover the unstable tail. A simple energy VAD skips decodes while
+    nothing has been said and triggers one more decode as soon as trailing silence
+    suggests the user has stopped, which `finish()` reuses if no speech followed.
+    """
+
+    def __init__(self, recognizer, sample_rate=UNITY_SAMPLE_RATE):
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.decode_interval = float(os.getenv("WHISPER_STREAM_DECODE_INTERVAL", "1.0"))
+        self.end_silence_seconds = float(os.getenv("WHISPER_STREAM_END_SILENCE", "0.6"))
+        self.vad_threshold = float(os.getenv("WHISPER_STREAM_VAD_THRESHOLD", "0.01"))
+        self.vad_frame_size = max(1, int(sample_rate * 0.03))
+
+        self.lock = threading.Lock()
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.pending_bytes = b""
+        self.committed_segments = []
+        self.previous_tentative = []
+        self.tentative_segments = []
+        self.speech_detected = False
+        self.trailing_silence_seconds = 0.0
+        self.samples_since_decode = 0
+        self.end_of_speech_result = None
+        self.total_samples = 0
+
+    def add_audio(self, pcm_bytes):
+        """Append raw int16 PCM; returns True when a partial decode is worth scheduling."""
+        data = self.pending_bytes + bytes(pcm_bytes)
+        usable_length = len(data) - (len(data) % 2)
+        self.pending_bytes = data[usable_length:]
+        samples = pcm16_to_float32(data[:usable_length])
+        if len(samples) == 0:
+            return False
 
-        # This is the magic: we create a valid WAV file from the raw data
-        with wave.open(temp_filename, 'wb') as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(SAMPLE_WIDTH)
-            wf.setframerate(FRAME_RATE)
-            wf.writeframes(audio_data)
+        with self.lock:
+            self.audio = np.concatenate((self.audio, samples))
+            self.total_samples += len(samples)
+            self.samples_since_decode += len(samples)
+            self._update_vad(samples)
+            if self.speech_detected and self.trailing_silence_seconds < self.end_silence_seconds:
+                # New speech invalidates an earlier end-of-speech decode
+                self.end_of_speech_result = None
+            return self._should_decode()
 
-        # Now we just call our existing transcribe_file method.
-        return self.transcribe_file(temp_filename)
+    def _update_vad(self, samples):
+        frame_count = len(samples) // self.vad_frame_size
+        if frame_count == 0:
+            return
+        frames = samples[: frame_count * self.vad_frame_size].reshape(frame_count, self.vad_frame_size)
+        voiced = np.sqrt(np.mean(np.square(frames), axis=1)) >= self.vad_threshold
+        frame_seconds = self.vad_frame_size / float(self.sample_rate)
+        if voiced.any():
+            self.speech_detected = True
+            last_voiced = int(np.nonzero(voiced)[0][-1])
+            self.trailing_silence_seconds = (frame_count - 1 - last_voiced) * frame_seconds
+        else:
+            self.trailing_silence_seconds += frame_count * frame_seconds
 
+    def _should_decode(self):
+        if not self.speech_detected:
+            return False
+        if self.trailing_silence_seconds >= self.end_silence_seconds and self.end_of_speech_result is None:
+            return True
+        return self.samples_since_decode >= self.decode_interval * self.sample_rate
+
+    def decode_partial(self):
+        """Decode the uncommitted audio, commit stable segments and return the partial transcript."""
+        with self.lock:
+            snapshot = self.audio.copy()
+            snapshot_samples = self.total_samples
+            self.samples_since_decode = 0
+            at_end_of_speech = self.trailing_silence_seconds >= self.end_silence_seconds
+
+        segments = self._decode(snapshot)
+
+        with self.lock:
+            stable_count = 0
+            for previous, current in zip(self.previous_tentative, segments[:-1]):
+                if previous[2].strip() != current[2].strip():
+                    break
+                stable_count += 1
+
+            if stable_count:
+                self.committed_segments.extend(segment[2] for segment in segments[:stable_count])
+                trim_samples = min(len(snapshot), int(segments[stable_count - 1][1] * self.sample_rate))
+                self.audio = self.audio[trim_samples:]
+                segments = segments[stable_count:]
+
+            self.previous_tentative = segments
+            self.tentative_segments = [segment[2] for segment in segments]
+            if at_end_of_speech and snapshot_samples == self.total_samples:
+                self.end_of_speech_result = self.tentative_segments
+            return self.partial_text()
+
+    def partial_text(self):
+        return "".join(self.committed_segments + self.tentative_segments).strip()
+
+    def end_of_speech_text(self):
+        """The transcript `finish()` will return if no more speech arrives, or None before end of speech."""
+        with self.lock:
+            if self.end_of_speech_result is None:
+                return None
+            return "".join(self.committed_segments + self.end_of_speech_result).strip()
+
+    def finish(self):
+        """Return the final transcript once the client signals the end of the utterance."""
+        with self.lock:
+            if self.end_of_speech_result is not None:
+                final_segments = self.end_of_speech_result
+                snapshot = None
+            else:
+                snapshot = self.audio.copy()
+
+        if snapshot is not None:
+            final_segments = [segment[2] for segment in self._decode(snapshot)] if len(snapshot) else []
+
+        transcribed_text = "".join(self.committed_segments + final_segments).strip()
+        self.recognizer.persist_transcript(transcribed_text)
+        print(f"Streaming transcription complete: {transcribed_text}")
+        return transcribed_text
+
+    def _decode(self, samples):
+        try:
+            audio_array = resample(samples, self.sample_rate, WHISPER_SAMPLE_RATE)
+            return self.recognizer.decode_segments(audio_array)
+        except Exception as e:
+            print(f"Error during streaming transcription: {e}")
+            return []
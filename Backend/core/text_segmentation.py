@@ -0,0 +1,77 @@
+SENTENCE_TERMINATORS = set("。！？!?；;…\n")
+CLOSING_PUNCTUATION = set("」』”’)）】》~～♪")
+
+
+def _spoken_length(sentence):
+    """Characters of `sentence` other than punctuation and whitespace."""
+    return sum(
+        1
+        for char in sentence
+        if not char.isspace() and char not in SENTENCE_TERMINATORS and char not in CLOSING_PUNCTUATION and char != "."
+    )
+
+
+class SentenceSegmenter:
+    """
+    Splits text that arrives in pieces into complete sentences.
+
+    A sentence ends at Chinese/English terminal punctuation (including runs such as
+    "……" or "！？") plus any closing quotes or brackets right after it. A "." only
+    ends a sentence when it is followed by whitespace, so decimals and abbreviations
+    inside a token are left alone. Sentences with fewer than `min_chars` characters
+    besides punctuation, such as "嗯。", are merged into the next one.
+    """
+
+    def __init__(self, min_chars=2):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def push(self, text):
+        """Add more text and return the sentences completed by it."""
+        if not text:
+            return []
+        self.buffer += text
+        sentences = []
+        while True:
+            boundary = self._find_boundary(self.buffer)
+            if boundary is None:
+                break
+            sentence = self.buffer[:boundary].strip()
+            # Too short to voice on its own (e.g. a lone "嗯。"); keep it with the next sentence.
+            while boundary is not None and _spoken_length(sentence) < self.min_chars:
+                boundary = self._find_boundary(self.buffer, start=boundary)
+                if boundary is not None:
+                    sentence = self.buffer[:boundary].strip()
+            if boundary is None:
+                break
+            self.buffer = self.buffer[boundary:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the text is complete."""
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return [remainder] if remainder else []
+
+    def _find_boundary(self, text, start=0):
+        index = start
+        length = len(text)
+        while index < length:
+            char = text[index]
+            if char in SENTENCE_TERMINATORS or (char == "." and index + 1 < length and text[index + 1].isspace()):
+                end = index + 1
+                while end < length and (text[end] in SENTENCE_TERMINATORS or text[end] in CLOSING_PUNCTUATION):
+                    end += 1
+                if end == length and char != "\n":
+                    # More terminators or a closing quote may still be on the way.
+                    return None
+                return end
+            index += 1
+        return None
+
+
+def split_sentences(text, min_chars=2):
+    segmenter = SentenceSegmenter(min_chars=min_chars)
+    return segmenter.push(text) + segmenter.flush()
@@ -0,0 +1,147 @@
+import glob
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+from tts_cache import pcm_to_wav_bytes, wav_bytes_to_pcm
+
+
+class TTSArchive:
+    """
+    Keeps recent TTS outputs on disk without touching the filesystem on the request path.
+
+    `submit()` only enqueues; a single writer thread saves each output as
+    `tts_<time>_<seq>.wav` plus a `.json` sidecar (text, voice, duration, ...), refreshes
+    `latest_tts_output.wav` when asked, and deletes the oldest entries beyond
+    `max_files` / `max_bytes`. When the queue is full the output is dropped, never waited on.
+    `write_latest()` replaces `latest_tts_output.wav` right away for callers that open it
+    next; queued entries submitted before it no longer touch that file.
+    """
+
+    def __init__(self, archive_dir, latest_path, max_files=50, max_bytes=100 * 1024 * 1024, queue_size=32, enabled=True):
+        self.archive_dir = archive_dir
+        self.latest_path = latest_path
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.dropped = 0
+        self._sequence = itertools.count(1)
+        # Sequence of whatever last wrote latest_path; older queued entries must not overwrite it
+        self._latest_lock = threading.Lock()
+        self._latest_sequence = 0
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._entries = []
+        self._total_bytes = 0
+        self._thread = None
+        if enabled:
+            self._thread = threading.Thread(target=self._run, name="elysia-tts-archive", daemon=True)
+            self._thread.start()
+
+    def submit(self, audio_data=None, pcm=None, sample_rate=None, update_latest=True, **metadata):
+        """Queue a WAV (`audio_data`) or raw PCM (`pcm` + `sample_rate`) for archiving."""
+        if not self.enabled:
+            return False
+        entry = {
+            "audio_data": audio_data,
+            "pcm": pcm,
+            "sample_rate": sample_rate,
+            "update_latest": update_latest,
+            "metadata": dict(metadata, created_at=time.time(), sequence=next(self._sequence)),
+        }
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def write_latest(self, audio_data):
+        """Replace `latest_path` now, on the caller's thread; works with the archive disabled too."""
+        with self._latest_lock:
+            self._replace_latest(audio_data, next(self._sequence))
+
+    def close(self, timeout=5.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _scan_existing(self):
+        # A crash between the two writes of an entry leaves a sidecar without its WAV
+        for json_path in glob.glob(os.path.join(self.archive_dir, "tts_*.json")):
+            if not os.path.exists(os.path.splitext(json_path)[0] + ".wav"):
+                try:
+                    os.remove(json_path)
+                except OSError:
+                    pass
+        for wav_path in sorted(glob.glob(os.path.join(self.archive_dir, "tts_*.wav"))):
+            try:
+                size = os.path.getsize(wav_path)
+            except OSError:
+                continue
+            self._entries.append((wav_path, size))
+            self._total_bytes += size
+        self._enforce_limits()
+
+    def _run(self):
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._scan_existing()
+        except OSError as e:
+            print(f"Error preparing TTS archive: {e}")
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            try:
+                self._write(entry)
+            except Exception as e:
+                print(f"Error archiving TTS output: {e}")
+
+    def _write(self, entry):
+        audio_data, pcm, sample_rate = entry["audio_data"], entry["pcm"], entry["sample_rate"]
+        if audio_data is None:
+            audio_data = pcm_to_wav_bytes(pcm, sample_rate)
+        else:
+            pcm, sample_rate = wav_bytes_to_pcm(audio_data) or (b"", None)
+        metadata = entry["metadata"]
+        metadata["sample_rate"] = sample_rate
+        metadata["duration_seconds"] = round(len(pcm) / 2.0 / sample_rate, 3) if sample_rate else None
+        metadata["bytes"] = len(audio_data)
+
+        if entry["update_latest"]:
+            with self._latest_lock:
+                if metadata["sequence"] > self._latest_sequence:
+                    self._replace_latest(audio_data, metadata["sequence"])
+
+        # Zero-padded milliseconds keep the files in creation order when sorted by name
+        base_name = f"tts_{int(metadata['created_at'] * 1000):015d}_{metadata['sequence']:06d}"
+        wav_path = os.path.join(self.archive_dir, base_name + ".wav")
+        with open(wav_path, "wb") as f:
+            f.write(audio_data)
+        with open(os.path.join(self.archive_dir, base_name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+        self._entries.append((wav_path, len(audio_data)))
+        self._total_bytes += len(audio_data)
+        self._enforce_limits()
+
+    def _replace_latest(self, audio_data, sequence):
+        temp_path = self.latest_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(audio_data)
+        os.replace(temp_path, self.latest_path)
+        self._latest_sequence = sequence
+
+    def _enforce_limits(self):
+        while self._entries and (len(self._entries) > self.max_files or self._total_bytes > self.max_bytes):
+            wav_path, size = self._entries.pop(0)
+            self._total_bytes -= size
+            for path in (wav_path, os.path.splitext(wav_path)[0] + ".json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+import requests
+
+
+class TTSBackend:
+    """One GPT-SoVITS api_v2 server and the weights it currently has loaded."""
+
+    def __init__(self, api_url):
+        self.api_url = api_url.rstrip("/")
+        self.session = requests.Session()
+        self.gpt_weights = None
+        self.sovits_weights = None
+        self.in_flight = 0
+        self.switching = False
+        self.requests_served = 0
+        self.weight_switches = 0
+
+    def holds(self, gpt_weights, sovits_weights):
+        return not self.switching and self.gpt_weights == gpt_weights and self.sovits_weights == sovits_weights
+
+    def describe(self):
+        return {
+            "api_url": self.api_url,
+            "gpt_weights": os.path.basename(self.gpt_weights) if self.gpt_weights else None,
+            "sovits_weights": os.path.basename(self.sovits_weights) if self.sovits_weights else None,
+            "in_flight": self.in_flight,
+            "requests_served": self.requests_served,
+            "weight_switches": self.weight_switches,
+        }
+
+
+class TTSBackendLease:
+    """A backend reserved for one request with the requested weights loaded; release it when the request ends."""
+
+    def __init__(self, pool, backend):
+        self.pool = pool
+        self.backend = backend
+        self.released = False
+
+    @property
+    def api_url(self):
+        return self.backend.api_url
+
+    @property
+    def session(self):
+        return self.backend.session
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool._release(self.backend)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class TTSBackendPool:
+    """
+    Routes TTS requests across several GPT-SoVITS servers by the weights they hold.
+
+    A request goes to a server that already has its GPT/SoVITS weights loaded (the one
+    with the fewest requests in flight when several do); otherwise to an idle server,
+    which is switched to the new weights first. Weights are never switched under a
+    request that is still running: when every server is busy with other weights the
+    request waits for one to free up.
+    """
+
+    def __init__(self, api_urls, request_timeout=120, log=print, metrics=None):
+        self.backends = [TTSBackend(api_url) for api_url in api_urls]
+        self.request_timeout = request_timeout
+        self.log = log
+        self.metrics = metrics
+        self._condition = threading.Condition()
+
+    @property
+    def api_urls(self):
+        return [backend.api_url for backend in self.backends]
+
+    def _pick(self, gpt_weights, sovits_weights):
+        holding = [backend for backend in self.backends if backend.holds(gpt_weights, sovits_weights)]
+        if holding:
+            return min(holding, key=lambda backend: backend.in_flight), False
+        idle = [backend for backend in self.backends if backend.in_flight == 0]
+        if idle:
+            # Prefer a server that at least has one of the two models already
+            return min(
+                idle,
+                key=lambda backend: (
+                    (backend.gpt_weights != gpt_weights) + (backend.sovits_weights != sovits_weights),
+                    backend.requests_served,
+                ),
+            ), True
+        return None, False
+
+    def acquire(self, gpt_weights, sovits_weights, timeout=None):
+        """Return a TTSBackendLease with the weights loaded, or None if loading failed or timed out."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._pick(gpt_weights, sovits_weights)[0] is not None,
+                timeout=timeout if timeout is not None else self.request_timeout,
+            ):
+                print("No TTS backend became available in time.")
+                return None
+            backend, needs_switch = self._pick(gpt_weights, sovits_weights)
+            backend.in_flight += 1
+            backend.switching = needs_switch
+
+        lease = TTSBackendLease(self, backend)
+        if needs_switch:
+            switch_started_at = time.perf_counter()
+            try:
+                loaded = self._load_weights(backend, gpt_weights, sovits_weights)
+            except requests.RequestException as e:
+                print(f"Error switching weights on {backend.api_url}: {e}")
+                backend.gpt_weights = backend.sovits_weights = None
+                loaded = False
+            with self._condition:
+                backend.switching = False
+            if self.metrics is not None:
+                self.metrics.observe("elysia_tts_weight_switch_seconds", time.perf_counter() - switch_started_at, backend=backend.api_url)
+                self.metrics.increment("elysia_tts_weight_switches_total", backend=backend.api_url, loaded=loaded)
+            if not loaded:
+                lease.release()
+                return None
+        with self._condition:
+            backend.requests_served += 1
+        return lease
+
+    def _release(self, backend):
+        with self._condition:
+            backend.in_flight -= 1
+            self._condition.notify_all()
+
+    def _load_weights(self, backend, gpt_weights, sovits_weights):
+        # The backend is reserved and marked switching, so no other request can pick it meanwhile
+        if backend.gpt_weights != gpt_weights:
+            self.log(f"switching_gpt={os.path.basename(gpt_weights)} backend={backend.api_url}")
+            response = backend.session.get(
+                f"{backend.api_url}/set_gpt_weights",
+                params={"weights_path": gpt_weights},
+                timeout=self.request_timeout,
+            )
+            if response.status_code != 200:
+                print(f"Error setting GPT weights on {backend.api_url}: {response.text}")
+                backend.gpt_weights = None
+                return False
+            backend.gpt_weights = gpt_weights
+            backend.weight_switches += 1
+
+        if backend.sovits_weights != sovits_weights:
+            self.log(f"switching_sovits={os.path.basename(sovits_weights)} backend={backend.api_url}")
+            response = backend.session.get(
+                f"{backend.api_url}/set_sovits_weights",
+                params={"weights_path": sovits_weights},
+                timeout=self.request_timeout,
+            )
+            if response.status_code != 200:
+                print(f"Error setting SoVITS weights on {backend.api_url}: {response.text}")
+                backend.sovits_weights = None
+                return False
+            backend.sovits_weights = sovits_weights
+            backend.weight_switches += 1
+        return True
+
+    def describe(self):
+        with self._condition:
+            return [backend.describe() for backend in self.backends]
@@ -0,0 +1,251 @@
+import hashlib
+import io
+import json
+import os
+import re
+import struct
+import threading
+import unicodedata
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def normalize_cache_text(text):
+    """Equivalent spellings of a line (full-width forms, stray whitespace) share one entry."""
+    normalized = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def pcm_to_wav_bytes(pcm_bytes, sample_rate, channels=1, sample_width=2):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_bytes)
+    return buffer.getvalue()
+
+
+def wav_bytes_to_pcm(wav_bytes):
+    """Return (pcm_bytes, sample_rate) for a mono 16-bit WAV, or None if it is anything else."""
+    try:
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+            if wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2:
+                return None
+            return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()
+    except (EOFError, wave.Error):
+        return None
+
+
+def parse_wav_header(data):
+    """
+    Return (sample_rate, data_offset) for the start of a WAV stream, or None while `data`
+    is too short to tell. Streamed WAVs have no final length, so only the chunk layout is read.
+    Raises ValueError if `data` is not a WAV.
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("not a WAV stream")
+    offset = 12
+    sample_rate = None
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        if chunk_id == b"data":
+            return (sample_rate, offset + 8) if sample_rate else None
+        if chunk_id == b"fmt ":
+            if offset + 16 > len(data):
+                return None
+            (sample_rate,) = struct.unpack_from("<I", data, offset + 12)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+class CachedAudio:
+    __slots__ = ("pcm", "sample_rate")
+
+    def __init__(self, pcm, sample_rate):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+
+    @property
+    def duration_seconds(self):
+        return len(self.pcm) / 2.0 / self.sample_rate if self.sample_rate else 0.0
+
+
+class TTSAudioCache:
+    """
+    Content-addressed cache of synthesized speech with an LRU memory tier and a
+    size-bounded disk tier (one WAV per entry, least recently used evicted first).
+
+    Entries are raw mono int16 PCM plus its sample rate, so the same entry can answer
+    both `text_to_speech` (re-wrapped as WAV) and `text_to_speech_stream` (re-chunked).
+    Pinned entries (pre-rendered fallback/filler lines) are never evicted from memory.
+    """
+
+    def __init__(self, cache_dir, memory_limit_bytes, disk_limit_bytes, enabled=True):
+        self.cache_dir = cache_dir
+        self.memory_limit_bytes = memory_limit_bytes
+        self.disk_limit_bytes = disk_limit_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._pinned = set()
+        self._disk_entries = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="elysia-tts-cache")
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "saved_audio_seconds": 0.0,
+        }
+        if self.enabled and self.disk_limit_bytes > 0:
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(text, **voice_settings):
+        key_material = {"text": normalize_cache_text(text)}
+        key_material.update(voice_settings)
+        encoded = json.dumps(key_material, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_disk_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".wav"):
+                stat_result = entry.stat()
+                entries.append((stat_result.st_mtime, entry.name[:-4], stat_result.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get(self, key):
+        """Cached audio for `key`, or None; counted in the hit-rate stats, so only call it to serve audio."""
+        if not self.enabled:
+            return None
+
+        cached, tier = self._lookup(key)
+        with self._lock:
+            if cached is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats[f"{tier}_hits"] += 1
+                self._stats["saved_audio_seconds"] += cached.duration_seconds
+        return cached
+
+    def peek(self, key):
+        """Like get(), but leaves the stats alone; for warm-up and other probes."""
+        if not self.enabled:
+            return None
+        return self._lookup(key)[0]
+
+    def contains(self, key):
+        """Whether `key` is cached in memory or on disk, without reading it or touching the stats."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            return key in self._memory or key in self._disk_entries
+
+    def _lookup(self, key):
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached, "memory"
+            on_disk = key in self._disk_entries
+
+        if on_disk:
+            try:
+                with open(self._disk_path(key), "rb") as cache_file:
+                    decoded = wav_bytes_to_pcm(cache_file.read())
+                os.utime(self._disk_path(key))
+            except OSError:
+                decoded = None
+            if decoded is not None:
+                cached = CachedAudio(*decoded)
+                with self._lock:
+                    self._disk_entries.move_to_end(key)
+                    self._remember(key, cached)
+                return cached, "disk"
+        return None, None
+
+    def put(self, key, pcm, sample_rate, pinned=False):
+        if not self.enabled or not pcm or not sample_rate:
+            return None
+
+        cached = CachedAudio(bytes(pcm), sample_rate)
+        with self._lock:
+            self._stats["stores"] += 1
+            if pinned:
+                self._pinned.add(key)
+            self._remember(key, cached)
+            write_to_disk = self.disk_limit_bytes > 0 and key not in self._disk_entries
+        if write_to_disk:
+            # Disk writes never hold up the request that produced the audio
+            self._disk_writer.submit(self._write_disk_entry, key, cached)
+        return cached
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def _remember(self, key, cached):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous.pcm)
+        self._memory[key] = cached
+        self._memory_bytes += len(cached.pcm)
+
+        for candidate in list(self._memory):
+            if self._memory_bytes <= self.memory_limit_bytes:
+                break
+            if candidate in self._pinned or candidate == key:
+                continue
+            self._memory_bytes -= len(self._memory.pop(candidate).pcm)
+
+    def _write_disk_entry(self, key, cached):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            wav_bytes = pcm_to_wav_bytes(cached.pcm, cached.sample_rate)
+            temp_path = self._disk_path(key) + ".tmp"
+            with open(temp_path, "wb") as cache_file:
+                cache_file.write(wav_bytes)
+            os.replace(temp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Error writing TTS cache entry: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = len(wav_bytes)
+            self._disk_bytes += len(wav_bytes)
+            self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_limit_bytes and self._disk_entries:
+            key, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_entries"] = len(self._disk_entries)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
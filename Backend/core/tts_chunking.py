@@ -0,0 +1,154 @@
+import threading
+
+from text_segmentation import CLOSING_PUNCTUATION, split_sentences
+
+CLAUSE_TERMINATORS = set("，,、：:—")
+
+
+def join_segments(left, right):
+    """Concatenate two pieces of a reply, keeping a space between words of space-separated languages."""
+    if left and right and left[-1].isascii() and left[-1] not in " \n" and right[0].isascii():
+        return f"{left} {right}"
+    return left + right
+
+
+def split_clauses(sentence):
+    """Split a sentence after each comma-like mark, keeping the punctuation with its clause."""
+    clauses = []
+    start = 0
+    index = 0
+    while index < len(sentence):
+        if sentence[index] in CLAUSE_TERMINATORS:
+            end = index + 1
+            while end < len(sentence) and (sentence[end] in CLAUSE_TERMINATORS or sentence[end] in CLOSING_PUNCTUATION):
+                end += 1
+            clauses.append(sentence[start:end])
+            start = index = end
+            continue
+        index += 1
+    if start < len(sentence):
+        clauses.append(sentence[start:])
+    return [clause for clause in clauses if clause.strip()]
+
+
+class VoiceSpeed:
+    """Moving averages of how fast one voice is synthesized and how long its audio runs, per character."""
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.first_chunk_seconds_per_char = None
+        self.synthesis_seconds_per_char = None
+        self.audio_seconds_per_char = None
+        self.samples = 0
+
+    def _blend(self, previous, value):
+        return value if previous is None else previous + self.smoothing * (value - previous)
+
+    def record(self, chars, first_chunk_seconds, synthesis_seconds, audio_seconds):
+        chars = max(1, chars)
+        self.first_chunk_seconds_per_char = self._blend(self.first_chunk_seconds_per_char, first_chunk_seconds / chars)
+        self.synthesis_seconds_per_char = self._blend(self.synthesis_seconds_per_char, synthesis_seconds / chars)
+        self.audio_seconds_per_char = self._blend(self.audio_seconds_per_char, audio_seconds / chars)
+        self.samples += 1
+
+    def describe(self):
+        return {
+            "samples": self.samples,
+            "first_chunk_seconds_per_char": self.first_chunk_seconds_per_char,
+            "synthesis_seconds_per_char": self.synthesis_seconds_per_char,
+            "audio_seconds_per_char": self.audio_seconds_per_char,
+        }
+
+
+class TTSChunkingPolicy:
+    """
+    Decides where a reply is cut into TTS requests so the first audio arrives quickly.
+
+    The first segment is a short clause sized so that, at the voice's measured speed, its
+    first chunk is back within `first_audio_target` seconds. Later segments grow: each may
+    be as long as the audio already scheduled ahead of it can cover (at least `growth`
+    times the previous one), and they always end on a sentence boundary so the rest of the
+    reply keeps natural prosody. Until a voice has been measured, `default_first_chars` is used.
+    """
+
+    def __init__(
+        self,
+        first_audio_target=0.8,
+        min_first_chars=4,
+        max_segment_chars=120,
+        default_first_chars=12,
+        growth=2.0,
+    ):
+        self.first_audio_target = first_audio_target
+        self.min_first_chars = min_first_chars
+        self.max_segment_chars = max_segment_chars
+        self.default_first_chars = default_first_chars
+        self.growth = growth
+        self._lock = threading.Lock()
+        self._speeds = {}
+
+    def record(self, voice_name, chars, first_chunk_seconds, synthesis_seconds, audio_seconds):
+        with self._lock:
+            speed = self._speeds.setdefault(voice_name, VoiceSpeed())
+            speed.record(chars, first_chunk_seconds, synthesis_seconds, audio_seconds)
+            return speed.describe()
+
+    def first_segment_chars(self, voice_name):
+        with self._lock:
+            speed = self._speeds.get(voice_name)
+            seconds_per_char = speed.first_chunk_seconds_per_char if speed is not None else None
+        if not seconds_per_char:
+            return self.default_first_chars
+        target_chars = int(self.first_audio_target / seconds_per_char)
+        return max(self.min_first_chars, min(self.max_segment_chars, target_chars))
+
+    def _next_segment_limit(self, voice_name, previous_limit, scheduled_chars):
+        limit = previous_limit * self.growth
+        with self._lock:
+            speed = self._speeds.get(voice_name)
+            if speed is not None and speed.synthesis_seconds_per_char and speed.audio_seconds_per_char:
+                # A segment can take as long to synthesize as the audio queued before it plays
+                covered_seconds = scheduled_chars * speed.audio_seconds_per_char
+                limit = max(limit, covered_seconds / speed.synthesis_seconds_per_char)
+        return int(min(self.max_segment_chars, limit))
+
+    def split_first_segment(self, sentence, voice_name):
+        """Return [head, rest] with a short leading clause, or [sentence] when it is short enough already."""
+        first_chars = self.first_segment_chars(voice_name)
+        if len(sentence) <= first_chars:
+            return [sentence]
+        clauses = split_clauses(sentence)
+        head = clauses[0]
+        for clause in clauses[1:]:
+            if len(head) + len(clause) > first_chars:
+                break
+            head += clause
+        rest = sentence[len(head):]
+        # A lone interjection is too short to sound natural on its own
+        if len(head.strip()) < self.min_first_chars or not rest.strip():
+            return [sentence]
+        return [head.strip(), rest.strip()]
+
+    def plan(self, text, voice_name):
+        """Cut a complete reply into segments: a short first clause, then growing runs of whole sentences."""
+        sentences = split_sentences(text)
+        if not sentences:
+            return [text] if text else []
+
+        segments = self.split_first_segment(sentences[0], voice_name)
+        pending = segments[1:] + sentences[1:]
+        segments = segments[:1]
+        scheduled_chars = len(segments[0])
+        limit = max(len(segments[0]), self.min_first_chars)
+        while pending:
+            limit = self._next_segment_limit(voice_name, limit, scheduled_chars)
+            segment = pending.pop(0)
+            while pending and len(segment) + len(pending[0]) <= limit:
+                segment = join_segments(segment, pending.pop(0))
+            segments.append(segment)
+            scheduled_chars += len(segment)
+        return segments
+
+    def describe(self):
+        with self._lock:
+            return {voice_name: speed.describe() for voice_name, speed in self._speeds.items()}
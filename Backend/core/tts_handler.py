@@ -1,15 +1,37 @@
+import functools
 import glob
-import importlib
 import os
 import re
+import socket
+import threading
 import time
 from io import BytesIO
 from pathlib import Path
 
 import pygame
-import requests
 
 import config as runtime_config
+from tts_archive import TTSArchive
+from tts_backend_pool import TTSBackendPool
+from tts_cache import TTSAudioCache, parse_wav_header, pcm_to_wav_bytes, wav_bytes_to_pcm
+from tts_chunking import TTSChunkingPolicy
+from voice_registry import VoiceConfigRegistry
+from weights_metadata import DEFAULT_SAMPLE_RATE, WeightsMetadataIndex
+
+# A WAV header that has not ended within this many bytes is not treated as one
+WAV_HEADER_PROBE_BYTES = 4096
+
+
+def abort_response(response):
+    """Shut down the socket under a streaming `requests` response so a read blocked on it returns at once."""
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
 
 class TTSHandler:
     """
@@ -19,10 +41,20 @@ class TTSHandler:
     It sends text to the API, receives audio data, and plays it locally.
     """
     
-    def __init__(self, api_url=None, gpt_url=None, sovits_url=None, debug_mode=False, voice_name=None, auto_reload_config=True):
+    def __init__(self, api_url=None, gpt_url=None, sovits_url=None, debug_mode=False, voice_name=None, auto_reload_config=True, metrics=None):
         self.debug_mode = debug_mode
+        # Optional metrics.MetricsRegistry for synthesis latencies and weight switches
+        self.metrics = metrics
         self.auto_reload_config = auto_reload_config
         self.config_module = runtime_config
+        # Presets are resolved once and re-resolved only when config/.env/weights/reference folders change
+        self.voice_registry = VoiceConfigRegistry(
+            runtime_config,
+            poll_interval=runtime_config.TTS_CONFIG_POLL_SECONDS if auto_reload_config else None,
+        )
+        self._applied_config_key = None
+        # Paths are checked once per applied config, not on every request
+        self._validated_config_key = None
         self.voice_name = voice_name
         self.voice_name_override = voice_name is not None
         self.api_url_override = api_url
@@ -31,13 +63,12 @@ class TTSHandler:
         self.reference_override_active = False
         self.audio_dir = os.path.join(os.path.dirname(__file__), "temp")
         self.latest_output_file = os.path.join(self.audio_dir, "latest_tts_output.wav")
-        self.session = requests.Session()
         self.request_timeout = 120
         self.api_url = None
         self.gpt_url = None
         self.sovits_url = None
-        self.active_gpt_url = None
-        self.active_sovits_url = None
+        # GPT-SoVITS servers (TTS_API_URLS), each remembering which weights it has loaded
+        self.backend_pool = None
         self.sample_steps = 16
         self.parallel_infer = True
         self.batch_size = 1
@@ -47,6 +78,34 @@ class TTSHandler:
         self.default_prompt_lang = "zh"
         self.default_text_lang = "zh"
         self.request_logging = False
+        self.text_split_method = "cut5"
+        # Repeated lines (greetings, fallbacks, fillers) are served from here instead of re-synthesized
+        self.audio_cache = TTSAudioCache(
+            cache_dir=os.path.join(self.audio_dir, "tts_cache"),
+            memory_limit_bytes=int(runtime_config.TTS_CACHE_MEMORY_MB * 1024 * 1024),
+            disk_limit_bytes=int(runtime_config.TTS_CACHE_DISK_MB * 1024 * 1024),
+            enabled=runtime_config.TTS_CACHE_ENABLED,
+        )
+        # Measured speed per voice decides how short the first segment of a reply is
+        self.chunking_policy = TTSChunkingPolicy(
+            first_audio_target=runtime_config.TTS_FIRST_AUDIO_TARGET_SECONDS,
+            min_first_chars=runtime_config.TTS_FIRST_SEGMENT_MIN_CHARS,
+            max_segment_chars=runtime_config.TTS_SEGMENT_MAX_CHARS,
+        )
+        # Recent outputs (and latest_tts_output.wav) are written by a background thread
+        self.archive = TTSArchive(
+            archive_dir=os.path.join(self.audio_dir, "tts_archive"),
+            latest_path=self.latest_output_file,
+            max_files=runtime_config.TTS_ARCHIVE_MAX_FILES,
+            max_bytes=int(runtime_config.TTS_ARCHIVE_MAX_MB * 1024 * 1024),
+            enabled=runtime_config.TTS_ARCHIVE_ENABLED,
+        )
+        # Version and sample rate of each SoVITS weight file, read once per file
+        self.weights_index = WeightsMetadataIndex(runtime_config.TTS_WEIGHTS_INDEX_PATH)
+        self.sovits_metadata = None
+        self.confirm_sample_rate = runtime_config.TTS_CONFIRM_SAMPLE_RATE
+        # Server TTS workers share this handler; config reloads must not interleave
+        self._state_lock = threading.RLock()
 
         self._load_runtime_config(reload_module=False)
 
@@ -65,14 +124,24 @@ class TTSHandler:
 
     def _load_runtime_config(self, reload_module=True):
         if reload_module and self.auto_reload_config:
-            self.config_module = importlib.reload(self.config_module)
+            self.voice_registry.refresh()
+        self.config_module = self.voice_registry.config_module
 
-        config_voice_name = self.voice_name if self.voice_name_override else getattr(self.config_module, "TTS_ACTIVE_VOICE", None)
-        voice_config = self.config_module.get_tts_voice_config(config_voice_name)
+        config_voice_name = self.voice_name if self.voice_name_override else self.voice_registry.active_voice_name()
+        config_key = (self.voice_registry.generation, config_voice_name, self.reference_override_active)
+        if config_key == self._applied_config_key:
+            return True
+        voice_config = self.voice_registry.get_voice_config(config_voice_name)
 
         self.api_url = self.api_url_override or voice_config["api_url"]
+        api_urls = [self.api_url] if self.api_url_override else (getattr(self.config_module, "TTS_API_URLS", None) or [self.api_url])
+        if self.backend_pool is None or self.backend_pool.api_urls != [api_url.rstrip("/") for api_url in api_urls]:
+            self.backend_pool = TTSBackendPool(
+                api_urls, request_timeout=self.request_timeout, log=self._request_log, metrics=self.metrics
+            )
         self.gpt_url = self.gpt_url_override or voice_config["gpt_weights_path"]
         self.sovits_url = self.sovits_url_override or voice_config["sovits_weights_path"]
+        self.sovits_metadata = self.weights_index.describe(self.sovits_url)
         self.sample_steps = voice_config["sample_steps"]
         self.parallel_infer = voice_config["parallel_infer"]
         self.batch_size = voice_config["batch_size"]
@@ -88,6 +157,7 @@ class TTSHandler:
         if not self.voice_name_override:
             self.voice_name = voice_config["name"]
 
+        self._applied_config_key = config_key
         self.log(
             "Loaded TTS config "
             f"(voice={voice_config['name']}, gpt={self.gpt_url}, sovits={self.sovits_url}, ref={self.default_ref_audio})"
@@ -107,65 +177,142 @@ class TTSHandler:
             return normalized
         return normalized[: max_length - 3] + "..."
 
-    def _detect_sovits_model_version(self, weights_path):
-        if not weights_path or not os.path.exists(weights_path):
-            return None
+    def get_expected_output_sample_rate(self):
+        """Sample rate of the active voice's audio, from memory (see weights_metadata.py)."""
+        if not self._refresh_runtime_config():
+            return DEFAULT_SAMPLE_RATE
+        if not self._validate_runtime_configuration():
+            return DEFAULT_SAMPLE_RATE
 
-        head_to_version = {
-            b"00": "v1",
-            b"01": "v2",
-            b"02": "v3",
-            b"03": "v3",
-            b"04": "v4",
-            b"05": "v2Pro",
-            b"06": "v2ProPlus",
-        }
+        output_sample_rate, model_version = self._output_sample_rate()
 
+        self._request_log(
+            f"stream_sample_rate={output_sample_rate} "
+            f"(model_version={model_version or 'unknown'}, "
+            f"confirmed={bool(self.sovits_metadata and self.sovits_metadata['sample_rate_confirmed'])}, "
+            f"sovits={self._format_path_for_log(self.sovits_url)})"
+        )
+        return output_sample_rate
+
+    def _output_sample_rate(self):
+        metadata = self.sovits_metadata
+        if metadata is None:
+            return DEFAULT_SAMPLE_RATE, None
+        return metadata["sample_rate"], metadata["model_version"]
+
+    def _confirm_sample_rate(self, sovits_path, audio_head):
+        """Record the rate in the WAV header the TTS server returned for `sovits_path`."""
         try:
-            with open(weights_path, "rb") as weights_file:
-                version_head = weights_file.read(2)
-        except OSError:
-            return None
+            header = parse_wav_header(audio_head)
+        except ValueError:
+            return
+        if header is None or sovits_path is None:
+            return
+        sample_rate = header[0]
+        predicted_rate = self.weights_index.describe(sovits_path) or {}
+        entry = self.weights_index.confirm_sample_rate(sovits_path, sample_rate)
+        if entry is not None and sovits_path == self.sovits_url:
+            self.sovits_metadata = entry
+        if predicted_rate.get("sample_rate") not in (None, sample_rate):
+            print(
+                f"TTS server returns {sample_rate} Hz for {self._format_path_for_log(sovits_path)}, not the "
+                f"{predicted_rate['sample_rate']} Hz its version suggests; using {sample_rate} Hz from now on."
+            )
 
-        if version_head in head_to_version:
-            return head_to_version[version_head]
+    def _cache_key(self, speech_text):
+        return self.audio_cache.make_key(
+            speech_text,
+            voice=self.voice_name,
+            ref_audio=self.default_ref_audio,
+            prompt_text=self.default_prompt_text,
+            prompt_lang=self.default_prompt_lang,
+            text_lang=self.default_text_lang,
+            sample_steps=self.sample_steps,
+            text_split_method=self.text_split_method,
+            gpt_weights=self.gpt_url,
+            sovits_weights=self.sovits_url,
+        )
 
-        if version_head == b"PK":
-            file_size = os.path.getsize(weights_path)
-            if file_size < 82978 * 1024:
-                return "v1"
-            if file_size < 700 * 1024 * 1024:
-                return "v2"
-            return "v3"
+    def _log_cache_result(self, result):
+        stats = self.audio_cache.stats()
+        self._request_log(
+            f"tts_cache_{result} hit_rate={stats['hit_rate']:.1%} "
+            f"(memory={stats['memory_hits']}, disk={stats['disk_hits']}, misses={stats['misses']}, "
+            f"saved_audio={stats['saved_audio_seconds']:.1f}s)"
+        )
 
-        return None
+    def get_cache_stats(self):
+        return self.audio_cache.stats()
 
-    def get_expected_output_sample_rate(self):
+    def get_cached_audio(self, text):
+        """Return the cached PCM for `text` in the current voice, or None; never calls the TTS API."""
         if not self._refresh_runtime_config():
-            return 32000
-        if not self._ensure_weights_loaded():
-            return 32000
+            return None
+        return self.audio_cache.get(self._cache_key(text))
 
-        model_version = self._detect_sovits_model_version(self.sovits_url)
-        output_sample_rate = {
-            "v3": 24000,
-            "v4": 48000,
-        }.get(model_version, 32000)
+    def has_cached_audio(self, text):
+        """Whether `text` is cached in the current voice; unlike get_cached_audio it is not counted as a hit."""
+        if not self._refresh_runtime_config():
+            return False
+        return self.audio_cache.contains(self._cache_key(text))
 
+    def prerender_lines(self, lines, voice_names=None):
+        """
+        Synthesize `lines` for each voice into pinned cache entries so they can be
+        played without a TTS round trip. Returns the number of (voice, line) pairs ready.
+        """
+        previous_voice_name = self.voice_name if self.voice_name_override else None
+        voice_names = list(voice_names or [self.voice_registry.active_voice_name()])
+        ready_count = 0
+        try:
+            for voice_name in voice_names:
+                if not self.set_voice_profile(voice_name):
+                    continue
+                for line in lines:
+                    cache_key = self._cache_key(line)
+                    if self.audio_cache.peek(cache_key) is not None:
+                        self.audio_cache.pin(cache_key)
+                        ready_count += 1
+                        continue
+
+                    audio_data = self._synthesize_wav(line)
+                    decoded_audio = wav_bytes_to_pcm(audio_data) if audio_data is not None else None
+                    if decoded_audio is None:
+                        print(f"Skipping TTS warm-up for voice {voice_name}: could not synthesize '{line}'")
+                        break
+                    self.audio_cache.put(cache_key, *decoded_audio, pinned=True)
+                    ready_count += 1
+        finally:
+            if previous_voice_name is not None:
+                self.set_voice_profile(previous_voice_name)
+            else:
+                self.use_config_voice_profile()
+        return ready_count
+
+    def plan_segments(self, text):
+        """Cut a complete reply into TTS requests: a short first clause, then growing runs of sentences."""
+        return self.chunking_policy.plan(text, self.voice_name)
+
+    def split_first_segment(self, sentence):
+        """Split a short leading clause off the first sentence of a streamed reply."""
+        return self.chunking_policy.split_first_segment(sentence, self.voice_name)
+
+    def _record_synthesis_speed(self, voice_name, speech_text, first_chunk_seconds, synthesis_seconds, audio_bytes):
+        audio_seconds = audio_bytes / 2.0 / self._output_sample_rate()[0]
+        speed = self.chunking_policy.record(voice_name, len(speech_text), first_chunk_seconds, synthesis_seconds, audio_seconds)
         self._request_log(
-            f"stream_sample_rate={output_sample_rate} "
-            f"(model_version={model_version or 'unknown'}, sovits={self._format_path_for_log(self.sovits_url)})"
+            f"tts_speed voice={voice_name} chars={len(speech_text)} first_chunk={first_chunk_seconds:.2f}s "
+            f"total={synthesis_seconds:.2f}s audio={audio_seconds:.2f}s "
+            f"next_first_segment_chars={self.chunking_policy.first_segment_chars(voice_name)} "
+            f"(samples={speed['samples']})"
         )
-        return output_sample_rate
 
     def _request_log(self, message):
         if self.request_logging or self.debug_mode:
             print(f"TTS INFO: {message}")
 
     def _log_active_configuration(self, speech_text, streaming_mode, media_type):
-        ref_duration = None
-        if hasattr(self.config_module, "_get_wav_duration_seconds"):
-            ref_duration = self.config_module._get_wav_duration_seconds(self.default_ref_audio)
+        ref_duration = self.voice_registry.reference_duration(self.default_ref_audio)
 
         ref_duration_text = f"{ref_duration:.2f}s" if isinstance(ref_duration, (int, float)) else "unknown"
         self._request_log(
@@ -193,12 +340,15 @@ class TTSHandler:
 
     def _refresh_runtime_config(self):
         try:
-            return self._load_runtime_config(reload_module=True)
+            with self._state_lock:
+                return self._load_runtime_config(reload_module=True)
         except Exception as e:
             print(f"Error loading TTS config: {e}")
             return False
 
     def _validate_runtime_configuration(self):
+        if self._validated_config_key is not None and self._validated_config_key == self._applied_config_key:
+            return True
         if not self.api_url:
             print("TTS API URL is not configured. Set TTS_API_URL in core/config.py.")
             return False
@@ -226,42 +376,26 @@ class TTSHandler:
         if not os.path.exists(self.default_ref_audio):
             print(f"Reference audio path does not exist: {self.default_ref_audio}")
             return False
+        self._validated_config_key = self._applied_config_key
         return True
 
-    def _set_gpt_weights(self):
-        gpt_endpoint_url = f"{self.api_url}/set_gpt_weights"
-        gpt_params = {"weights_path": self.gpt_url}
-        self._request_log(f"switching_gpt={self._format_path_for_log(self.gpt_url)}")
-        self.log(f"Sending GET request to change GPT model: {gpt_endpoint_url}")
-        gpt_response = self.session.get(gpt_endpoint_url, params=gpt_params, timeout=self.request_timeout)
-        if gpt_response.status_code != 200:
-            print(f"Error setting GPT weights: {gpt_response.text}")
-            return False
-        self.active_gpt_url = self.gpt_url
-        return True
+    def _acquire_backend(self):
+        """Reserve a GPT-SoVITS server that has (or has just been switched to) the active voice's weights."""
+        with self._state_lock:
+            if not self._validate_runtime_configuration():
+                return None
+            backend_pool, gpt_url, sovits_url, voice_name = self.backend_pool, self.gpt_url, self.sovits_url, self.voice_name
+        acquire_started_at = time.perf_counter()
+        lease = backend_pool.acquire(gpt_url, sovits_url)
+        self._observe("elysia_tts_backend_wait_seconds", time.perf_counter() - acquire_started_at, voice_name)
+        return lease
 
-    def _set_sovits_weights(self):
-        sovits_endpoint_url = f"{self.api_url}/set_sovits_weights"
-        sovits_params = {"weights_path": self.sovits_url}
-        self._request_log(f"switching_sovits={self._format_path_for_log(self.sovits_url)}")
-        self.log(f"Sending GET request to change SoVITS model: {sovits_endpoint_url}")
-        sovits_response = self.session.get(sovits_endpoint_url, params=sovits_params, timeout=self.request_timeout)
-        if sovits_response.status_code != 200:
-            print(f"Error setting SoVITS weights: {sovits_response.text}")
-            return False
-        self.active_sovits_url = self.sovits_url
-        return True
+    def _observe(self, name, seconds, voice_name):
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds, voice=voice_name)
 
-    def _ensure_weights_loaded(self):
-        if not self._validate_runtime_configuration():
-            return False
-        if self.active_gpt_url != self.gpt_url:
-            if not self._set_gpt_weights():
-                return False
-        if self.active_sovits_url != self.sovits_url:
-            if not self._set_sovits_weights():
-                return False
-        return True
+    def get_backend_status(self):
+        return self.backend_pool.describe() if self.backend_pool is not None else []
 
     def _build_tts_payload(self, speech_text, streaming_mode=False, media_type="wav"):
         return {
@@ -270,7 +404,7 @@ class TTSHandler:
             "ref_audio_path": self.default_ref_audio,
             "prompt_text": self.default_prompt_text,
             "prompt_lang": self.default_prompt_lang,
-            "text_split_method": "cut5",
+            "text_split_method": self.text_split_method,
             "sample_steps": self.sample_steps,
             "parallel_infer": self.parallel_infer,
             "batch_size": self.batch_size,
@@ -352,9 +486,6 @@ class TTSHandler:
             if not self._refresh_runtime_config():
                 return None
 
-            if not self._ensure_weights_loaded():
-                return None
-
             # First, clean the text if requested, so we don't send commands to the API.
             if clean_commands:
                 speech_text = self.clean_for_speech(text)
@@ -364,10 +495,58 @@ class TTSHandler:
             else:
                 speech_text = text
 
+            cache_key = self._cache_key(speech_text)
+            cached_audio = self.audio_cache.get(cache_key)
+            if cached_audio is not None:
+                self._log_cache_result("hit")
+                audio_data = pcm_to_wav_bytes(cached_audio.pcm, cached_audio.sample_rate)
+            else:
+                audio_data = self._synthesize_wav(speech_text)
+                if audio_data is None:
+                    return None
+                decoded_audio = wav_bytes_to_pcm(audio_data)
+                if decoded_audio is not None:
+                    self.audio_cache.put(cache_key, *decoded_audio)
+                self._log_cache_result("miss")
+
+            # Callers that get the path back may open it right away, so only they wait for the write
+            self.archive.submit(
+                audio_data=audio_data,
+                update_latest=return_audio_data,
+                text=speech_text,
+                voice=self.voice_name,
+                source="text_to_speech",
+                cache_hit=cached_audio is not None,
+            )
+            if not return_audio_data:
+                self.archive.write_latest(audio_data)
+                self.log(f"Audio saved to {self.latest_output_file}")
+            
+            # Play the audio if requested
+            if play_audio:
+                self.play_audio_data(audio_data)
+
+            if return_audio_data:
+                return audio_data
+            
+            # Return the path to the latest file
+            return self.latest_output_file
+                
+        except Exception as e:
+            print(f"Error in text_to_speech: {e}")
+            return None
+
+    def _synthesize_wav(self, speech_text):
+        lease = self._acquire_backend()
+        if lease is None:
+            return None
+
+        with lease:
+            sovits_path = self.sovits_url
             self._log_active_configuration(speech_text, streaming_mode=False, media_type="wav")
 
             # THe new API endpoint is /tts
-            url = f"{self.api_url}/tts"
+            url = f"{lease.api_url}/tts"
 
             # The new API requires the reference audio with every call.
             # We will use the default values we stored in our object.
@@ -377,7 +556,9 @@ class TTSHandler:
             
             self.log(f"Sending POST request to: {url} with params: {params}")
             
-            response = self.session.post(url, json=params, timeout=self.request_timeout)
+            request_started_at = time.perf_counter()
+            response = lease.session.post(url, json=params, timeout=self.request_timeout)
+            self._observe("elysia_tts_synthesis_seconds", time.perf_counter() - request_started_at, self.voice_name)
             
             if response.status_code != 200:
                 self._request_log(f"tts_request_failed status={response.status_code}")
@@ -387,42 +568,38 @@ class TTSHandler:
             # Process the audio response
             audio_data = response.content
             self._request_log(f"tts_request_succeeded bytes={len(audio_data)}")
-            
-            # Save to both the timestamped file (for debugging) and the latest file
-            timestamp_file = os.path.join(self.audio_dir, f"tts_output_{int(time.time())}.wav")
-            
-            # For debugging: save a timestamped version
-            if self.debug_mode:
-                with open(timestamp_file, "wb") as f:
-                    f.write(audio_data)
-                self.log(f"Debug copy saved to {timestamp_file}")
-            
-            # Always save to the latest file (overwriting previous)
-            with open(self.latest_output_file, "wb") as f:
-                f.write(audio_data)
-            
-            self.log(f"Audio saved to {self.latest_output_file}")
-            
-            # Play the audio if requested
-            if play_audio:
-                self.play_audio_data(audio_data)
-
-            if return_audio_data:
-                return audio_data
-            
-            # Return the path to the latest file
-            return self.latest_output_file
-                
-        except Exception as e:
-            print(f"Error in text_to_speech: {e}")
-            return None
-
-    def text_to_speech_stream(self, text, clean_commands=True, media_type="raw", chunk_size=8192):
+            self._confirm_sample_rate(sovits_path, audio_data[:WAV_HEADER_PROBE_BYTES])
+            return audio_data
+
+    def _strip_wav_header(self, chunks, sovits_path):
+        """Yield the PCM of a streamed WAV, recording its header's sample rate for `sovits_path`."""
+        head = b""
+        chunks = iter(chunks)
+        for chunk in chunks:
+            head += chunk
+            try:
+                header = parse_wav_header(head)
+            except ValueError:
+                # The server ignored media_type; pass its audio through untouched
+                break
+            if header is not None:
+                self._confirm_sample_rate(sovits_path, head)
+                head = head[header[1]:]
+                break
+            if len(head) >= WAV_HEADER_PROBE_BYTES:
+                break
+        if head:
+            yield head
+        yield from chunks
+
+    def text_to_speech_stream(self, text, clean_commands=True, media_type="raw", chunk_size=8192, cancel_scope=None):
+        """
+        Yield the audio of `text` as it is synthesized. Cancelling `cancel_scope`
+        (pipeline.CancelScope) closes the HTTP stream and frees the backend right away.
+        """
         try:
             if not self._refresh_runtime_config():
                 return
-            if not self._ensure_weights_loaded():
-                return
 
             if clean_commands:
                 speech_text = self.clean_for_speech(text)
@@ -432,31 +609,108 @@ class TTSHandler:
             else:
                 speech_text = text
 
-            self._log_active_configuration(speech_text, streaming_mode=True, media_type=media_type)
-
-            url = f"{self.api_url}/tts"
-            params = self._build_tts_payload(
-                speech_text=speech_text,
-                streaming_mode=True,
-                media_type=media_type
-            )
-            self.log(f"Sending streaming POST request to: {url} with params: {params}")
+            # Only raw PCM streams are cached; they can be replayed in any chunk size
+            cache_key = self._cache_key(speech_text) if media_type == "raw" else None
+            cached_audio = self.audio_cache.get(cache_key) if cache_key else None
+            if cached_audio is not None:
+                self._log_cache_result("hit")
+                for start in range(0, len(cached_audio.pcm), chunk_size):
+                    yield cached_audio.pcm[start:start + chunk_size]
+                return
 
-            response = self.session.post(url, json=params, timeout=self.request_timeout, stream=True)
-            if response.status_code != 200:
-                self._request_log(f"tts_stream_failed status={response.status_code}")
-                print(f"Error from TTS API stream: {response.status_code} - {response.text}")
+            voice_name = self.voice_name
+            lease = self._acquire_backend()
+            if lease is None:
                 return
 
-            try:
-                self._request_log("tts_stream_started")
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        yield chunk
-            finally:
-                self._request_log("tts_stream_finished")
-                response.close()
+            # The backend stays reserved (its weights pinned) until the stream is consumed or closed
+            with lease:
+                if cancel_scope is not None and cancel_scope.cancelled:
+                    self._request_log("tts_stream_cancelled before_request=true")
+                    return
+                sovits_path = self.sovits_url
+                # Until a file's sample rate has been seen in a WAV header, ask for WAV and strip the header
+                request_media_type = media_type
+                if (
+                    media_type == "raw"
+                    and self.confirm_sample_rate
+                    and self.sovits_metadata is not None
+                    and not self.sovits_metadata["sample_rate_confirmed"]
+                ):
+                    request_media_type = "wav"
+                self._log_active_configuration(speech_text, streaming_mode=True, media_type=request_media_type)
+
+                url = f"{lease.api_url}/tts"
+                params = self._build_tts_payload(
+                    speech_text=speech_text,
+                    streaming_mode=True,
+                    media_type=request_media_type
+                )
+                self.log(f"Sending streaming POST request to: {url} with params: {params}")
+
+                request_started_at = time.perf_counter()
+                response = lease.session.post(url, json=params, timeout=self.request_timeout, stream=True)
+                if response.status_code != 200:
+                    self._request_log(f"tts_stream_failed status={response.status_code}")
+                    print(f"Error from TTS API stream: {response.status_code} - {response.text}")
+                    return
+
+                streamed_chunks = [] if cache_key else None
+                first_chunk_seconds = None
+                streamed_bytes = 0
+                completed = False
+                abort = functools.partial(abort_response, response)
+                if cancel_scope is not None:
+                    cancel_scope.add_callback(abort)
+                try:
+                    self._request_log("tts_stream_started")
+                    chunks = response.iter_content(chunk_size=chunk_size)
+                    if request_media_type != media_type:
+                        chunks = self._strip_wav_header(chunks, sovits_path)
+                    for chunk in chunks:
+                        if chunk:
+                            if first_chunk_seconds is None:
+                                first_chunk_seconds = time.perf_counter() - request_started_at
+                            streamed_bytes += len(chunk)
+                            if streamed_chunks is not None:
+                                streamed_chunks.append(chunk)
+                            yield chunk
+                    # A stream cut short by cancellation can end without an error
+                    completed = cancel_scope is None or not cancel_scope.cancelled
+                    if first_chunk_seconds is not None:
+                        self._observe("elysia_tts_first_chunk_seconds", first_chunk_seconds, voice_name)
+                        self._observe("elysia_tts_synthesis_seconds", time.perf_counter() - request_started_at, voice_name)
+                    if media_type == "raw" and first_chunk_seconds is not None:
+                        self._record_synthesis_speed(
+                            voice_name,
+                            speech_text,
+                            first_chunk_seconds,
+                            time.perf_counter() - request_started_at,
+                            streamed_bytes,
+                        )
+                finally:
+                    if cancel_scope is not None:
+                        cancel_scope.remove_callback(abort)
+                    self._request_log(f"tts_stream_finished completed={completed} bytes={streamed_bytes}")
+                    response.close()
+
+            # An interrupted stream is never cached
+            if completed and streamed_chunks:
+                streamed_pcm = b"".join(streamed_chunks)
+                sample_rate = self._output_sample_rate()[0]
+                self.audio_cache.put(cache_key, streamed_pcm, sample_rate)
+                self._log_cache_result("miss")
+                self.archive.submit(
+                    pcm=streamed_pcm,
+                    sample_rate=sample_rate,
+                    text=speech_text,
+                    voice=voice_name,
+                    source="text_to_speech_stream",
+                    cache_hit=False,
+                )
         except Exception as e:
+            if cancel_scope is not None and cancel_scope.cancelled:
+                return
             print(f"Error in text_to_speech_stream: {e}")
     
     def play_audio_data(self, audio_data):
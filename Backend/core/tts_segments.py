@@ -0,0 +1,62 @@
+import asyncio
+
+
+class OrderedSegmentAudio:
+    """
+    Synthesizes the sentences of a reply concurrently and hands their audio back in order.
+
+    Every `add()`ed sentence starts synthesizing right away, at most `max_parallel` at a
+    time, and buffers its chunks until it is the leading sentence. `events()` yields
+    ("segment", text) when a sentence becomes the leading one, then its ("audio", chunk)
+    items as they arrive, so a long reply takes about as long as its slowest sentence
+    instead of the sum of all of them. Call `close()` after the last sentence.
+    """
+
+    def __init__(self, synthesize, max_parallel=2):
+        self.synthesize = synthesize
+        self.semaphore = asyncio.Semaphore(max(1, int(max_parallel)))
+        self.segments = asyncio.Queue()
+        self.tasks = []
+
+    def add(self, text):
+        chunks = asyncio.Queue()
+        self.tasks.append(asyncio.create_task(self._synthesize_segment(text, chunks)))
+        self.segments.put_nowait((text, chunks))
+
+    def close(self):
+        self.segments.put_nowait(None)
+
+    async def _synthesize_segment(self, text, chunks):
+        try:
+            # Semaphore waiters are served first come first served, so earlier sentences start first
+            async with self.semaphore:
+                stream = self.synthesize(text)
+                try:
+                    async for chunk in stream:
+                        chunks.put_nowait(chunk)
+                finally:
+                    # Stops the TTS worker and closes its HTTP stream when the reply is abandoned
+                    await stream.aclose()
+        except Exception as e:
+            print(f"Error synthesizing sentence '{text}': {e}")
+        finally:
+            chunks.put_nowait(None)
+
+    async def events(self):
+        while True:
+            segment = await self.segments.get()
+            if segment is None:
+                return
+            text, chunks = segment
+            yield "segment", text
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield "audio", chunk
+
+    async def aclose(self):
+        """Stop synthesizing sentences that have not been sent yet."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,111 @@
+import importlib
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class VoiceConfigRegistry:
+    """
+    Resolved TTS voice presets, cached until their inputs change.
+
+    Resolving a preset globs the GPT/SoVITS weight folders and opens candidate reference
+    WAVs, so doing it (plus importlib.reload(config)) before every TTS call is expensive.
+    The registry resolves each preset once and only reloads `config.py` when config.py,
+    the project .env, or a watched weight/reference directory has a new mtime. Checks are
+    rate-limited to one stat pass per `poll_interval` seconds; `None` disables hot reload.
+    """
+
+    def __init__(self, config_module, poll_interval=1.0):
+        self.config_module = config_module
+        self.poll_interval = poll_interval
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._voice_cache = {}
+        self._duration_cache = {}
+        self._watched_paths = self._collect_watched_paths()
+        self._fingerprint = self._compute_fingerprint()
+        self._last_check = time.monotonic()
+
+    def _collect_watched_paths(self):
+        config_module = self.config_module
+        gpt_sovits_dir = Path(config_module.GPT_SOVITS_DIR)
+        paths = {
+            Path(config_module.__file__).resolve(),
+            Path(config_module.PROJECT_ROOT) / ".env",
+            gpt_sovits_dir,
+        }
+        for pattern in ("GPT_weights*", "SoVITS_weights*"):
+            paths.update(gpt_sovits_dir.glob(pattern))
+
+        backend_dir = Path(config_module.BACKEND_DIR)
+        for preset in config_module.TTS_VOICE_PRESETS.values():
+            reference_paths = [preset.get("ref_audio_path")] + list(preset.get("ref_audio_candidates", []))
+            for reference_path in reference_paths:
+                resolved = config_module.resolve_project_path(reference_path)
+                if resolved:
+                    paths.add(Path(resolved).parent)
+            for pattern in preset.get("ref_audio_glob", []):
+                paths.add((backend_dir / pattern).parent)
+        return sorted(paths)
+
+    def _compute_fingerprint(self):
+        fingerprint = []
+        for path in self._watched_paths:
+            try:
+                stat_result = os.stat(path)
+                fingerprint.append((stat_result.st_mtime_ns, stat_result.st_size))
+            except OSError:
+                fingerprint.append(None)
+        return tuple(fingerprint)
+
+    def refresh(self, force=False):
+        """Reload config if its inputs changed; returns True when a reload happened."""
+        if self.poll_interval is None and not force:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_check < self.poll_interval:
+                return False
+            self._last_check = now
+
+            fingerprint = self._compute_fingerprint()
+            if not force and fingerprint == self._fingerprint:
+                return False
+
+            self._forget_dotenv_values()
+            self.config_module = importlib.reload(self.config_module)
+            self._voice_cache.clear()
+            self._duration_cache.clear()
+            self._watched_paths = self._collect_watched_paths()
+            self._fingerprint = self._compute_fingerprint()
+            self.generation += 1
+            print(f"TTS config reloaded (generation {self.generation}).")
+            return True
+
+    def _forget_dotenv_values(self):
+        # .env values are applied with setdefault; drop the ones config set itself so an edited .env takes effect
+        for key, value in getattr(self.config_module, "DOTENV_APPLIED", {}).items():
+            if os.environ.get(key) == value:
+                del os.environ[key]
+
+    def active_voice_name(self):
+        return getattr(self.config_module, "TTS_ACTIVE_VOICE", None)
+
+    def get_voice_config(self, voice_name=None):
+        with self._lock:
+            selected_voice = voice_name or self.active_voice_name()
+            voice_config = self._voice_cache.get(selected_voice)
+            if voice_config is None:
+                voice_config = self.config_module.get_tts_voice_config(selected_voice)
+                self._voice_cache[selected_voice] = voice_config
+            return dict(voice_config)
+
+    def reference_duration(self, ref_audio_path):
+        if not ref_audio_path:
+            return None
+        with self._lock:
+            if ref_audio_path not in self._duration_cache:
+                self._duration_cache[ref_audio_path] = self.config_module.get_reference_audio_duration(ref_audio_path)
+            return self._duration_cache[ref_audio_path]
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+
+# First two bytes GPT-SoVITS writes in front of its own weight files
+SOVITS_VERSION_HEADS = {
+    b"00": "v1",
+    b"01": "v2",
+    b"02": "v3",
+    b"03": "v3",
+    b"04": "v4",
+    b"05": "v2Pro",
+    b"06": "v2ProPlus",
+}
+MODEL_SAMPLE_RATES = {"v3": 24000, "v4": 48000}
+DEFAULT_SAMPLE_RATE = 32000
+
+
+def detect_sovits_model_version(weights_path, file_size):
+    """Model version from the weight file's header, or None if the file cannot be read."""
+    try:
+        with open(weights_path, "rb") as weights_file:
+            version_head = weights_file.read(2)
+    except OSError:
+        return None
+
+    if version_head in SOVITS_VERSION_HEADS:
+        return SOVITS_VERSION_HEADS[version_head]
+
+    if version_head == b"PK":
+        # Plain torch zip checkpoints carry no version; guess from the size like GPT-SoVITS does
+        if file_size < 82978 * 1024:
+            return "v1"
+        if file_size < 700 * 1024 * 1024:
+            return "v2"
+        return "v3"
+
+    return None
+
+
+class WeightsMetadataIndex:
+    """
+    Model version and output sample rate of each SoVITS weight file, persisted as a small JSON file.
+
+    Entries are keyed by path and stay valid while the file's size and mtime match, so a
+    weight file is opened once, not on every turn. The rate predicted from the version is
+    replaced by the one the TTS server actually returned once `confirm_sample_rate` is called.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Error saving weights metadata index: {e}")
+
+    def describe(self, weights_path):
+        """Metadata for `weights_path` (stat only, unless the file is new or changed); None if it is missing."""
+        if not weights_path:
+            return None
+        key = os.path.abspath(weights_path)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+                return dict(entry)
+
+        model_version = detect_sovits_model_version(key, stat.st_size)
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "model_version": model_version,
+            "sample_rate": MODEL_SAMPLE_RATES.get(model_version, DEFAULT_SAMPLE_RATE),
+            "sample_rate_confirmed": False,
+            "indexed_at": time.time(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._save()
+        return dict(entry)
+
+    def confirm_sample_rate(self, weights_path, sample_rate):
+        """Record the rate the TTS server streamed for this file; returns the updated entry or None."""
+        key = os.path.abspath(weights_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.get("sample_rate") != sample_rate or not entry.get("sample_rate_confirmed"):
+                entry["sample_rate"] = sample_rate
+                entry["sample_rate_confirmed"] = True
+                self._save()
+            return dict(entry)
@@ -2,6 +2,7 @@ import argparse
 import csv
 import math
 import re
+import sys
 import wave
 from dataclasses import dataclass
 from pathlib import Path
@@ -9,6 +10,11 @@ from typing import Callable
 
 import numpy as np
 
+CORE_DIR = Path(__file__).resolve().parent.parent / "core"
+sys.path.append(str(CORE_DIR))
+
+import config  # noqa: E402
+from reference_catalog import ReferenceAudioCatalog  # noqa: E402
 
 DEFAULT_MIN_SECONDS = 3.0
 DEFAULT_MAX_SECONDS = 10.0
@@ -307,6 +313,21 @@ def write_csv(file_path: Path, rows: list[dict]) -> None:
         writer.writerows(rows)
 
 
+def record_catalog_scores(catalog_path: Path, input_dir: Path, ranked_rows: list[dict]) -> int:
+    """Store each clip's score in the reference audio catalog that config.py resolves presets from."""
+    catalog = ReferenceAudioCatalog(str(catalog_path))
+    try:
+        catalog.sync_directory(str(input_dir))
+        recorded = 0
+        for row in ranked_rows:
+            if row["styles"] == "error":
+                continue
+            recorded += catalog.record_audit(str(input_dir / row["file_name"]), row["score"], row["flags"])
+        return recorded
+    finally:
+        catalog.close()
+
+
 def print_summary(results: dict) -> None:
     ranked_rows = results["ranked_rows"]
     valid_rows = [row for row in ranked_rows if "too_short" not in row["flags"] and "too_long" not in row["flags"]]
@@ -341,6 +362,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS)
     parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS)
     parser.add_argument("--top-n", type=int, default=50)
+    parser.add_argument(
+        "--catalog",
+        default=config.TTS_REF_CATALOG_PATH,
+        help="Reference audio catalog (SQLite) to store scores in; empty to skip.",
+    )
     return parser.parse_args()
 
 
@@ -363,6 +389,9 @@ def main() -> int:
     print_summary(results)
     print("")
     print(f"CSV outputs written to: {output_dir}")
+    if args.catalog:
+        recorded = record_catalog_scores(Path(args.catalog), input_dir, results["ranked_rows"])
+        print(f"Scores of {recorded} clips stored in: {args.catalog}")
     return 0
 
 
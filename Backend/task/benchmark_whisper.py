@@ -0,0 +1,200 @@
+import argparse
+import sys
+import time
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+CORE_DIR = Path(__file__).resolve().parent.parent / "core"
+sys.path.append(str(CORE_DIR))
+
+from audio_utils import WHISPER_SAMPLE_RATE, pcm16_to_float32, resample  # noqa: E402
+from faster_whisper import WhisperModel  # noqa: E402
+from speech_recognition import resolve_whisper_device  # noqa: E402
+
+DEFAULT_MODEL_SIZES = "tiny,base,small,medium,large-v3"
+DEFAULT_COMPUTE_TYPES = "auto"
+
+
+@dataclass
+class BenchmarkResult:
+    model_size: str
+    device: str
+    compute_type: str
+    load_seconds: float
+    decode_seconds: float
+    audio_seconds: float
+    transcript: str
+    cer: Optional[float]
+    error: str = ""
+
+    @property
+    def real_time_factor(self) -> float:
+        return self.decode_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+
+def load_audio(file_path: Path) -> np.ndarray:
+    with wave.open(str(file_path), "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        frame_rate = wav_file.getframerate()
+        pcm_bytes = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width != 2:
+        raise ValueError(f"Unsupported sample width {sample_width * 8}bit in {file_path}")
+
+    samples = pcm16_to_float32(pcm_bytes)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, frame_rate, WHISPER_SAMPLE_RATE)
+
+
+def character_error_rate(reference: str, hypothesis: str) -> float:
+    reference = "".join(reference.split())
+    hypothesis = "".join(hypothesis.split())
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+
+    previous_row = list(range(len(hypothesis) + 1))
+    for i, reference_char in enumerate(reference, start=1):
+        current_row = [i]
+        for j, hypothesis_char in enumerate(hypothesis, start=1):
+            substitution = previous_row[j - 1] + (reference_char != hypothesis_char)
+            current_row.append(min(previous_row[j] + 1, current_row[j - 1] + 1, substitution))
+        previous_row = current_row
+    return previous_row[-1] / float(len(reference))
+
+
+def benchmark_configuration(
+    model_size: str,
+    device: str,
+    compute_type: str,
+    audio: np.ndarray,
+    args: argparse.Namespace,
+) -> BenchmarkResult:
+    # Measure exactly the requested type; a substituted one would be reported under the wrong label
+    resolved_device, resolved_compute_type = resolve_whisper_device(device, compute_type, allow_fallback=False)
+
+    load_started_at = time.perf_counter()
+    model = WhisperModel(
+        model_size,
+        device=resolved_device,
+        compute_type=resolved_compute_type,
+        cpu_threads=args.cpu_threads,
+        num_workers=1,
+    )
+    load_seconds = time.perf_counter() - load_started_at
+
+    def transcribe() -> str:
+        segments, _ = model.transcribe(
+            audio,
+            language=args.language,
+            beam_size=args.beam_size,
+            best_of=args.beam_size,
+            temperature=0,
+            condition_on_previous_text=False,
+            vad_filter=True,
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+    # The first decode pays for lazy initialisation; keep it out of the timing
+    transcript = transcribe()
+    timings = []
+    for _ in range(args.repeats):
+        started_at = time.perf_counter()
+        transcript = transcribe()
+        timings.append(time.perf_counter() - started_at)
+
+    return BenchmarkResult(
+        model_size=model_size,
+        device=resolved_device,
+        compute_type=resolved_compute_type,
+        load_seconds=load_seconds,
+        decode_seconds=float(np.median(timings)),
+        audio_seconds=len(audio) / float(WHISPER_SAMPLE_RATE),
+        transcript=transcript,
+        cer=character_error_rate(args.reference_text, transcript) if args.reference_text else None,
+    )
+
+
+def print_results(results: list[BenchmarkResult]) -> None:
+    print("")
+    print(f"{'model':<12} {'device':<6} {'compute':<14} {'load_s':>7} {'decode_s':>9} {'RTF':>7} {'CER':>6}")
+    for result in sorted(results, key=lambda row: (bool(row.error), row.real_time_factor)):
+        if result.error:
+            print(f"{result.model_size:<12} {result.device:<6} {result.compute_type:<14} skipped: {result.error}")
+            continue
+        cer_text = f"{result.cer:.3f}" if result.cer is not None else "-"
+        print(
+            f"{result.model_size:<12} {result.device:<6} {result.compute_type:<14} "
+            f"{result.load_seconds:>7.2f} {result.decode_seconds:>9.3f} {result.real_time_factor:>7.3f} {cer_text:>6}"
+        )
+    print("")
+    print("RTF = decode time / audio duration (lower is faster; < 1.0 is faster than real time).")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure faster-whisper real-time factor per model size and compute type on this machine."
+    )
+    parser.add_argument("--audio", default=str(CORE_DIR / "Ely1.wav"), help="16-bit WAV file to transcribe.")
+    parser.add_argument("--model-sizes", default=DEFAULT_MODEL_SIZES, help="Comma-separated model sizes.")
+    parser.add_argument(
+        "--compute-types",
+        default=DEFAULT_COMPUTE_TYPES,
+        help="Comma-separated compute types (auto, int8, int8_float16, float16, float32).",
+    )
+    parser.add_argument("--device", default="auto", choices=["auto", "cpu", "cuda"])
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reference-text", default="", help="Expected transcript, used to report character error rate.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    audio_path = Path(args.audio).resolve()
+    if not audio_path.exists():
+        print(f"Audio file does not exist: {audio_path}")
+        return 1
+
+    audio = load_audio(audio_path)
+    print(f"Benchmarking on {audio_path.name} ({len(audio) / float(WHISPER_SAMPLE_RATE):.2f}s of audio)")
+
+    results = []
+    for model_size in [size.strip() for size in args.model_sizes.split(",") if size.strip()]:
+        for compute_type in [value.strip() for value in args.compute_types.split(",") if value.strip()]:
+            print(f"- {model_size} / {compute_type} ...")
+            try:
+                results.append(benchmark_configuration(model_size, args.device, compute_type, audio, args))
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                print(f"  skipped: {error}")
+                results.append(
+                    BenchmarkResult(
+                        model_size=model_size,
+                        device=args.device,
+                        compute_type=compute_type,
+                        load_seconds=0.0,
+                        decode_seconds=0.0,
+                        audio_seconds=0.0,
+                        transcript="",
+                        cer=None,
+                        error=error,
+                    )
+                )
+
+    print_results(results)
+    if all(result.error for result in results):
+        print("No configuration could be benchmarked.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
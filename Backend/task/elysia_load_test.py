@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+import wave
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import websockets
+
+CORE_DIR = Path(__file__).resolve().parent.parent / "core"
+sys.path.append(str(CORE_DIR))
+
+from audio_framing import (  # noqa: E402
+    FLAG_STREAM_TTS,
+    FRAME_AUDIO_UPLOAD,
+    FRAME_TTS_AUDIO,
+    FRAME_TTS_CHUNK,
+    pack_frame,
+    unpack_frame,
+)
+
+DEFAULT_TEXTS = "今天過得怎麼樣？|你喜歡什麼樣的音樂？|跟我說說你最近的心情吧。"
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class TurnResult:
+    client_id: int
+    turn: int
+    ok: bool
+    first_audio_seconds: Optional[float] = None
+    turn_seconds: Optional[float] = None
+    audio_bytes: int = 0
+    error: str = ""
+
+
+@dataclass
+class LoadReport:
+    clients: int
+    turns: int
+    failed_turns: int
+    wall_seconds: float
+    turns_per_second: float
+    first_audio: dict = field(default_factory=dict)
+    turn_latency: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+
+def load_upload(file_path: Path) -> tuple[bytes, int]:
+    """PCM and sample rate of a 16-bit mono WAV to upload as the user's speech."""
+    with wave.open(str(file_path), "rb") as wav_file:
+        if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+            raise ValueError(f"{file_path} must be 16-bit mono")
+        return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()
+
+
+def percentiles(values: list[float]) -> dict:
+    samples = sorted(values)
+    if not samples:
+        return {}
+    summary = {f"p{p}": round(samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))], 4) for p in PERCENTILES}
+    summary["mean"] = round(sum(samples) / len(samples), 4)
+    summary["max"] = round(samples[-1], 4)
+    return summary
+
+
+async def send_turn(websocket, args: argparse.Namespace, text: str, upload: Optional[tuple[bytes, int]]) -> None:
+    if upload is None:
+        await websocket.send(json.dumps({"event": "text_input", "text": text, "stream_tts": args.stream_tts}))
+    elif args.binary:
+        pcm, _ = upload
+        await websocket.send(pack_frame(FRAME_AUDIO_UPLOAD, pcm, flags=FLAG_STREAM_TTS if args.stream_tts else 0))
+    else:
+        pcm, sample_rate = upload
+        await websocket.send(json.dumps({
+            "event": "audio_data",
+            "data": base64.b64encode(pcm).decode("ascii"),
+            "sample_rate": sample_rate,
+            "stream_tts": args.stream_tts,
+        }))
+
+
+async def wait_for_reply(websocket, result: TurnResult, sent_at: float, timeout: float) -> None:
+    """Read messages until the turn is complete, recording when its first audio arrived."""
+    deadline = sent_at + timeout
+    while True:
+        message = await asyncio.wait_for(websocket.recv(), timeout=max(0.0, deadline - time.perf_counter()))
+        now = time.perf_counter() - sent_at
+        if isinstance(message, bytes):
+            frame_type, _, _, _, payload = unpack_frame(message)
+            if frame_type in (FRAME_TTS_CHUNK, FRAME_TTS_AUDIO):
+                if result.first_audio_seconds is None:
+                    result.first_audio_seconds = now
+                result.audio_bytes += len(payload)
+            if frame_type == FRAME_TTS_AUDIO:
+                result.turn_seconds = now
+                return
+            continue
+
+        data = json.loads(message)
+        event = data.get("event")
+        if event == "tts_stream_chunk":
+            if result.first_audio_seconds is None:
+                result.first_audio_seconds = now
+            result.audio_bytes += len(data.get("audio_chunk_base64", "")) * 3 // 4
+        elif event == "tts_stream_end":
+            result.turn_seconds = now
+            if not data.get("chunk_count"):
+                result.error = "stream ended without audio"
+            return
+        elif event is None and "dialogue" in data:
+            # Non-streaming reply: the WAV is inline, or follows as a binary frame
+            if data.get("audio_binary"):
+                continue
+            if data.get("audio_base64"):
+                result.first_audio_seconds = now
+                result.audio_bytes = len(data["audio_base64"]) * 3 // 4
+            else:
+                result.error = "reply without audio"
+            result.turn_seconds = now
+            return
+
+
+async def run_client(
+    client_id: int,
+    args: argparse.Namespace,
+    texts: list[str],
+    upload: Optional[tuple[bytes, int]],
+    results: list[TurnResult],
+) -> None:
+    # Spread connections out a little, like players joining, instead of one thundering herd
+    await asyncio.sleep(client_id * args.ramp_seconds)
+    try:
+        async with websockets.connect(args.url, max_size=None, open_timeout=args.timeout) as websocket:
+            if args.binary or args.codecs:
+                await websocket.send(json.dumps({
+                    "event": "hello",
+                    "binary_audio": args.binary,
+                    "audio_codecs": [codec for codec in args.codecs.split(",") if codec],
+                }))
+                while json.loads(await asyncio.wait_for(websocket.recv(), args.timeout)).get("event") != "hello_ack":
+                    pass
+
+            for turn in range(args.turns):
+                result = TurnResult(client_id=client_id, turn=turn, ok=False)
+                sent_at = time.perf_counter()
+                try:
+                    await send_turn(websocket, args, texts[(client_id + turn) % len(texts)], upload)
+                    await wait_for_reply(websocket, result, sent_at, args.timeout)
+                    result.ok = not result.error
+                except asyncio.TimeoutError:
+                    result.error = f"no reply within {args.timeout:g}s"
+                results.append(result)
+                if not result.ok and result.turn_seconds is None:
+                    # The reply may still arrive and would be mistaken for the next turn's
+                    break
+                await asyncio.sleep(args.think_seconds)
+    except (OSError, websockets.exceptions.WebSocketException) as exc:
+        results.append(TurnResult(client_id=client_id, turn=-1, ok=False, error=f"{type(exc).__name__}: {exc}"))
+
+
+def build_report(args: argparse.Namespace, results: list[TurnResult], wall_seconds: float) -> LoadReport:
+    completed = [result for result in results if result.ok]
+    errors = {}
+    for result in results:
+        if not result.ok:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    return LoadReport(
+        clients=args.clients,
+        turns=len(results),
+        failed_turns=len(results) - len(completed),
+        wall_seconds=round(wall_seconds, 3),
+        turns_per_second=round(len(completed) / wall_seconds, 3) if wall_seconds else 0.0,
+        first_audio=percentiles([result.first_audio_seconds for result in completed if result.first_audio_seconds is not None]),
+        turn_latency=percentiles([result.turn_seconds for result in completed]),
+        errors=errors,
+    )
+
+
+def print_report(report: LoadReport) -> None:
+    print("")
+    print(
+        f"{report.clients} clients, {report.turns} turns ({report.failed_turns} failed) "
+        f"in {report.wall_seconds:.1f}s -> {report.turns_per_second:.2f} turns/s"
+    )
+    print(f"{'metric':<22} {'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8} {'max':>8}")
+    for name, summary in (("time to first audio", report.first_audio), ("full turn", report.turn_latency)):
+        if summary:
+            print(
+                f"{name:<22} " + " ".join(f"{summary[key]:>8.3f}" for key in ("p50", "p95", "p99", "mean", "max"))
+            )
+    for error, count in sorted(report.errors.items(), key=lambda item: -item[1]):
+        print(f"  {count} x {error}")
+
+
+def check_thresholds(args: argparse.Namespace, report: LoadReport) -> list[str]:
+    failures = []
+    if args.max_p95_first_audio is not None and report.first_audio.get("p95", float("inf")) > args.max_p95_first_audio:
+        failures.append(f"p95 time to first audio {report.first_audio.get('p95')} > {args.max_p95_first_audio}")
+    if args.max_p95_turn is not None and report.turn_latency.get("p95", float("inf")) > args.max_p95_turn:
+        failures.append(f"p95 full turn {report.turn_latency.get('p95')} > {args.max_p95_turn}")
+    if report.turns and report.failed_turns / report.turns > args.max_error_rate:
+        failures.append(f"{report.failed_turns}/{report.turns} turns failed (allowed {args.max_error_rate:.0%})")
+    return failures
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Open N Unity-like WebSocket clients against elysia_server and report latency percentiles."
+    )
+    parser.add_argument("--url", default="ws://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=5, help="Turns per client.")
+    parser.add_argument("--texts", default=DEFAULT_TEXTS, help="'|'-separated user lines sent as text_input.")
+    parser.add_argument("--audio", default="", help="Upload this 16-bit mono WAV (runs ASR) instead of sending text.")
+    parser.add_argument("--no-stream-tts", dest="stream_tts", action="store_false", help="Use the full-response path.")
+    parser.add_argument("--binary", action="store_true", help="Negotiate binary audio frames.")
+    parser.add_argument("--codecs", default="", help="Comma-separated audio_codecs to negotiate, e.g. ima_adpcm.")
+    parser.add_argument("--think-seconds", type=float, default=0.5, help="Pause between a reply and the next turn.")
+    parser.add_argument("--ramp-seconds", type=float, default=0.1, help="Delay between client connections.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for one turn.")
+    parser.add_argument("--json", default="", help="Also write the report (and every turn) to this JSON file.")
+    parser.add_argument("--max-p95-first-audio", type=float, default=None, help="Fail if p95 time to first audio exceeds this.")
+    parser.add_argument("--max-p95-turn", type=float, default=None, help="Fail if p95 full-turn latency exceeds this.")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Fail if more turns than this fraction fail.")
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> int:
+    texts = [text.strip() for text in args.texts.split("|") if text.strip()]
+    upload = load_upload(Path(args.audio)) if args.audio else None
+    results = []
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run_client(client_id, args, texts, upload, results) for client_id in range(args.clients)))
+    report = build_report(args, results, time.perf_counter() - started_at)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"report": asdict(report), "turns": [asdict(result) for result in results]}, f, ensure_ascii=False, indent=2)
+
+    failures = check_thresholds(args, report)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures or not results else 0
+
+
+def main() -> int:
+    args = parse_args()
+    if not args.texts.strip() and not args.audio:
+        print("Nothing to send: pass --texts or --audio.")
+        return 1
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
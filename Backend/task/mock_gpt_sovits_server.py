@@ -0,0 +1,200 @@
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import wave
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+CHUNK_SECONDS = 0.1
+
+
+class MockState:
+    """Weights and counters of one stand-in GPT-SoVITS server."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.lock = threading.Lock()
+        self.gpt_weights = None
+        self.sovits_weights = None
+        self.weight_switches = 0
+        self.requests = 0
+        self.errors = 0
+        self.active_requests = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "gpt_weights": self.gpt_weights,
+                "sovits_weights": self.sovits_weights,
+                "weight_switches": self.weight_switches,
+                "requests": self.requests,
+                "errors": self.errors,
+                "active_requests": self.active_requests,
+            }
+
+
+def synthesize(text: str, voice_key: str, sample_rate: int, chars_per_second: float) -> bytes:
+    """A short tone per character; the pitch depends on the loaded weights so voices are audibly different."""
+    duration = max(0.3, len(text) / chars_per_second)
+    base_frequency = 180.0 + (zlib.crc32(voice_key.encode("utf-8")) % 200)
+    t = np.arange(int(duration * sample_rate), dtype=np.float32) / sample_rate
+    envelope = 0.5 - 0.5 * np.cos(2.0 * np.pi * (t * chars_per_second % 1.0))
+    samples = 0.2 * envelope * np.sin(2.0 * np.pi * base_frequency * t)
+    return (samples * 32767.0).astype("<i2").tobytes()
+
+
+def to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def make_handler(state: MockState):
+    args = state.args
+
+    class MockGPTSoVITSHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            if parsed.path in ("/set_gpt_weights", "/set_sovits_weights"):
+                weights_path = (query.get("weights_path") or [""])[0]
+                if not weights_path:
+                    self.send_json(400, {"message": "weights_path is required"})
+                    return
+                attribute = "gpt_weights" if parsed.path == "/set_gpt_weights" else "sovits_weights"
+                with state.lock:
+                    changed = getattr(state, attribute) != weights_path
+                if changed:
+                    # Loading a model takes seconds on a real server
+                    time.sleep(args.switch_seconds)
+                    with state.lock:
+                        setattr(state, attribute, weights_path)
+                        state.weight_switches += 1
+                    print(f"[{args.port}] loaded {attribute}={Path(weights_path).name}")
+                self.send_json(200, {"message": "success"})
+                return
+            if parsed.path == "/stats":
+                self.send_json(200, state.snapshot())
+                return
+            self.send_json(404, {"message": "not found"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/tts":
+                self.send_json(404, {"message": "not found"})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+            text = request.get("text", "")
+            if not text:
+                self.send_json(400, {"message": "text is required"})
+                return
+
+            with state.lock:
+                if state.gpt_weights is None or state.sovits_weights is None:
+                    self.send_json(400, {"message": "weights are not loaded"})
+                    return
+                voice_key = f"{state.gpt_weights}|{state.sovits_weights}"
+                state.requests += 1
+                failed = random.random() < args.error_rate
+                state.errors += failed
+                state.active_requests += 1
+
+            try:
+                if failed:
+                    time.sleep(args.first_chunk_seconds)
+                    self.send_json(500, {"message": "simulated synthesis error"})
+                    return
+                pcm = synthesize(text, voice_key, args.sample_rate, args.chars_per_second)
+                if request.get("streaming_mode"):
+                    self.stream_audio(pcm, request.get("media_type", "raw"))
+                else:
+                    time.sleep(args.realtime_factor * len(pcm) / 2.0 / args.sample_rate)
+                    body = to_wav(pcm, args.sample_rate)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "audio/wav")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+            finally:
+                with state.lock:
+                    state.active_requests -= 1
+
+        def stream_audio(self, pcm: bytes, media_type: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav" if media_type == "wav" else "audio/raw")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            chunk_bytes = int(CHUNK_SECONDS * args.sample_rate) * 2
+            time.sleep(args.first_chunk_seconds)
+            if media_type == "wav":
+                # Like api_v2: a WAV header with an open-ended length, then raw frames
+                self.write_chunk(to_wav(b"", args.sample_rate))
+            for start in range(0, len(pcm), chunk_bytes):
+                time.sleep(args.realtime_factor * CHUNK_SECONDS)
+                self.write_chunk(pcm[start:start + chunk_bytes])
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return MockGPTSoVITSHandler
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stand-in for the GPT-SoVITS api_v2 server (weight switching + /tts) for local testing."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9880)
+    parser.add_argument("--sample-rate", type=int, default=32000)
+    parser.add_argument("--switch-seconds", type=float, default=2.0, help="Simulated time to load one model.")
+    parser.add_argument("--realtime-factor", type=float, default=0.3, help="Synthesis seconds per second of audio.")
+    parser.add_argument("--first-chunk-seconds", type=float, default=0.2, help="Simulated latency before streaming.")
+    parser.add_argument("--chars-per-second", type=float, default=5.0, help="Speaking rate of the generated audio.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of /tts requests answered with HTTP 500.")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Mock GPT-SoVITS server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
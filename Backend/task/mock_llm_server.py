@@ -0,0 +1,205 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_DIALOGUE = "嗯，我聽到了喔。今天也想和你多聊一會兒呢！你想先從哪裡說起？"
+
+
+class MockState:
+    """Counters of the stand-in OpenAI-compatible server."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.stream_requests = 0
+        self.errors = 0
+        self.active_requests = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "stream_requests": self.stream_requests,
+                "errors": self.errors,
+                "active_requests": self.active_requests,
+            }
+
+
+def build_reply(args: argparse.Namespace, request: dict) -> str:
+    """The character reply in the JSON shape the prompt asks for; plain text for summary requests."""
+    messages = request.get("messages") or [{}]
+    user_text = str(messages[-1].get("content", ""))
+    if "JSON object" in user_text and "ok" in user_text:
+        # Capability probe (see llm_capabilities.PROBE_PROMPT)
+        return json.dumps({"ok": True})
+    if not request.get("response_format") and "running summary" in user_text:
+        return "（摘要）我們聊了一些日常的事情。"
+    return json.dumps(
+        {
+            "internal_thought_in_character": "對方在和我說話，我要好好回應。",
+            "dialogue": args.dialogue,
+            "expression": "happy",
+            "gesture": "wave",
+        },
+        ensure_ascii=False,
+    )
+
+
+def usage_for(request: dict, completion: str) -> dict:
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages") or [])
+    prompt_tokens = max(1, prompt_chars // 2)
+    completion_tokens = max(1, len(completion) // 2)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def make_handler(state: MockState):
+    args = state.args
+
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip("/")
+            if path.endswith("/models"):
+                self.send_json(200, {"object": "list", "data": [{"id": args.model, "context_length": args.context_length}]})
+            elif path.endswith(f"/models/{args.model}"):
+                self.send_json(200, {"id": args.model, "context_length": args.context_length})
+            elif path == "/stats":
+                self.send_json(200, state.snapshot())
+            else:
+                self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not urlparse(self.path).path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "not found"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+            stream = bool(request.get("stream"))
+            with state.lock:
+                state.requests += 1
+                state.stream_requests += stream
+                failed = random.random() < args.error_rate
+                state.errors += failed
+                state.active_requests += 1
+
+            try:
+                if failed:
+                    time.sleep(args.first_token_seconds)
+                    self.send_json(500, {"error": {"message": "simulated upstream error"}})
+                    return
+                completion = build_reply(args, request)
+                if stream:
+                    include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+                    self.stream_reply(request, completion, include_usage)
+                else:
+                    time.sleep(args.first_token_seconds + len(completion) / args.chars_per_second)
+                    self.send_json(
+                        200,
+                        {
+                            "id": "chatcmpl-mock",
+                            "object": "chat.completion",
+                            "model": args.model,
+                            "choices": [
+                                {"index": 0, "message": {"role": "assistant", "content": completion}, "finish_reason": "stop"}
+                            ],
+                            "usage": usage_for(request, completion),
+                        },
+                    )
+            finally:
+                with state.lock:
+                    state.active_requests -= 1
+
+        def stream_reply(self, request: dict, completion: str, include_usage: bool) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            time.sleep(args.first_token_seconds)
+            step = max(1, args.chars_per_chunk)
+            for start in range(0, len(completion), step):
+                delta = completion[start:start + step]
+                self.write_event({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "model": args.model,
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                })
+                time.sleep(len(delta) / args.chars_per_second)
+            if include_usage:
+                self.write_event({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "model": args.model,
+                    "choices": [],
+                    "usage": usage_for(request, completion),
+                })
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_event(self, body: dict) -> None:
+            self.write_chunk(f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        def write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return MockLLMHandler
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stand-in OpenAI-compatible /v1/chat/completions server (streaming and non-streaming) for local testing."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--dialogue", default=DEFAULT_DIALOGUE, help="The character's reply to every turn.")
+    parser.add_argument("--first-token-seconds", type=float, default=0.3, help="Simulated time to first token.")
+    parser.add_argument("--chars-per-second", type=float, default=200.0, help="Generation speed of the reply text.")
+    parser.add_argument("--chars-per-chunk", type=int, default=4, help="Characters per streamed delta.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--context-length", type=int, default=32768, help="Context window reported by /models.")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1 (model={args.model})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -57,6 +57,9 @@ public class ElysiaStreamEvent
     // Used in 'chunk'
     public int seq;
     public string audio_chunk_base64;
+
+    // Used in 'text' (sentence-by-sentence LLM streaming)
+    public string dialogue_delta;
 }
 
 public class ConnectionManager : MonoBehaviour
@@ -229,10 +232,21 @@ public class ConnectionManager : MonoBehaviour
                 if (streamPlayer != null) streamPlayer.AddChunkBase64(streamEvent.audio_chunk_base64);
                 // Step 2 will go here!
             }
+            else if (streamEvent.@event == "tts_stream_text")
+            {
+                // The reply is still being generated; show the dialogue spoken so far
+                mainThreadActions.Enqueue(() => {
+                    dialogueTextUI.text = streamEvent.dialogue;
+                });
+            }
             else if (streamEvent.@event == "tts_stream_end")
             {
                 Debug.Log("[STREAM] Ended!");
                 if (streamPlayer != null) streamPlayer.StopReceiving(); 
+                mainThreadActions.Enqueue(() => {
+                    if (!string.IsNullOrEmpty(streamEvent.dialogue)) dialogueTextUI.text = streamEvent.dialogue;
+                    internalThoughtTextUI.text = streamEvent.internal_thought_in_character;
+                });
             }
             else
             {